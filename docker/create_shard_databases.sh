@@ -0,0 +1,13 @@
+#!/bin/sh
+# Create the shard databases named in the VECTOR_SHARDS example in .env-example.
+# Postgres runs this when its volume is first created. For an existing volume:
+#   docker compose exec postgres sh /docker-entrypoint-initdb.d/create_shard_databases.sh
+
+set -e
+
+for database in vectors_lords vectors_recent; do
+    if ! psql -U "$POSTGRES_USER" -d postgres -tAc "SELECT 1 FROM pg_database WHERE datname = '$database'" | grep -q 1; then
+        echo "==> Creating $database..."
+        psql -U "$POSTGRES_USER" -d postgres -c "CREATE DATABASE $database"
+    fi
+done
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -86,6 +87,48 @@ DATABASES = {
     }
 }
 
+# Optional shards for ParagraphVector, as json, e.g.
+# [{"alias": "lords", "NAME": "lords", "chamber_types": ["uk_lords"]},
+#  {"alias": "recent", "NAME": "recent", "start": "2020-01-01"}]
+# Database keys (NAME, HOST, PORT, USER, PASSWORD) override the default
+# connection. See vector_explorer/tools/sharding.py for the routing rules.
+
+VECTOR_SHARDS = json.loads(os.environ.get("VECTOR_SHARDS", "[]"))
+for shard in VECTOR_SHARDS:
+    DATABASES.setdefault(
+        shard["alias"],
+        {
+            **DATABASES["default"],
+            **{key: value for key, value in shard.items() if key.isupper()},
+        },
+    )
+
+DATABASE_ROUTERS = ["vector_explorer.tools.sharding.VectorShardRouter"]
+
+
+# Search API
+# Concurrent queries are embedded together in batches of up to
+# SEARCH_BATCH_SIZE, waiting at most SEARCH_BATCH_WAIT_MS for a batch to fill
+
+SEARCH_BATCH_SIZE = int(os.environ.get("SEARCH_BATCH_SIZE", 32))
+SEARCH_BATCH_WAIT_MS = float(os.environ.get("SEARCH_BATCH_WAIT_MS", 10))
+SEARCH_POOL_SIZE = int(os.environ.get("SEARCH_POOL_SIZE", 10))
+SEARCH_MAX_K = 200
+
+# Load the embedding model when Django starts rather than on the first search.
+# With a preforking server (e.g. gunicorn --preload) the model is loaded once
+# before the workers fork. EMBEDDING_THREADS caps the ONNX runtime threads per
+# process, so roughly cores / workers avoids oversubscribing the CPU.
+# Keep it at 1 when preloading before a fork, as runtime thread pools
+# do not survive into the child processes.
+
+EMBEDDING_PRELOAD = os.environ.get("EMBEDDING_PRELOAD", "") == "1"
+EMBEDDING_THREADS = (
+    int(os.environ["EMBEDDING_THREADS"])
+    if os.environ.get("EMBEDDING_THREADS")
+    else None
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -18,6 +18,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from vector_explorer import views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/search/", views.search, name="search"),
 ]
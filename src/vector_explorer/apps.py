@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class VectorExplorerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "vector_explorer"
+
+    def ready(self):
+        if settings.EMBEDDING_PRELOAD:
+            from .tools.inference import get_local_inference
+
+            get_local_inference().warm_up()
@@ -1,15 +1,20 @@
+from __future__ import annotations
+
 import datetime
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Sequence, Union
 
-import pandas as pd
-import sysrsync
 from pydantic import BaseModel
 from tqdm import tqdm
 
-from vector_explorer.data_models.transcripts import DailyRecord
+from vector_explorer.tools.aggregates import speech_key
 from vector_explorer.tools.inference import Inference
 from vector_explorer.tools.model_helpers import MiniEnum, StrEnum
+from vector_explorer.tools.sharding import file_day, latest_versions
+from vector_explorer.tools.sync import RSYNC_SOURCE, sync_manager, sync_managers
+
+if TYPE_CHECKING:
+    from vector_explorer.data_models.transcripts import DailyRecord
 
 data_dir = Path("data", "pwdata")
 
@@ -28,6 +33,59 @@ class ChamberType(StrEnum):
     NI_ASSEMBLY = "ni_assembly"
 
 
+def section_ids_for(
+    paragraph_ids: Sequence[str], record: Union[DailyRecord, Path]
+) -> list[str]:
+    """
+    The heading each paragraph falls under, from the transcript (or the
+    path to its xml). Empty if the xml isn't available.
+    """
+    from vector_explorer.data_models.transcripts import DailyRecord
+
+    if isinstance(record, Path):
+        if not record.exists():
+            return ["" for _ in paragraph_ids]
+        record = DailyRecord.from_path(record)
+    sections = dict(record.iter_section_ids())
+    return [sections.get(speech_key(x), "") for x in paragraph_ids]
+
+
+def redirects_for(xml_path: Path) -> list[tuple[str, str, str]]:
+    """
+    (oldgid, newgid, matchtype) for each gid redirect in a transcript,
+    read with lxml rather than parsing the whole DailyRecord.
+    """
+    from lxml import etree
+
+    if not xml_path.exists():
+        return []
+    root = etree.parse(str(xml_path)).getroot()
+    return [
+        (x.get("oldgid"), x.get("newgid"), x.get("matchtype") or "")
+        for x in root.iterchildren("gidredirect")
+    ]
+
+
+def previous_embeddings(file_path: Path) -> dict[str, list[float]]:
+    """
+    Embeddings by text from the latest earlier version of this day's file
+    (e.g. debates2023-01-10a.parquet for debates2023-01-10b.xml),
+    so a renumbered transcript doesn't need embedding again.
+    """
+    import pandas as pd
+
+    day = file_day(file_path.name)
+    earlier = [
+        x
+        for x in sorted(file_path.parent.glob(f"{day}*.parquet"))
+        if file_day(x.name) == day and x.stem < file_path.stem
+    ]
+    if not earlier:
+        return {}
+    df = pd.read_parquet(earlier[-1], columns=["text", "embedding"])
+    return dict(zip(df["text"], df["embedding"]))
+
+
 class XMLManager(BaseModel):
     label: str
     relative_path: str
@@ -37,33 +95,76 @@ class XMLManager(BaseModel):
 
     def infer_missing(self, pattern: str = "", override: bool = False):
         dest_dir = data_dir / self.relative_path
+        self.infer_files(
+            list(dest_dir.glob(f"{self.file_structure_pre_date}{pattern}*.xml")),
+            override=override,
+        )
+
+    def infer_files(self, file_paths: Sequence[Path], override: bool = False):
+        """
+        Write the embeddings parquet next to each xml file, e.g. for
+        just the files changed by a sync (with override, as an updated
+        file keeps its name).
+        """
+        import pandas as pd
+
+        from vector_explorer.data_models.transcripts import DailyRecord
+
         infer = Inference(model_id="BAAI/bge-small-en-v1.5", local=False)
 
-        for file_path in tqdm(
-            list(dest_dir.glob(f"{self.file_structure_pre_date}{pattern}*.xml")),
-            desc="Infering missing embeddings",
-        ):
+        for file_path in tqdm(file_paths, desc="Infering missing embeddings"):
             embeddings_file = file_path.with_suffix(".parquet")
             if not embeddings_file.exists() or override:
                 record = DailyRecord.from_path(file_path)
                 data = dict(record.iter_headings_and_paragraphs())
-                df = infer.query_id_and_text(data)
+                reused = previous_embeddings(file_path)
+                to_embed = {k: v for k, v in data.items() if v not in reused}
+                df = infer.query_id_and_text(to_embed)
+                if reused:
+                    embedded = dict(zip(df["text"], df["embedding"]))
+                    df = pd.DataFrame(
+                        {
+                            "id": list(data.keys()),
+                            "text": list(data.values()),
+                            "embedding": [
+                                reused.get(text, embedded.get(text))
+                                for text in data.values()
+                            ],
+                        }
+                    )
+                df["section_id"] = section_ids_for(df["id"], record)
                 df.to_parquet(embeddings_file)
 
-    def get_embeddings_n(self, pattern: str = "") -> int:
+    def get_embeddings_n(self, pattern: str = "", latest_only: bool = False) -> int:
         dest_dir = data_dir / self.relative_path
         items = list(dest_dir.glob(f"{self.file_structure_pre_date}{pattern}*.xml"))
-        return len(items)
+        return len(latest_versions(items) if latest_only else items)
+
+    def get_embeddings(
+        self, pattern: str = "", infer_missing: bool = False, latest_only: bool = False
+    ):
+        """
+        (path, df) for each embeddings file in name order. With latest_only,
+        just the last version of each day's file.
+        """
+        import pandas as pd
 
-    def get_embeddings(self, pattern: str = "", infer_missing: bool = False):
         dest_dir = data_dir / self.relative_path
         if infer_missing:
             self.infer_missing(pattern)
 
-        for file_path in dest_dir.glob(
-            f"{self.file_structure_pre_date}{pattern}*.parquet"
-        ):
+        file_paths = sorted(
+            dest_dir.glob(f"{self.file_structure_pre_date}{pattern}*.parquet")
+        )
+        if latest_only:
+            file_paths = latest_versions(file_paths)
+        for file_path in file_paths:
             df = pd.read_parquet(file_path)
+            if "section_id" not in df.columns:
+                # written before section ids were stored
+                df["section_id"] = section_ids_for(
+                    df["id"], file_path.with_suffix(".xml")
+                )
             df["transcript_type"] = self.transcript_type
             df["chamber_type"] = self.chamber_type
             yield file_path, df
@@ -75,28 +176,60 @@ class XMLManager(BaseModel):
             yield file_path
 
     def validate_year(self, year: int):
+        from vector_explorer.data_models.transcripts import DailyRecord
+
         for file_path in self.path_options(str(year)):
             print(f"Validating {file_path}")
             DailyRecord.from_path(file_path)
 
-    def download_pattern(self, pattern: str, quiet: bool = False):
+    def validate_files(
+        self, file_paths: Sequence[Path]
+    ) -> tuple[list[Path], list[tuple[Path, Exception]]]:
+        """
+        Split the files into those that parse as a DailyRecord and
+        (path, error) for those that don't, so a sync can embed the valid
+        ones and still report the rest as a failure.
+        """
+        from lxml.etree import XMLSyntaxError
+        from pydantic import ValidationError
+
+        from vector_explorer.data_models.transcripts import DailyRecord
+
+        valid = []
+        invalid = []
+        for file_path in file_paths:
+            print(f"Validating {file_path}")
+            try:
+                DailyRecord.from_path(file_path)
+            except (ValidationError, ValueError, XMLSyntaxError) as e:
+                print(f"Invalid {file_path}: {e}")
+                invalid.append((file_path, e))
+                continue
+            valid.append(file_path)
+        return valid, invalid
+
+    def download_pattern(
+        self, pattern: str, quiet: bool = False, source: str = RSYNC_SOURCE
+    ) -> list[Path]:
+        """
+        rsync the files starting with pattern, returning the xml files
+        that were new or changed.
+        """
         if not quiet:
             print(f"Downloading {self.label} for {pattern}")
-        path = f"data.theyworkforyou.com::parldata/{self.relative_path}{self.file_structure_pre_date}{pattern}*"
-        sysrsync.run(
-            source=path,
-            destination=str(data_dir),
-            sync_source_contents=False,
-            options=["-az", "--progress", "--relative"],
-            exclusions=["'.svn'", "'tmp/'"],
-        )
+        result = sync_manager(self, pattern, source=source, destination=data_dir)
+        if not result.ok:
+            raise RuntimeError(f"rsync failed for {self.label}: {result.stderr}")
+        return result.changed_paths(data_dir)
 
-    def download_year(self, year: int):
-        self.download_pattern(str(year))
+    def download_year(self, year: int) -> list[Path]:
+        return self.download_pattern(str(year))
 
     def get_date(
         self, date: datetime.date, update_download: bool = False
     ) -> Optional[DailyRecord]:
+        from vector_explorer.data_models.transcripts import DailyRecord
+
         iso_date = date.isoformat()
         if update_download:
             self.download_pattern(iso_date)
@@ -156,10 +289,29 @@ class TranscriptXMl(MiniEnum[XMLManager]):
                 yield option
 
     @classmethod
-    def download_all_debates(cls, year: int):
-        for chamber in cls.options():
-            chamber.download_year(year)
-            chamber.validate_year(year)
+    def download_all_debates(cls, year: int, workers: int = 3) -> list[Path]:
+        """
+        Sync every chamber's files for the year at once, and validate
+        just the files that changed. Raises if any of them are invalid.
+        """
+        changed = []
+        invalid = []
+        for result in sync_managers(
+            cls.options(), str(year), destination=data_dir, workers=workers
+        ):
+            if not result.ok:
+                print(f"rsync failed for {result.manager.label}: {result.stderr}")
+                continue
+            valid, errors = result.manager.validate_files(
+                result.changed_paths(data_dir)
+            )
+            changed += valid
+            invalid += errors
+        if invalid:
+            raise ValueError(
+                "Invalid files: " + ", ".join(str(path) for path, _ in invalid)
+            )
+        return changed
 
 
 if __name__ == "__main__":
@@ -210,3 +210,14 @@ class DailyRecord(BaseXMLModel, tag="publicwhip"):
                     )
             else:
                 yield speech.id, speech.as_str()
+
+    def iter_section_ids(self) -> Iterator[tuple[str, str]]:
+        """
+        (item id, section id) for each item with text, where the section
+        is the most recent major, minor or oral heading (or "" before the first).
+        """
+        section_id = ""
+        for item in self.iter_has_text():
+            if isinstance(item, (MajorHeading, MinorHeading, OralHeading)):
+                section_id = item.id
+            yield item.id, section_id
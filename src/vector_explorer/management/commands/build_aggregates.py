@@ -0,0 +1,99 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tqdm import tqdm
+from vector_explorer.data_manager import data_dir, section_ids_for
+from vector_explorer.models import AggregateVector, ParagraphVector
+from vector_explorer.tools.sharding import shard_aliases
+
+
+def fill_section_ids(source_file: str, xml_path: Path, using: str) -> int:
+    """
+    Set section_id on the paragraphs of one source file from its xml.
+    """
+    rows = list(
+        ParagraphVector.objects.using(using)
+        .filter(source_file=source_file)
+        .values_list("id", "speech_id")
+    )
+    section_ids = section_ids_for([speech_id for _, speech_id in rows], xml_path)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {ParagraphVector._meta.db_table} p SET section_id = s.section_id
+            FROM unnest(%s::bigint[], %s::text[]) AS s(id, section_id)
+            WHERE p.id = s.id
+            """,
+            [[id for id, _ in rows], section_ids],
+        )
+        return cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = "Build speech and section aggregate vectors from stored paragraph embeddings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sections_from_xml",
+            action="store_true",
+            help="First fill in missing paragraph section ids from the transcript xml",
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Rebuild every source file, not just those without aggregates",
+        )
+
+    def handle(self, *, sections_from_xml: bool, refresh: bool, **kwargs):
+        xml_paths = (
+            {path.name: path for path in data_dir.rglob("*.xml")}
+            if sections_from_xml
+            else {}
+        )
+        for alias in shard_aliases():
+            paragraphs = ParagraphVector.objects.using(alias)
+            if sections_from_xml:
+                missing = set(
+                    paragraphs.filter(section_id="")
+                    .values_list("source_file", flat=True)
+                    .distinct()
+                )
+                for source_file in tqdm(missing, desc=f"Section ids ({alias})"):
+                    xml_path = xml_paths.get(Path(source_file).with_suffix(".xml").name)
+                    if xml_path is None:
+                        tqdm.write(f"No xml found for {source_file}")
+                        continue
+                    fill_section_ids(source_file, xml_path, alias)
+
+            source_files = set(
+                paragraphs.values_list("source_file", flat=True).distinct()
+            )
+            if not refresh:
+                source_files -= set(
+                    AggregateVector.objects.using(alias)
+                    .values_list("source_file", flat=True)
+                    .distinct()
+                )
+            created = 0
+            for source_file in tqdm(sorted(source_files), desc=f"Aggregates ({alias})"):
+                rows = list(
+                    paragraphs.filter(source_file=source_file)
+                    .select_related("canonical")
+                    .order_by("id")
+                    .only(
+                        "speech_id",
+                        "section_id",
+                        "transcript_type",
+                        "chamber_type",
+                        "canonical__embedding",
+                    )
+                )
+                created += AggregateVector.replace_for_source(
+                    source_file,
+                    rows,
+                    [x.canonical.embedding for x in rows],
+                    using=alias,
+                )
+            print(f"{alias}: {created} aggregates for {len(source_files)} source files")
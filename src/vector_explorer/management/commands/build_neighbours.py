@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Type
+
+from django.core.management.base import BaseCommand
+from django.db import connections, models
+
+from tqdm import tqdm
+from vector_explorer.models import (
+    NEIGHBOURS_K,
+    CanonicalText,
+    NgramNeighbours,
+    NgramVector,
+    ParagraphNeighbours,
+    ParagraphVector,
+    set_hnsw_ef_search,
+)
+from vector_explorer.tools.sharding import DEFAULT_ALIAS, shard_aliases
+
+MODELS: dict[str, tuple[Type[models.Model], Type[models.Model]]] = {
+    "paragraph": (ParagraphVector, ParagraphNeighbours),
+    "ngram": (NgramVector, NgramNeighbours),
+}
+
+# nearest k other rows for each row in the batch, found through the HNSW index
+NEIGHBOURS_SQL = """
+    INSERT INTO {neighbour_table} (source_id, neighbour_ids, distances)
+    SELECT
+        source.id,
+        array_agg(nearest.id ORDER BY nearest.distance, nearest.id),
+        array_agg(nearest.distance ORDER BY nearest.distance, nearest.id)
+    FROM {table} source
+    CROSS JOIN LATERAL (
+        SELECT other.id, other.embedding <=> source.embedding AS distance
+        FROM {table} other
+        WHERE other.id <> source.id
+        ORDER BY other.embedding <=> source.embedding
+        LIMIT %s
+    ) nearest
+    WHERE source.id = ANY(%s)
+    GROUP BY source.id
+    ON CONFLICT (source_id) DO UPDATE
+    SET neighbour_ids = excluded.neighbour_ids, distances = excluded.distances
+"""
+
+# paragraphs share one embedding per distinct text, so the nearest texts are
+# found through the canonical index and expanded to the paragraphs using them
+PARAGRAPH_NEIGHBOURS_SQL = """
+    INSERT INTO {neighbour_table} (source_id, neighbour_ids, distances)
+    SELECT
+        source.id,
+        array_agg(nearest.id ORDER BY nearest.distance, nearest.id),
+        array_agg(nearest.distance ORDER BY nearest.distance, nearest.id)
+    FROM {table} source
+    JOIN {canonical_table} source_text ON source_text.id = source.canonical_id
+    CROSS JOIN LATERAL (
+        SELECT other.id, nearest_text.distance
+        FROM (
+            SELECT candidate.id, candidate.embedding <=> source_text.embedding AS distance
+            FROM {canonical_table} candidate
+            ORDER BY candidate.embedding <=> source_text.embedding
+            LIMIT %s + 1
+        ) nearest_text
+        JOIN {table} other ON other.canonical_id = nearest_text.id
+        WHERE other.id <> source.id
+        ORDER BY nearest_text.distance, other.id
+        LIMIT %s
+    ) nearest
+    WHERE source.id = ANY(%s)
+    GROUP BY source.id
+    ON CONFLICT (source_id) DO UPDATE
+    SET neighbour_ids = excluded.neighbour_ids, distances = excluded.distances
+"""
+
+
+def batches(ids: list[int], batch_size: int):
+    for start in range(0, len(ids), batch_size):
+        yield ids[start : start + batch_size]
+
+
+class Command(BaseCommand):
+    help = "Precompute the k nearest neighbours of each row for similar_to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            type=str,
+            choices=list(MODELS),
+            default="paragraph",
+            help="Which vector table to use",
+        )
+        parser.add_argument(
+            "--k", type=int, default=NEIGHBOURS_K, help="Neighbours per row"
+        )
+        parser.add_argument(
+            "--batch_size", type=int, default=500, help="Rows per query"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Batches run at the same time"
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Recompute every row, not just those without neighbours yet",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default=None,
+            help="Only this database (shard) alias, default every alias holding the model",
+        )
+
+    def handle(
+        self,
+        *,
+        model: str,
+        k: int,
+        batch_size: int,
+        workers: int,
+        refresh: bool,
+        database: Optional[str],
+        **kwargs,
+    ):
+        model_class, neighbour_class = MODELS[model]
+        if database:
+            aliases = [database]
+        elif getattr(model_class, "sharded", False):
+            aliases = shard_aliases()
+        else:
+            aliases = [DEFAULT_ALIAS]
+        # neighbours are found within each shard
+        for alias in aliases:
+            self.build(
+                model_class, neighbour_class, k, batch_size, workers, refresh, alias
+            )
+
+    def build(
+        self,
+        model_class: Type[models.Model],
+        neighbour_class: Type[models.Model],
+        k: int,
+        batch_size: int,
+        workers: int,
+        refresh: bool,
+        database: str,
+    ):
+        qs = model_class.objects.using(database)
+        if not refresh:
+            # incremental - only rows added since the last run
+            qs = qs.filter(neighbours__isnull=True)
+        ids = list(qs.order_by("id").values_list("id", flat=True))
+        print(
+            f"Finding {k} neighbours for {len(ids)} {model_class.__name__} rows on {database}"
+        )
+
+        if model_class is ParagraphVector:
+            sql = PARAGRAPH_NEIGHBOURS_SQL.format(
+                neighbour_table=neighbour_class._meta.db_table,
+                table=model_class._meta.db_table,
+                canonical_table=CanonicalText._meta.db_table,
+            )
+            params = [k, k]
+        else:
+            sql = NEIGHBOURS_SQL.format(
+                neighbour_table=neighbour_class._meta.db_table,
+                table=model_class._meta.db_table,
+            )
+            params = [k]
+
+        def run_batch(batch: list[int]) -> int:
+            # each worker thread has its own connection
+            try:
+                set_hnsw_ef_search(max(40, k + 1), using=database)
+                with connections[database].cursor() as cursor:
+                    cursor.execute(sql, [*params, batch])
+                return len(batch)
+            finally:
+                connections[database].close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(
+            total=len(ids)
+        ) as progress:
+            for done in pool.map(run_batch, batches(ids, batch_size)):
+                progress.update(done)
@@ -0,0 +1,131 @@
+import shutil
+from pathlib import Path
+from typing import Iterator
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tqdm import tqdm
+from vector_explorer.models import ParagraphVector
+from vector_explorer.tools.ngrams import (
+    count_ngrams_parallel,
+    ensure_tokenizer,
+    merge_runs,
+)
+from vector_explorer.tools.sharding import shard_aliases
+
+ngram_dir = Path("data", "ngram")
+
+
+def iter_text_chunks(batch_size: int, chunk_size: int) -> Iterator[list[str]]:
+    """
+    Paragraph texts from every shard in chunks, paged by id rather
+    than OFFSET so each page costs the same.
+    """
+    aliases = shard_aliases()
+    progress = tqdm(
+        total=sum(ParagraphVector.objects.using(x).count() for x in aliases),
+        desc="Paragraphs",
+    )
+    for alias in aliases:
+        last_id = 0
+        while True:
+            rows = list(
+                ParagraphVector.objects.using(alias)
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "text")[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            texts = [text for _, text in rows]
+            for start in range(0, len(texts), chunk_size):
+                yield texts[start : start + chunk_size]
+            progress.update(len(rows))
+    progress.close()
+
+
+class Command(BaseCommand):
+    help = "Count 2-5 word n-grams across all paragraphs into one parquet file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=str(ngram_dir / "ngrams.parquet"),
+            help="Parquet file to write ngram and count to",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Tokenizing processes"
+        )
+        parser.add_argument(
+            "--memory_mb",
+            type=int,
+            default=1024,
+            help="Memory per worker before its counts are spilled to disk",
+        )
+        parser.add_argument(
+            "--batch_size", type=int, default=10000, help="Paragraphs read per query"
+        )
+        parser.add_argument(
+            "--chunk_size", type=int, default=1000, help="Paragraphs per worker task"
+        )
+        parser.add_argument("--min_n", type=int, default=2, help="Shortest n-gram")
+        parser.add_argument("--max_n", type=int, default=5, help="Longest n-gram")
+        parser.add_argument(
+            "--min_count",
+            type=int,
+            default=1,
+            help="Leave out n-grams seen fewer times than this",
+        )
+        parser.add_argument(
+            "--keep_runs",
+            action="store_true",
+            help="Keep the spilled runs after merging",
+        )
+
+    def handle(
+        self,
+        *,
+        output: str,
+        workers: int,
+        memory_mb: int,
+        batch_size: int,
+        chunk_size: int,
+        min_n: int,
+        max_n: int,
+        min_count: int,
+        keep_runs: bool,
+        **kwargs,
+    ):
+        output_path = Path(output)
+        spill_dir = output_path.parent / f"{output_path.stem}_runs"
+        if spill_dir.exists():
+            shutil.rmtree(spill_dir)
+
+        ensure_tokenizer()
+        # worker processes shouldn't inherit an open database connection
+        connections.close_all()
+        runs = count_ngrams_parallel(
+            iter_text_chunks(batch_size, chunk_size),
+            spill_dir,
+            workers=workers,
+            memory_mb=memory_mb,
+            min_n=min_n,
+            max_n=max_n,
+        )
+        print(f"Merging {len(runs)} runs")
+        if not runs:
+            print("No paragraphs to count")
+            return
+        rows = merge_runs(
+            runs,
+            output_path,
+            min_count=min_count,
+            memory_limit=f"{max(256, memory_mb * workers)}MB",
+            temp_directory=spill_dir / "duckdb",
+        )
+        print(f"Wrote {rows} n-grams to {output_path}")
+        if not keep_runs:
+            shutil.rmtree(spill_dir)
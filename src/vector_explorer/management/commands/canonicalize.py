@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from rich.console import Console
+from rich.table import Table
+from vector_explorer.models import (
+    CanonicalText,
+    ParagraphVector,
+    bump_search_generation,
+)
+from vector_explorer.tools.index_maintenance import IndexSpec
+from vector_explorer.tools.sharding import shard_aliases
+
+paragraph_table = ParagraphVector._meta.db_table
+canonical_table = CanonicalText._meta.db_table
+
+
+def drop_index(using: str = "default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS canonical_nhsw_index;")
+
+
+def build_index(using: str = "default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(IndexSpec.from_model(CanonicalText).create_sql())
+
+
+def table_sizes(using: str = "default") -> Table:
+    table = Table(title=f"Storage ({using})")
+    for column in ["table", "rows", "table MB", "indexes MB"]:
+        table.add_column(column, justify="right")
+    with connections[using].cursor() as cursor:
+        for name in [paragraph_table, canonical_table]:
+            cursor.execute(
+                f"SELECT count(*), pg_table_size(%s), pg_indexes_size(%s) FROM {name}",
+                [name, name],
+            )
+            rows, table_bytes, index_bytes = cursor.fetchone()
+            table.add_row(
+                name,
+                str(rows),
+                f"{table_bytes / 1024**2:.1f}",
+                f"{index_bytes / 1024**2:.1f}",
+            )
+    return table
+
+
+class Command(BaseCommand):
+    help = "Report the storage of canonical texts and their paragraphs, pruning unused texts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete canonical texts no paragraph refers to any more",
+        )
+        parser.add_argument(
+            "--recreate_indexes",
+            action="store_true",
+            help="Drop the canonical index during the prune and rebuild it after",
+        )
+
+    def handle(self, *, prune: bool, recreate_indexes: bool, **kwargs):
+        # canonical texts are stored on the same shard as their paragraphs
+        for alias in shard_aliases():
+            if recreate_indexes:
+                print(f"dropping canonical index on {alias}")
+                drop_index(alias)
+
+            if prune:
+                # ingest prunes the texts of the rows it replaces, so these
+                # are only left by rows deleted some other way
+                pruned = CanonicalText.prune(using=alias)
+                print(f"{alias}: pruned {pruned} unused canonical texts")
+
+            if recreate_indexes:
+                print(f"recreating canonical index on {alias}")
+                build_index(alias)
+
+            Console().print(table_sizes(alias))
+        bump_search_generation(CanonicalText)
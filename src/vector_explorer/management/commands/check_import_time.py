@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rich.console import Console
+from rich.table import Table
+
+# modules that should only be loaded when a search, dataframe or
+# embedding actually needs them
+LAZY_MODULES = ["pandas", "pyarrow", "fastembed", "onnxruntime", "requests"]
+
+# time a cold django setup and import of the models in a fresh interpreter
+# and list which of the lazy modules ended up imported anyway
+IMPORT_SCRIPT = f"""
+import sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import vector_explorer.models
+print(time.perf_counter() - start)
+print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int]]:
+    """
+    Top level modules and their cumulative import time in microseconds,
+    from the output of python -X importtime.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # nested imports are indented by two spaces per level
+        top_level = not name.startswith("  ")
+        if top_level and cumulative.strip().isdigit():
+            imports.append((name.strip(), int(cumulative)))
+    return imports
+
+
+class Command(BaseCommand):
+    help = "Check the cold import time of vector_explorer.models against a budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget_ms",
+            type=float,
+            default=1000,
+            help="Fail if django setup and the models import take longer than this",
+        )
+        parser.add_argument(
+            "--top", type=int, default=10, help="Number of slowest imports to show"
+        )
+
+    def handle(self, *, budget_ms: float, top: int, **kwargs):
+        env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+        env.setdefault("DJANGO_SETTINGS_MODULE", "twfy_vector_explorer.settings")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.splitlines()[-1])
+
+        seconds, loaded = result.stdout.splitlines()[-2:]
+        elapsed_ms = float(seconds) * 1000
+
+        imports = sorted(parse_importtime(result.stderr), key=lambda x: -x[1])
+        table = Table(title=f"Slowest top level imports - total {elapsed_ms:.0f} ms")
+        table.add_column("module")
+        table.add_column("ms", justify="right")
+        for name, microseconds in imports[:top]:
+            table.add_row(name, f"{microseconds / 1000:.1f}")
+        Console().print(table)
+
+        if loaded:
+            raise CommandError(
+                f"Modules imported at startup that should be lazy: {loaded}"
+            )
+        if elapsed_ms > budget_ms:
+            raise CommandError(
+                f"Import took {elapsed_ms:.0f} ms, over the {budget_ms:.0f} ms budget"
+            )
+        print(f"Import took {elapsed_ms:.0f} ms, within the {budget_ms:.0f} ms budget")
@@ -0,0 +1,132 @@
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+from vector_explorer.models import SHARD_SEARCH_METHODS, ParagraphVector
+from vector_explorer.tools.sharding import shard_aliases, shard_for
+
+
+def misrouted_rows(alias: str) -> int:
+    """
+    Paragraphs stored on alias that the routing rules would put elsewhere.
+    """
+    files = (
+        ParagraphVector.objects.using(alias)
+        .values("chamber_type", "source_file")
+        .annotate(rows=Count("id"))
+    )
+    return sum(
+        x["rows"]
+        for x in files
+        if shard_for(x["chamber_type"], x["source_file"]) != alias
+    )
+
+
+def sample_embedding(aliases: list[str]):
+    for alias in aliases:
+        embedding = (
+            ParagraphVector.objects.using(alias)
+            .order_by("?")
+            .values_list(ParagraphVector.embedding_field, flat=True)
+            .first()
+        )
+        if embedding is not None:
+            return embedding
+    return None
+
+
+class Command(BaseCommand):
+    help = "Check rows are on the shard they route to, and search_shards matches searching each shard in turn"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--query",
+            type=str,
+            default=None,
+            help="Search term to compare, default the embedding of a random paragraph",
+        )
+        parser.add_argument(
+            "--method",
+            type=str,
+            choices=SHARD_SEARCH_METHODS,
+            default="search_distance",
+            help="Search method to compare",
+        )
+        parser.add_argument("--k", type=int, default=10, help="Results to compare")
+        parser.add_argument(
+            "--threshold", type=float, default=2.0, help="Distance threshold"
+        )
+
+    def handle(
+        self,
+        *,
+        query: Optional[str],
+        method: str,
+        k: int,
+        threshold: float,
+        **kwargs,
+    ):
+        aliases = shard_aliases()
+        table = Table(title="Shards")
+        for column in ["alias", "database", "paragraphs", "misrouted"]:
+            table.add_column(column, justify="right")
+
+        problems = []
+        for alias in aliases:
+            rows = ParagraphVector.objects.using(alias).count()
+            misrouted = misrouted_rows(alias)
+            if misrouted:
+                problems.append(f"{misrouted} paragraphs on {alias} route elsewhere")
+            table.add_row(
+                alias,
+                str(connections[alias].settings_dict["NAME"]),
+                str(rows),
+                str(misrouted),
+            )
+        Console().print(table)
+
+        search_term = query if query is not None else sample_embedding(aliases)
+        if search_term is None:
+            raise CommandError("No paragraphs to search, ingest some first")
+        if method == "hybrid_search" and not isinstance(search_term, str):
+            raise CommandError("hybrid_search needs --query")
+
+        merged = ParagraphVector.objects.search_shards(
+            search_term, "id", threshold=threshold, k=k, method=method
+        )
+        # the same search run on each shard in turn, merged here
+        order_by = "rrf_score" if method == "hybrid_search" else "distance"
+        options = (
+            {"k": k} if method == "hybrid_search" else {"k": k, "threshold": threshold}
+        )
+        frames = [
+            getattr(ParagraphVector.objects.using(alias), method)(
+                search_term, **options
+            )
+            .df("id", order_by)
+            .assign(shard=alias)
+            for alias in aliases
+        ]
+        expected = (
+            pd.concat([x for x in frames if len(x)] or frames[:1], ignore_index=True)
+            .sort_values(order_by, ascending=order_by == "distance", kind="stable")
+            .head(k)
+        )
+        found = list(zip(merged["shard"], merged["id"]))
+        wanted = list(zip(expected["shard"], expected["id"]))
+        print(
+            f"search_shards ({method}) returned {len(found)} rows from {sorted(set(merged['shard']))}"
+        )
+        if found != wanted:
+            problems.append(
+                f"search_shards returned {found}, searching each shard gave {wanted}"
+            )
+
+        if problems:
+            raise CommandError("\n".join(problems))
+        print("Shards OK")
@@ -0,0 +1,108 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vector_explorer.tools.benchmark import timed
+from vector_explorer.tools.related_ngrams import (
+    embed_queries,
+    filter_related_batch,
+    nearest_ngrams,
+    search_matches,
+)
+
+data_dir = Path("data")
+
+
+class Command(BaseCommand):
+    help = "Find related n-grams for a list of queries, writing search_matches json and csv"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input",
+            type=str,
+            nargs="?",
+            default=str(data_dir / "sample_queries.csv"),
+            help="csv with a queries column",
+        )
+        parser.add_argument(
+            "--column", type=str, default="queries", help="Column holding the queries"
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=str(data_dir / "search_matches"),
+            help="Output path without extension, .json and .csv are written",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.15, help="Maximum cosine distance"
+        )
+        parser.add_argument(
+            "--limit", type=int, default=10, help="Related n-grams kept per query"
+        )
+        parser.add_argument(
+            "--candidates",
+            type=int,
+            default=100,
+            help="Nearest n-grams fetched per query before filtering",
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=256,
+            help="Queries per embedding and SQL batch",
+        )
+
+    def handle(
+        self,
+        *,
+        input: str,
+        column: str,
+        output: str,
+        threshold: float,
+        limit: int,
+        candidates: int,
+        batch_size: int,
+        **kwargs,
+    ):
+        import pandas as pd
+
+        queries_df = pd.read_csv(input)
+        if column not in queries_df.columns:
+            raise CommandError(f"No {column} column in {input}")
+        queries = list(dict.fromkeys(x for x in queries_df[column].dropna() if x))
+
+        embeddings, embed_seconds = timed(
+            lambda: embed_queries(queries, batch_size=batch_size)
+        )
+        nearest, search_seconds = timed(
+            lambda: nearest_ngrams(
+                queries,
+                embeddings,
+                threshold=threshold,
+                candidates=candidates,
+                batch_size=batch_size,
+            )
+        )
+        df, filter_seconds = timed(lambda: filter_related_batch(nearest, limit=limit))
+
+        output_path = Path(output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.with_suffix(".json").write_text(
+            json.dumps(search_matches(df), indent=2, default=float)
+        )
+        df.to_csv(output_path.with_suffix(".csv"), index=False)
+
+        total = embed_seconds + search_seconds + filter_seconds
+        print(
+            f"{len(queries)} queries, {df['query'].nunique()} with matches, "
+            f"{len(df)} related n-grams"
+        )
+        for label, seconds in [
+            ("embed", embed_seconds),
+            ("search", search_seconds),
+            ("filter", filter_seconds),
+        ]:
+            print(f"{label:>8}: {seconds:.2f}s")
+        print(f"{len(queries) / total:.1f} queries per second")
+        print(f"Written to {output_path.with_suffix('.json')} and .csv")
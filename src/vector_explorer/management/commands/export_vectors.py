@@ -0,0 +1,77 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from vector_explorer.tools.snapshot import (
+    TransferStats,
+    export_table,
+    snapshot_models,
+    write_manifest,
+)
+
+
+class Command(BaseCommand):
+    help = "Export the vector tables to a snapshot directory for import_vectors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", type=str, help="Snapshot directory")
+        parser.add_argument(
+            "--format",
+            type=str,
+            choices=["parquet", "copy"],
+            default="parquet",
+            help="zstd parquet, or postgres binary COPY files (larger, faster to load)",
+        )
+        parser.add_argument(
+            "--models",
+            type=str,
+            nargs="+",
+            choices=list(snapshot_models()),
+            default=list(snapshot_models()),
+            help="Tables to export (default all)",
+        )
+        parser.add_argument(
+            "--chunk_rows", type=int, default=50000, help="Ids per file"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Files written at the same time"
+        )
+        parser.add_argument(
+            "--compression", type=str, default="zstd", help="Parquet compression"
+        )
+
+    def handle(
+        self,
+        *,
+        output: str,
+        format: str,
+        models: list[str],
+        chunk_rows: int,
+        workers: int,
+        compression: str,
+        **kwargs,
+    ):
+        output_dir = Path(output)
+        entries = []
+        results = []
+        start_time = time.perf_counter()
+        for name, (model, aliases) in snapshot_models().items():
+            if name not in models:
+                continue
+            for alias in aliases:
+                entry, stats = export_table(
+                    model,
+                    output_dir,
+                    format=format,  # type: ignore
+                    using=alias,
+                    chunk_rows=chunk_rows,
+                    workers=workers,
+                    compression=compression,
+                )
+                print(f"Exported {entry['table']} ({alias}): {stats}")
+                entries.append(entry)
+                results.append(stats)
+        write_manifest(output_dir, format, entries)  # type: ignore
+        total = TransferStats.combine(results, time.perf_counter() - start_time)
+        print(f"Total: {total}")
@@ -0,0 +1,58 @@
+from pathlib import Path
+from typing import Optional
+
+from django.core.management.base import BaseCommand
+
+from tqdm import tqdm
+from vector_explorer.data_manager import TranscriptType, TranscriptXMl
+from vector_explorer.tools.sharding import latest_versions
+from vector_explorer.tools.votes import division_tables, votes_dir, write_vote_tables
+
+
+class Command(BaseCommand):
+    help = "Extract divisions and member votes from transcript xml into partitioned parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "years", type=int, nargs="+", help="Years to extract, e.g. 2022 2023"
+        )
+        parser.add_argument(
+            "--chamber_type",
+            type=str,
+            default=None,
+            help="Only this chamber (default all)",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=str(votes_dir),
+            help="Directory for the divisions and votes datasets",
+        )
+
+    def handle(
+        self,
+        *,
+        years: list[int],
+        chamber_type: Optional[str],
+        output: str,
+        **kwargs,
+    ):
+        managers = TranscriptXMl.get_transcript_manager(
+            chamber=chamber_type, transcript=TranscriptType.DEBATES
+        )
+        for manager in managers:
+            for year in tqdm(years, desc=manager.label):
+                xml_paths = latest_versions(
+                    x for x in manager.path_options(str(year)) if x.suffix == ".xml"
+                )
+                tables = division_tables(xml_paths, str(manager.chamber_type))
+                if tables is None:
+                    continue
+                # one set of files per chamber and year, replaced on re-runs
+                write_vote_tables(
+                    tables, label=f"{manager.label}-{year}", output_dir=Path(output)
+                )
+                tqdm.write(
+                    f"{manager.label} {year}: {tables.divisions.num_rows} divisions, "
+                    f"{tables.votes.num_rows} votes from {len(xml_paths)} files"
+                )
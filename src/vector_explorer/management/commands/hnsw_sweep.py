@@ -0,0 +1,220 @@
+import datetime
+import json
+from pathlib import Path
+from typing import Optional
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from rich.console import Console
+from rich.table import Table
+from vector_explorer.models import (
+    HNSW_EF_CONSTRUCTION,
+    HNSW_M,
+    CanonicalText,
+    NgramVector,
+    ParagraphVector,
+    set_hnsw_ef_search,
+    vector_literal,
+)
+from vector_explorer.tools.benchmark import (
+    build_sample_index,
+    check_index_used,
+    create_sample_table,
+    drop_sample_table,
+    exact_top_k,
+    index_scan_ids,
+    latency_summary,
+    query_plan,
+    recall_at_k,
+    sample_embeddings,
+    timed,
+)
+
+MODELS = {
+    "paragraph": ParagraphVector,
+    "ngram": NgramVector,
+    "canonical": CanonicalText,
+}
+
+sweep_table = "hnsw_sweep_sample"
+report_dir = Path("data", "benchmarks")
+nearest_sql = f"SELECT id FROM {sweep_table} ORDER BY embedding <=> %s::vector LIMIT %s"
+
+
+class Command(BaseCommand):
+    help = "Sweep HNSW m, ef_construction and ef_search over a sample, reporting recall and latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            type=str,
+            choices=list(MODELS),
+            default="paragraph",
+            help="Which vector table to sample",
+        )
+        parser.add_argument(
+            "--sample", type=int, default=10000, help="Rows to index in the sweep"
+        )
+        parser.add_argument(
+            "--queries",
+            type=int,
+            default=100,
+            help="Held out rows whose embeddings are used as queries",
+        )
+        parser.add_argument("--k", type=int, default=10, help="Results per query")
+        parser.add_argument(
+            "--m",
+            type=int,
+            nargs="+",
+            default=[8, HNSW_M, 32],
+            help="m values to build",
+        )
+        parser.add_argument(
+            "--ef_construction",
+            type=int,
+            nargs="+",
+            default=[32, HNSW_EF_CONSTRUCTION, 128],
+            help="ef_construction values to build",
+        )
+        parser.add_argument(
+            "--ef_search",
+            type=int,
+            nargs="+",
+            default=[10, 20, 40, 80, 160],
+            help="ef_search values to query each index with",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=None,
+            help="Where to write the json report (default data/benchmarks/)",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default="default",
+            help="Database (shard) alias to sample and build the sweep index on",
+        )
+
+    def handle(
+        self,
+        *,
+        model: str,
+        sample: int,
+        queries: int,
+        k: int,
+        m: list[int],
+        ef_construction: list[int],
+        ef_search: list[int],
+        output: Optional[str],
+        database: str,
+        **kwargs,
+    ):
+        ids, embeddings = sample_embeddings(MODELS[model], sample + queries, database)
+        query_embeddings = embeddings[:queries]
+        ids, embeddings = ids[queries:], embeddings[queries:]
+
+        # exact ground truth by brute force over the sample
+        truth = exact_top_k(ids, embeddings, query_embeddings, k)
+        create_sample_table(sweep_table, ids, {"embedding": embeddings}, database)
+
+        table = Table(
+            title=f"{model} recall@{k} over {len(ids)} rows, {len(query_embeddings)} queries"
+        )
+        for column in [
+            "m",
+            "ef_construction",
+            "ef_search",
+            f"recall@{k}",
+            "p50 ms",
+            "p95 ms",
+            "index MB",
+            "build s",
+        ]:
+            table.add_column(column, justify="right")
+
+        results = []
+        for m_value in m:
+            for ef_construction_value in ef_construction:
+                build_seconds, index_mb = build_sample_index(
+                    sweep_table,
+                    "embedding",
+                    database,
+                    m=m_value,
+                    ef_construction=ef_construction_value,
+                )
+                # ef_search below k can't return k results
+                for ef in [x for x in ef_search if x >= k]:
+                    set_hnsw_ef_search(ef, using=database)
+                    check_index_used(
+                        query_plan(
+                            nearest_sql,
+                            [vector_literal(query_embeddings[0]), k],
+                            database,
+                        ),
+                        f"{sweep_table}_index",
+                    )
+                    found = []
+                    times = []
+                    for embedding in query_embeddings:
+                        result, seconds = timed(
+                            lambda: index_scan_ids(
+                                nearest_sql, [vector_literal(embedding), k], database
+                            )
+                        )
+                        found.append(result)
+                        times.append(seconds)
+                    summary = latency_summary(times)
+                    results.append(
+                        {
+                            "m": m_value,
+                            "ef_construction": ef_construction_value,
+                            "ef_search": ef,
+                            "recall": recall_at_k(truth, found),
+                            **summary,
+                            "index_mb": index_mb,
+                            "build_seconds": build_seconds,
+                        }
+                    )
+                    table.add_row(
+                        str(m_value),
+                        str(ef_construction_value),
+                        str(ef),
+                        f"{results[-1]['recall']:.3f}",
+                        f"{summary['p50_ms']:.2f}",
+                        f"{summary['p95_ms']:.2f}",
+                        f"{index_mb:.1f}",
+                        f"{build_seconds:.1f}",
+                    )
+
+        drop_sample_table(sweep_table, database)
+        with connections[database].cursor() as cursor:
+            cursor.execute(
+                "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+            )
+            pgvector_version = cursor.fetchone()[0]
+
+        Console().print(table)
+
+        created = datetime.datetime.now(datetime.timezone.utc)
+        report = {
+            "created": created.isoformat(),
+            "model": model,
+            "database": database,
+            "pgvector": pgvector_version,
+            "rows": len(ids),
+            "queries": len(query_embeddings),
+            "k": k,
+            "current": {"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION},
+            "results": results,
+        }
+        if output:
+            report_path = Path(output)
+        else:
+            report_path = (
+                report_dir / f"hnsw_sweep_{model}_{created:%Y%m%dT%H%M%S}.json"
+            )
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report_path.write_text(json.dumps(report, indent=2))
+        print(f"Report written to {report_path}")
@@ -0,0 +1,80 @@
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from vector_explorer.models import bump_search_generation
+from vector_explorer.tools.snapshot import (
+    TransferStats,
+    import_table,
+    read_manifest,
+    snapshot_models,
+)
+
+
+class Command(BaseCommand):
+    help = "Load a snapshot written by export_vectors into empty tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("snapshot", type=str, help="Snapshot directory")
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Files loaded at the same time"
+        )
+        parser.add_argument(
+            "--maintenance_work_mem",
+            type=str,
+            default=None,
+            help="Session maintenance_work_mem for the index builds, e.g. 8GB",
+        )
+        parser.add_argument(
+            "--parallel_workers",
+            type=int,
+            default=None,
+            help="Session max_parallel_maintenance_workers for the index builds",
+        )
+
+    def handle(
+        self,
+        *,
+        snapshot: str,
+        workers: int,
+        maintenance_work_mem: Optional[str],
+        parallel_workers: Optional[int],
+        **kwargs,
+    ):
+        snapshot_dir = Path(snapshot)
+        if not (snapshot_dir / "manifest.json").exists():
+            raise CommandError(f"No manifest.json in {snapshot_dir}")
+        manifest = read_manifest(snapshot_dir)
+        models = {
+            model._meta.db_table: model for model, _ in snapshot_models().values()
+        }
+
+        results = []
+        start_time = time.perf_counter()
+        for entry in manifest["tables"]:
+            if entry["alias"] not in connections:
+                raise CommandError(
+                    f"{entry['table']} was exported from {entry['alias']}, "
+                    "which isn't a configured database"
+                )
+            model = models[entry["table"]]
+            try:
+                stats = import_table(
+                    model,
+                    snapshot_dir,
+                    entry,
+                    workers=workers,
+                    maintenance_work_mem=maintenance_work_mem,
+                    parallel_workers=parallel_workers,
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            if stats.rows != entry["rows"]:
+                print(f"Expected {entry['rows']} rows in {entry['table']}")
+            bump_search_generation(model)
+            results.append(stats)
+        total = TransferStats.combine(results, time.perf_counter() - start_time)
+        print(f"Total (including index builds): {total}")
@@ -1,42 +1,49 @@
 # Create a new file named `import_transcripts.py` in your Django app's `management/commands` directory.
 
+from pathlib import Path
 from typing import Optional
 
 from django.core.management.base import BaseCommand
-from django.db import connection
+from django.db import connections
 
 from tqdm import tqdm
-from vector_explorer.data_manager import TranscriptXMl
-from vector_explorer.models import ParagraphVector
+from vector_explorer.data_manager import TranscriptXMl, redirects_for
+from vector_explorer.models import (
+    CanonicalText,
+    ParagraphVector,
+    PendingLoad,
+    write_loads,
+)
+from vector_explorer.tools.index_maintenance import IndexMaintainer, IndexSpec
+from vector_explorer.tools.sharding import file_day, shard_aliases
 
+# paragraph embeddings are stored once per distinct text
+index_spec = IndexSpec.from_model(CanonicalText)
 
-def drop_indexes():
-    with connection.cursor() as cursor:
-        cursor.execute("DROP INDEX IF EXISTS nhsw_index;")
 
-
-def build_index():
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "CREATE INDEX nhsw_index ON vector_explorer_paragraphvector USING hnsw (embedding vector_cosine_ops);"
-        )
+def drop_indexes(using: str = "default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_spec.name};")
 
 
 class BulkAdder:
     def __init__(self, batch_size=10000):
         self.batch_size = batch_size
-        self.records: list[ParagraphVector] = []
+        self.loads: list[PendingLoad] = []
+        self.pending = 0
 
-    def add(self, records: list[ParagraphVector]):
-        self.records.extend(records)
-        if len(self.records) > self.batch_size:
+    def add(self, load: PendingLoad):
+        self.loads.append(load)
+        self.pending += len(load.records)
+        if self.pending > self.batch_size:
             self.bulk_create()
 
     def bulk_create(self):
-        if self.records:
-            ParagraphVector.objects.bulk_create(self.records)
-            tqdm.write(f"Created {len(self.records)} records")
-        self.records = []
+        if self.loads:
+            write_loads(self.loads)
+            tqdm.write(f"Created {self.pending} records")
+        self.loads = []
+        self.pending = 0
 
     def finish(self):
         self.bulk_create()
@@ -63,13 +70,36 @@ class Command(BaseCommand):
         parser.add_argument(
             "--pattern", type=str, help="Pattern to match", default="", required=False
         )
+        parser.add_argument(
+            "--reload",
+            type=str,
+            nargs="+",
+            default=[],
+            help="File names (e.g. debates2024-01-10a.xml) to load again even if already loaded, e.g. files updated in place by a sync",
+        )
 
         parser.add_argument(
             "--recreate_indexes",
-            type=bool,
-            help="Recreate indexes",
-            default=False,
-            required=False,
+            action="store_true",
+            help="Drop the index for the whole load and rebuild it after",
+        )
+        parser.add_argument(
+            "--rebuild_fraction",
+            type=float,
+            default=0.2,
+            help="Rebuild the index concurrently if more than this fraction of rows changed",
+        )
+        parser.add_argument(
+            "--maintenance_work_mem",
+            type=str,
+            default=None,
+            help="Session maintenance_work_mem for index builds, e.g. 8GB",
+        )
+        parser.add_argument(
+            "--parallel_workers",
+            type=int,
+            default=None,
+            help="Session max_parallel_maintenance_workers for index builds",
         )
 
     def handle(
@@ -78,7 +108,11 @@ class Command(BaseCommand):
         transcript_type: Optional[str],
         chamber_type: Optional[str],
         pattern: str,
+        reload: list[str],
         recreate_indexes: bool,
+        rebuild_fraction: float,
+        maintenance_work_mem: Optional[str],
+        parallel_workers: Optional[int],
         **kwargs,
     ):
         valid_transcript_formats = TranscriptXMl.get_transcript_manager(
@@ -86,32 +120,72 @@ class Command(BaseCommand):
         )
 
         adder = BulkAdder()
-        if recreate_indexes:
-            print("dropping indexes")
-            drop_indexes()
+        # one index per shard
+        maintainers = {
+            alias: IndexMaintainer(
+                index_spec,
+                rebuild_fraction=rebuild_fraction,
+                maintenance_work_mem=maintenance_work_mem,
+                parallel_workers=parallel_workers,
+                using=alias,
+            )
+            for alias in shard_aliases()
+        }
+        for alias, maintainer in maintainers.items():
+            maintainer.begin()
+            if recreate_indexes:
+                print(f"dropping indexes on {alias}")
+                drop_indexes(alias)
+
+        # latest version loaded of each day's file, so earlier versions
+        # (superseded after renumbering) aren't loaded over it
+        loaded_versions: dict[str, str] = {}
+        for alias in maintainers:
+            for source_file in (
+                ParagraphVector.objects.using(alias)
+                .values_list("source_file", flat=True)
+                .distinct()
+            ):
+                day = file_day(source_file)
+                loaded_versions[day] = max(loaded_versions.get(day, ""), source_file)
 
-        existing_sources = set(
-            ParagraphVector.objects.values_list("source_file", flat=True).distinct()
-        )
+        # an updated file keeps its name, so it wouldn't be newer than the load
+        reload_stems = {Path(x).stem for x in reload}
 
         for transcript_format in valid_transcript_formats:
             print(f"Importing transcripts for {transcript_format.label}")
 
-            files_to_import = transcript_format.get_embeddings_n(pattern=pattern)
+            files_to_import = transcript_format.get_embeddings_n(
+                pattern=pattern, latest_only=True
+            )
 
+            # only the latest version of each day is loaded: rows are inserted
+            # in deferred batches, so an earlier version loaded in the same run
+            # wouldn't be in the database yet for carry_over_versions to replace
             for file_path, df in tqdm(
-                transcript_format.get_embeddings(pattern=pattern, infer_missing=True),
+                transcript_format.get_embeddings(
+                    pattern=pattern, infer_missing=True, latest_only=True
+                ),
                 total=files_to_import,
             ):
-                if file_path.name in existing_sources:
+                day = file_day(file_path.name)
+                if (
+                    file_path.name <= loaded_versions.get(day, "")
+                    and file_path.stem not in reload_stems
+                ):
                     tqdm.write(f"Skipping {file_path.name}")
                     continue
-                records = ParagraphVector.ingest_df(
-                    source_file=file_path.name, df=df, verbose=True, defer=True
+                load = ParagraphVector.ingest_df(
+                    source_file=file_path.name,
+                    df=df,
+                    verbose=True,
+                    defer=True,
+                    redirects=redirects_for(file_path.with_suffix(".xml")),
                 )
-                if records:
-                    adder.add(records)
+                loaded_versions[day] = file_path.name
+                adder.add(load)
         adder.finish()
-        if recreate_indexes:
-            print("recreating indexes")
-            build_index()
+        # small deltas are added to the index in place, larger ones
+        # rebuild it concurrently so search stays available
+        for maintainer in maintainers.values():
+            maintainer.finish()
@@ -1,30 +1,28 @@
 # Create a new file named `import_transcripts.py` in your Django app's `management/commands` directory.
 
 from pathlib import Path
+from typing import Optional
 
 from django.core.management.base import BaseCommand
 from django.db import connection
 
 import pandas as pd
 from tqdm import tqdm
-from vector_explorer.models import NgramVector
+from vector_explorer.models import NgramVector, bump_search_generation
+from vector_explorer.tools.index_maintenance import IndexMaintainer, IndexSpec
+
+index_spec = IndexSpec.from_model(NgramVector)
 
 
 def drop_indexes():
     with connection.cursor() as cursor:
-        cursor.execute("DROP INDEX IF EXISTS ngram_nhsw_index;")
-
-
-def build_index():
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "CREATE INDEX ngram_nhsw_index ON vector_explorer_ngramvector USING hnsw (embedding vector_cosine_ops);"
-        )
+        cursor.execute(f"DROP INDEX IF EXISTS {index_spec.name};")
 
 
 class BulkAdder:
     def __init__(self, batch_size=10000):
         self.batch_size = batch_size
+        self.created = 0
         self.records: list[NgramVector] = []
 
     def add(self, records: list[NgramVector]):
@@ -36,6 +34,8 @@ class BulkAdder:
         if self.records:
             NgramVector.objects.bulk_create(self.records, batch_size=10000)
             tqdm.write(f"Created {len(self.records)} records")
+            self.created += len(self.records)
+            bump_search_generation(NgramVector)
         self.records = []
 
     def finish(self):
@@ -45,16 +45,51 @@ class BulkAdder:
 class Command(BaseCommand):
     help = "Import nigram data"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recreate_indexes",
+            action="store_true",
+            help="Drop the index for the whole load and rebuild it after",
+        )
+        parser.add_argument(
+            "--rebuild_fraction",
+            type=float,
+            default=0.2,
+            help="Rebuild the index concurrently if more than this fraction of rows changed",
+        )
+        parser.add_argument(
+            "--maintenance_work_mem",
+            type=str,
+            default=None,
+            help="Session maintenance_work_mem for index builds, e.g. 8GB",
+        )
+        parser.add_argument(
+            "--parallel_workers",
+            type=int,
+            default=None,
+            help="Session max_parallel_maintenance_workers for index builds",
+        )
+
     def handle(
         self,
+        *,
+        recreate_indexes: bool,
+        rebuild_fraction: float,
+        maintenance_work_mem: Optional[str],
+        parallel_workers: Optional[int],
         **kwargs,
     ):
-        recreate_indexes: bool = True
-
         parquet_file = Path("data", "big_vector", "parts")
 
         # NgramVector.objects.all().delete()
 
+        maintainer = IndexMaintainer(
+            index_spec,
+            rebuild_fraction=rebuild_fraction,
+            maintenance_work_mem=maintenance_work_mem,
+            parallel_workers=parallel_workers,
+        )
+        maintainer.begin()
         if recreate_indexes:
             print("dropping indexes")
             drop_indexes()
@@ -87,7 +122,6 @@ class Command(BaseCommand):
                 )
             df = None
 
-        if recreate_indexes:
-            print("recreating indexes")
-            build_index()
-            print("done")
+        adder.finish()
+        maintainer.finish(rows_changed=adder.created)
+        print("done")
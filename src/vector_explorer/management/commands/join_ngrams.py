@@ -0,0 +1,95 @@
+import shutil
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vector_explorer.tools.ngrams import merge_ngram_counts, peak_memory_mb
+
+ngram_dir = Path("data", "ngram")
+
+
+def find_shards(inputs: list[str], output: Path) -> list[Path]:
+    """
+    Parquet files given directly or found in the given directories,
+    leaving out the output itself.
+    """
+    paths: list[Path] = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            paths.extend(sorted(path.glob("*.parquet")))
+        elif path.exists():
+            paths.append(path)
+        else:
+            raise CommandError(f"{path} does not exist")
+    return [x for x in paths if x.resolve() != output.resolve()]
+
+
+class Command(BaseCommand):
+    help = "Sum ngram count shards into one parquet file with exact counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "inputs",
+            type=str,
+            nargs="*",
+            default=[str(ngram_dir / "shards")],
+            help="Parquet files or directories of them, with ngram and count columns",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=str(ngram_dir / "joined_ngram.parquet"),
+            help="Parquet file to write the totals to",
+        )
+        parser.add_argument(
+            "--method",
+            type=str,
+            choices=["duckdb", "kway"],
+            default="duckdb",
+            help="duckdb GROUP BY (sorted by count) or k-way merge (sorted by ngram)",
+        )
+        parser.add_argument(
+            "--min_count",
+            type=int,
+            default=1,
+            help="Leave out n-grams whose total count is below this",
+        )
+        parser.add_argument(
+            "--memory_limit",
+            type=str,
+            default="1GB",
+            help="duckdb memory limit before it spills to disk",
+        )
+
+    def handle(
+        self,
+        *,
+        inputs: list[str],
+        output: str,
+        method: str,
+        min_count: int,
+        memory_limit: str,
+        **kwargs,
+    ):
+        output_path = Path(output)
+        paths = find_shards(inputs, output_path)
+        if not paths:
+            raise CommandError("No parquet shards found")
+        temp_directory = output_path.parent / f"{output_path.stem}_tmp"
+
+        print(f"Merging {len(paths)} shards with {method}")
+        start = time.perf_counter()
+        rows = merge_ngram_counts(
+            paths,
+            output_path,
+            min_count=min_count,
+            method=method,  # type: ignore
+            memory_limit=memory_limit,
+            temp_directory=temp_directory,
+        )
+        seconds = time.perf_counter() - start
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        print(f"Wrote {rows} n-grams to {output_path} in {seconds:.1f}s")
+        print(f"Peak memory {peak_memory_mb():.0f} MB")
@@ -0,0 +1,106 @@
+import json
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from django.core.management.base import BaseCommand
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+from vector_explorer.tools.benchmark import latency_summary, timed
+
+DEFAULT_QUERIES = [
+    "mental health",
+    "question put and agreed to",
+    "register of members interests",
+    "I beg to move",
+    "climate change",
+    "cost of living",
+    "waiting lists",
+    "housing shortage",
+]
+
+
+def run_query(url: str, query: str, k: int) -> float:
+    params = urllib.parse.urlencode({"q": query, "k": k})
+    _, seconds = timed(
+        lambda: json.load(urllib.request.urlopen(f"{url}?{params}", timeout=60))
+    )
+    return seconds
+
+
+class Command(BaseCommand):
+    help = "Load test the search API and report latency and throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            type=str,
+            default="http://localhost:8000/api/search/",
+            help="Search endpoint to test",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[1, 4, 16, 64],
+            help="Numbers of concurrent clients to test",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per concurrency level"
+        )
+        parser.add_argument("--k", type=int, default=20, help="Results per query")
+        parser.add_argument(
+            "--queries_file",
+            type=str,
+            default=None,
+            help="csv with a `queries` column to draw search terms from",
+        )
+
+    def handle(
+        self,
+        *,
+        url: str,
+        concurrency: list[int],
+        requests: int,
+        k: int,
+        queries_file: Optional[str],
+        **kwargs,
+    ):
+        queries = DEFAULT_QUERIES
+        if queries_file:
+            queries = pd.read_csv(Path(queries_file))["queries"].dropna().tolist()
+        queries = [queries[i % len(queries)] for i in range(requests)]
+
+        table = Table(title=f"{url} - {requests} requests per level")
+        for column in ["concurrency", "qps", "p50 ms", "p99 ms", "errors"]:
+            table.add_column(column, justify="right")
+
+        for clients in concurrency:
+            errors = 0
+            times = []
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                futures = [pool.submit(run_query, url, query, k) for query in queries]
+                for future in futures:
+                    try:
+                        times.append(future.result())
+                    except Exception as error:
+                        errors += 1
+                        print(f"Request failed: {error}")
+            elapsed = time.perf_counter() - start
+
+            summary = latency_summary(times)
+            table.add_row(
+                str(clients),
+                f"{len(times) / elapsed:.1f}",
+                f"{summary['p50_ms']:.1f}",
+                f"{summary['p99_ms']:.1f}",
+                str(errors),
+            )
+
+        Console().print(table)
@@ -0,0 +1,241 @@
+from typing import Optional, Type
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from pgvector.django import CosineDistance
+from rich.console import Console
+from rich.table import Table
+from vector_explorer.models import (
+    NgramVector,
+    ParagraphVector,
+    embedding_model,
+    set_hnsw_ef_search,
+)
+from vector_explorer.tools.benchmark import (
+    check_index_used,
+    index_scan,
+    latency_summary,
+    recall_at_k,
+    sample_embeddings,
+    timed,
+)
+from vector_explorer.tools.sharding import DEFAULT_ALIAS, shard_aliases
+
+MODELS = {"paragraph": ParagraphVector, "ngram": NgramVector}
+
+# expression and operator class for each compact index
+# these need to match quantized_distance in models.py to be used by the planner
+QUANTIZED_EXPRESSIONS = {
+    "halfvec": "(embedding::halfvec({dimensions})) halfvec_cosine_ops",
+    "binary": "(binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops",
+}
+
+
+def full_index_name(model: Type[ParagraphVector]) -> str:
+    return embedding_model(model)._meta.indexes[0].name
+
+
+def index_name(model: Type[ParagraphVector], quantization: str) -> str:
+    # on the table storing the embedding, shared by paragraphs and canonical texts
+    base_name = full_index_name(model).removesuffix("_index")
+    return f"{base_name}_{quantization}_index"
+
+
+def index_exists(name: str, using: str = "default") -> bool:
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [name])
+        return cursor.fetchone() is not None
+
+
+def drop_index(model: Type[ParagraphVector], quantization: str, using: str = "default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name(model, quantization)};")
+
+
+def build_index(
+    model: Type[ParagraphVector], quantization: str, using: str = "default"
+):
+    stored = embedding_model(model)
+    dimensions = stored._meta.get_field("embedding").dimensions  # type: ignore
+    expression = QUANTIZED_EXPRESSIONS[quantization].format(dimensions=dimensions)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name(model, quantization)} "
+            f"ON {stored._meta.db_table} USING hnsw ({expression});"
+        )
+
+
+def exact_ids(
+    model: Type[ParagraphVector], embedding, k: int, using: str = "default"
+) -> list[int]:
+    """
+    Brute force top k, with index scans turned off.
+    """
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SET LOCAL enable_indexscan = off")
+        return list(hnsw_nearest(model, embedding, k, using))
+
+
+def hnsw_nearest(
+    model: Type[ParagraphVector], embedding, k: int, using: str = "default"
+):
+    rows = model.objects.using(using)
+    return rows.order_by(CosineDistance(rows.embedding_field, embedding)).values_list(
+        "id", flat=True
+    )[:k]
+
+
+class Command(BaseCommand):
+    help = "Create, drop or benchmark compact halfvec and binary HNSW indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            type=str,
+            choices=["create", "drop", "benchmark"],
+            help="What to do with the compact indexes",
+        )
+        parser.add_argument(
+            "--model",
+            type=str,
+            choices=list(MODELS),
+            default="paragraph",
+            help="Which vector table to use",
+        )
+        parser.add_argument(
+            "--quantization",
+            type=str,
+            choices=list(QUANTIZED_EXPRESSIONS) + ["all"],
+            default="all",
+            help="Which compact index to use",
+        )
+        parser.add_argument(
+            "--queries", type=int, default=50, help="Number of benchmark queries"
+        )
+        parser.add_argument("--k", type=int, default=10, help="Results per query")
+        parser.add_argument(
+            "--overfetch",
+            type=int,
+            default=4,
+            help="Candidates fetched from the compact index per result",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default=None,
+            help="Only this database (shard) alias, default every alias holding the model",
+        )
+
+    def handle(
+        self,
+        *,
+        action: str,
+        model: str,
+        quantization: str,
+        queries: int,
+        k: int,
+        overfetch: int,
+        database: Optional[str],
+        **kwargs,
+    ):
+        model_class = MODELS[model]
+        quantizations = (
+            list(QUANTIZED_EXPRESSIONS) if quantization == "all" else [quantization]
+        )
+        if database:
+            aliases = [database]
+        elif getattr(model_class, "sharded", False):
+            aliases = shard_aliases()
+        else:
+            aliases = [DEFAULT_ALIAS]
+
+        if action == "create":
+            for alias in aliases:
+                for option in quantizations:
+                    print(f"building {index_name(model_class, option)} on {alias}")
+                    build_index(model_class, option, alias)
+        elif action == "drop":
+            for alias in aliases:
+                for option in quantizations:
+                    print(f"dropping {index_name(model_class, option)} on {alias}")
+                    drop_index(model_class, option, alias)
+        else:
+            for alias in aliases:
+                self.benchmark(model_class, quantizations, queries, k, overfetch, alias)
+
+    def benchmark(
+        self,
+        model: Type[ParagraphVector],
+        quantizations: list[str],
+        queries: int,
+        k: int,
+        overfetch: int,
+        using: str = "default",
+    ):
+        set_hnsw_ef_search(max(40, k * overfetch), using=using)
+
+        rows = model.objects.using(using)
+        _, embeddings = sample_embeddings(model, queries, using)
+        if not len(embeddings):
+            print(f"No rows on {using}, skipping")
+            return
+
+        # each method's queryset, and the index it should be using
+        methods = {
+            "hnsw": (
+                lambda e: hnsw_nearest(model, e, k, using),
+                full_index_name(model),
+            )
+        }
+        for option in quantizations:
+            if not index_exists(index_name(model, option), using):
+                print(f"Skipping {option}, run `quantized_indexes create` first")
+                continue
+            methods[f"{option} + rerank"] = (
+                lambda e, option=option: rows.search_quantized(
+                    e, k=k, quantization=option, overfetch=overfetch
+                ).values_list("id", flat=True),
+                index_name(model, option),
+            )
+
+        truth = []
+        exact_times = []
+        for embedding in embeddings:
+            ids, seconds = timed(lambda: exact_ids(model, embedding, k, using))
+            truth.append(ids)
+            exact_times.append(seconds)
+
+        table = Table(
+            title=f"{model.__name__} on {using} recall@{k} over {len(embeddings)} queries"
+        )
+        table.add_column("method")
+        table.add_column(f"recall@{k}", justify="right")
+        table.add_column("p50 ms", justify="right")
+        table.add_column("p95 ms", justify="right")
+
+        summary = latency_summary(exact_times)
+        table.add_row(
+            "exact", "1.000", f"{summary['p50_ms']:.1f}", f"{summary['p95_ms']:.1f}"
+        )
+
+        for label, (method, method_index) in methods.items():
+            with index_scan(using):
+                check_index_used(method(embeddings[0]).explain(), method_index)
+            found = []
+            times = []
+            for embedding in embeddings:
+                with index_scan(using):
+                    ids, seconds = timed(lambda: list(method(embedding)))
+                found.append(ids)
+                times.append(seconds)
+            summary = latency_summary(times)
+            table.add_row(
+                label,
+                f"{recall_at_k(truth, found):.3f}",
+                f"{summary['p50_ms']:.1f}",
+                f"{summary['p95_ms']:.1f}",
+            )
+
+        Console().print(table)
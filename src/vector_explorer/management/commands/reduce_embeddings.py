@@ -0,0 +1,300 @@
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from tqdm import tqdm
+from vector_explorer.models import (
+    REDUCED_DIMENSIONS,
+    ParagraphVector,
+    set_hnsw_ef_search,
+    vector_literal,
+)
+from vector_explorer.tools.benchmark import (
+    build_sample_index,
+    check_index_used,
+    create_sample_table,
+    drop_sample_table,
+    exact_top_k,
+    index_scan_ids,
+    latency_summary,
+    query_plan,
+    recall_at_k,
+    sample_embeddings,
+    timed,
+)
+from vector_explorer.tools.index_maintenance import IndexSpec
+from vector_explorer.tools.projection import Projection, get_projection
+from vector_explorer.tools.sharding import shard_aliases
+
+table_name = ParagraphVector._meta.db_table
+
+
+def drop_indexes(using: str = "default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS reduced_nhsw_index;")
+
+
+def build_index(using: str = "default"):
+    spec = IndexSpec.from_model(ParagraphVector, "reduced_nhsw_index")
+    with connections[using].cursor() as cursor:
+        cursor.execute(spec.create_sql())
+
+
+def sample_all_shards(n: int, aliases: list[str]) -> np.ndarray:
+    """
+    Embeddings sampled from each shard in proportion to its size,
+    as one projection is shared by every shard.
+    """
+    counts = {alias: ParagraphVector.objects.using(alias).count() for alias in aliases}
+    total = sum(counts.values())
+    if not total:
+        raise CommandError(
+            f"No paragraphs on {', '.join(aliases)} to fit a projection to, run `infer` first"
+        )
+    return np.concatenate(
+        [
+            sample_embeddings(ParagraphVector, round(n * count / total), alias)[1]
+            for alias, count in counts.items()
+            if count
+        ]
+    )
+
+
+two_stage_sql = """
+    SELECT id FROM (
+        SELECT id, embedding FROM {name} ORDER BY reduced <=> %s::vector LIMIT %s
+    ) candidates
+    ORDER BY embedding <=> %s::vector LIMIT %s
+"""
+
+
+def two_stage_params(
+    embedding: np.ndarray, reduced: np.ndarray, k: int, candidates: int
+) -> list:
+    """
+    Parameters of two_stage_sql: the k nearest by the full embedding,
+    re-ranked from candidates found through the index on the reduced column.
+    """
+    return [vector_literal(reduced), candidates, vector_literal(embedding), k]
+
+
+class Command(BaseCommand):
+    help = "Fit, populate and benchmark the reduced dimension paragraph embeddings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            type=str,
+            choices=["fit", "populate", "benchmark"],
+            help="Stage of the reduced embedding pipeline to run",
+        )
+        parser.add_argument(
+            "--method",
+            type=str,
+            choices=["pca", "random"],
+            default="pca",
+            help="How to fit the projection",
+        )
+        parser.add_argument(
+            "--sample", type=int, default=50000, help="Rows used to fit or benchmark"
+        )
+        parser.add_argument(
+            "--batch_size", type=int, default=10000, help="Rows updated at once"
+        )
+        parser.add_argument(
+            "--only_missing",
+            action="store_true",
+            help="Only populate rows without a reduced embedding",
+        )
+        parser.add_argument(
+            "--dimensions",
+            type=int,
+            nargs="+",
+            default=[32, 64, 128, 192],
+            help="Reduced dimensions to benchmark",
+        )
+        parser.add_argument(
+            "--queries", type=int, default=100, help="Number of benchmark queries"
+        )
+        parser.add_argument("--k", type=int, default=10, help="Results per query")
+        parser.add_argument(
+            "--overfetch",
+            type=int,
+            default=10,
+            help="Candidates fetched from the reduced index per result",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default=None,
+            help="Only this database (shard) alias, default all for fit and populate",
+        )
+
+    def handle(self, *, action: str, database: Optional[str], **options):
+        aliases = [database] if database else shard_aliases()
+        if action == "fit":
+            self.fit(options["method"], options["sample"], aliases)
+        elif action == "populate":
+            for alias in aliases:
+                print(f"Populating {alias}")
+                self.populate(options["batch_size"], options["only_missing"], alias)
+        else:
+            self.benchmark(
+                options["dimensions"],
+                options["sample"],
+                options["queries"],
+                options["k"],
+                options["overfetch"],
+                database or "default",
+            )
+
+    def fit(self, method: str, sample: int, aliases: list[str]):
+        print(f"Fitting {method} projection on {sample} embeddings from {aliases}")
+        embeddings = sample_all_shards(sample, aliases)
+        projection = Projection.fit(embeddings, REDUCED_DIMENSIONS, method=method)  # type: ignore
+        path = projection.save()
+        print(f"Saved projection to {path}")
+        # values from the previous projection are in a different space,
+        # and the projection is shared, so clear them on every shard
+        for alias in shard_aliases():
+            print(f"Clearing reduced embeddings on {alias}")
+            drop_indexes(alias)
+            try:
+                ParagraphVector.objects.using(alias).update(embedding_reduced=None)
+            finally:
+                build_index(alias)
+        print("Run `reduce_embeddings populate` to fill them from the new projection")
+
+    def populate(self, batch_size: int, only_missing: bool, using: str = "default"):
+        projection = get_projection(REDUCED_DIMENSIONS)
+        if projection is None:
+            raise ValueError("No projection saved, run `reduce_embeddings fit` first")
+
+        query = ParagraphVector.objects.using(using)
+        if only_missing:
+            query = query.filter(embedding_reduced__isnull=True)
+        else:
+            # every row changes, so cheaper to rebuild the index at the end
+            print("dropping indexes")
+            drop_indexes(using)
+
+        bar = tqdm(total=query.count())
+        last_id = 0
+        try:
+            while True:
+                rows = list(
+                    query.filter(id__gt=last_id)
+                    .order_by("id")
+                    .values_list("id", ParagraphVector.embedding_field)[:batch_size]
+                )
+                if not rows:
+                    break
+                ids = [x[0] for x in rows]
+                reduced = projection.transform(np.stack([x[1] for x in rows]))
+                with connections[using].cursor() as cursor:
+                    cursor.execute(
+                        f"""
+                        UPDATE {table_name} AS p SET embedding_reduced = v.reduced::vector
+                        FROM unnest(%s::bigint[], %s::text[]) AS v(id, reduced)
+                        WHERE p.id = v.id
+                        """,
+                        [ids, [vector_literal(x) for x in reduced]],
+                    )
+                last_id = ids[-1]
+                bar.update(len(ids))
+        finally:
+            bar.close()
+            # also rebuilds an index left dropped by an earlier run that was killed
+            print("recreating indexes")
+            build_index(using)
+
+    def benchmark(
+        self,
+        dimensions: list[int],
+        sample: int,
+        queries: int,
+        k: int,
+        overfetch: int,
+        using: str = "default",
+    ):
+        ids, embeddings = sample_embeddings(ParagraphVector, sample + queries, using)
+        query_embeddings = embeddings[:queries]
+        ids, embeddings = ids[queries:], embeddings[queries:]
+
+        # exact ground truth by brute force over the sample
+        truth = exact_top_k(ids, embeddings, query_embeddings, k)
+
+        set_hnsw_ef_search(max(40, k * overfetch), using=using)
+
+        table = Table(
+            title=f"recall@{k} over {len(ids)} paragraphs, {queries} queries, {overfetch}x overfetch"
+        )
+        for column in [
+            "dimensions",
+            f"recall@{k}",
+            "p50 ms",
+            "p95 ms",
+            "index MB",
+            "build s",
+        ]:
+            table.add_column(column, justify="right")
+
+        full_dimensions = embeddings.shape[1]
+        for dims in [*dimensions, full_dimensions]:
+            if dims == full_dimensions:
+                # baseline - the HNSW index on the full embedding, no re-ranking needed
+                reduced, query_reduced = embeddings, query_embeddings
+            else:
+                projection = Projection.fit(embeddings, dims)
+                reduced = projection.transform(embeddings)
+                query_reduced = projection.transform(query_embeddings)
+
+            name = f"reduced_benchmark_{dims}"
+            sql = two_stage_sql.format(name=name)
+            create_sample_table(
+                name, ids, {"embedding": embeddings, "reduced": reduced}, using
+            )
+            build_seconds, index_mb = build_sample_index(name, "reduced", using)
+            # the baseline needs no re-ranking
+            candidates = k * (1 if dims == full_dimensions else overfetch)
+
+            check_index_used(
+                query_plan(
+                    sql,
+                    two_stage_params(
+                        query_embeddings[0], query_reduced[0], k, candidates
+                    ),
+                    using,
+                ),
+                f"{name}_index",
+            )
+
+            found = []
+            times = []
+            for embedding, embedding_reduced in zip(query_embeddings, query_reduced):
+                result, seconds = timed(
+                    lambda: index_scan_ids(
+                        sql,
+                        two_stage_params(embedding, embedding_reduced, k, candidates),
+                        using,
+                    )
+                )
+                found.append(result)
+                times.append(seconds)
+
+            summary = latency_summary(times)
+            table.add_row(
+                str(dims),
+                f"{recall_at_k(truth, found):.3f}",
+                f"{summary['p50_ms']:.1f}",
+                f"{summary['p95_ms']:.1f}",
+                f"{index_mb:.1f}",
+                f"{build_seconds:.1f}",
+            )
+            drop_sample_table(name, using)
+
+        Console().print(table)
@@ -0,0 +1,102 @@
+from pathlib import Path
+from typing import Optional
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from vector_explorer.data_manager import TranscriptXMl, data_dir
+from vector_explorer.tools.sync import RSYNC_SOURCE, sync_managers
+
+
+class Command(BaseCommand):
+    help = "rsync transcripts for every chamber at once, then validate and embed only the changed files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "pattern", type=str, help="Start of the file dates, e.g. 2024 or 2024-03"
+        )
+        parser.add_argument(
+            "--transcript_type", type=str, default=None, help="Type of the transcript"
+        )
+        parser.add_argument(
+            "--chamber_type", type=str, default=None, help="Type of the chamber"
+        )
+        parser.add_argument(
+            "--source",
+            type=str,
+            default=RSYNC_SOURCE,
+            help="rsync daemon module or directory laid out like parldata",
+        )
+        parser.add_argument(
+            "--destination", type=str, default=str(data_dir), help="Local parldata"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=3, help="rsync transfers at the same time"
+        )
+        parser.add_argument(
+            "--infer",
+            action="store_true",
+            help="Embed the new and changed files and load them into the database",
+        )
+
+    def handle(
+        self,
+        *,
+        pattern: str,
+        transcript_type: Optional[str],
+        chamber_type: Optional[str],
+        source: str,
+        destination: str,
+        workers: int,
+        infer: bool,
+        **kwargs,
+    ):
+        if infer and Path(destination).resolve() != data_dir.resolve():
+            raise CommandError(
+                "--infer loads from the data directory, not --destination"
+            )
+        managers = list(
+            TranscriptXMl.get_transcript_manager(
+                chamber=chamber_type, transcript=transcript_type
+            )
+        )
+        results = sync_managers(
+            managers,
+            pattern,
+            source=source,
+            destination=Path(destination),
+            workers=workers,
+        )
+
+        failed = []
+        invalid = []
+        for result in results:
+            manager = result.manager
+            if not result.ok:
+                print(f"{manager.label}: rsync exited with {result.returncode}")
+                print(result.stderr)
+                failed.append(manager.label)
+                continue
+            new = sum(change.new for change in result.changes)
+            print(f"{manager.label}: {new} new, {len(result.changes) - new} updated")
+            changed, errors = manager.validate_files(
+                result.changed_paths(Path(destination))
+            )
+            invalid += [path.name for path, _ in errors]
+            if infer and changed:
+                manager.infer_files(changed, override=True)
+                # updated files keep their names, so have infer load them again
+                call_command(
+                    "infer",
+                    chamber_type=manager.chamber_type,
+                    transcript_type=manager.transcript_type,
+                    pattern=pattern,
+                    reload=[path.name for path in changed],
+                )
+        problems = []
+        if failed:
+            problems.append(f"rsync failed for {', '.join(failed)}")
+        if invalid:
+            problems.append(f"Invalid files: {', '.join(invalid)}")
+        if problems:
+            raise CommandError("\n".join(problems))
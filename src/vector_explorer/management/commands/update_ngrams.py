@@ -0,0 +1,235 @@
+import hashlib
+from pathlib import Path
+from typing import Iterator, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from tqdm import tqdm
+from vector_explorer.models import (
+    NgramCountUpdate,
+    NgramVector,
+    bump_search_generation,
+)
+from vector_explorer.tools.index_maintenance import IndexMaintainer, IndexSpec
+from vector_explorer.tools.inference import get_local_inference
+
+index_spec = IndexSpec.from_model(NgramVector)
+table = NgramVector._meta.db_table
+
+staging_table = "ngram_update"
+
+
+def iter_parquet_counts(path: Path, batch_size: int) -> Iterator[tuple[list, list]]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size, columns=["ngram", "count"]
+    ):
+        columns = batch.to_pydict()
+        yield columns["ngram"], columns["count"]
+
+
+def load_staging(path: Path, batch_size: int = 50000, using: str = "default") -> int:
+    """
+    Load ngram, count from the parquet file into a temp table,
+    summing any repeated n-grams. Returns the distinct n-grams loaded.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging_table}_raw, {staging_table}")
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging_table}_raw (ngram text, count bigint)"
+        )
+        for ngrams, counts in tqdm(
+            iter_parquet_counts(path, batch_size), desc="Loading counts"
+        ):
+            cursor.execute(
+                f"""
+                INSERT INTO {staging_table}_raw (ngram, count)
+                SELECT * FROM unnest(%s::text[], %s::bigint[])
+                """,
+                [ngrams, counts],
+            )
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE {staging_table} AS
+            SELECT ngram, sum(count)::bigint AS count
+            FROM {staging_table}_raw GROUP BY ngram
+            """
+        )
+        cursor.execute(f"DROP TABLE {staging_table}_raw")
+        cursor.execute(f"ALTER TABLE {staging_table} ADD PRIMARY KEY (ngram)")
+        cursor.execute(f"ANALYZE {staging_table}")
+        cursor.execute(f"SELECT count(*) FROM {staging_table}")
+        return cursor.fetchone()[0]
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def update_existing(
+    replace_counts: bool, path: Path, using: str = "default"
+) -> Optional[int]:
+    """
+    Update the count of n-grams already stored and take them out of the
+    staging table, leaving only unseen n-grams. Returns the rows updated,
+    or None if this file's counts were already added by an earlier run
+    (e.g. one interrupted while embedding), in which case they aren't
+    added again.
+    """
+    digest = file_digest(path)
+    new_count = "u.count" if replace_counts else "v.count + u.count"
+    # the counts and the record that they were added commit together
+    with transaction.atomic(using=using):
+        applied = NgramCountUpdate.objects.using(using).filter(digest=digest)
+        updated = None
+        with connections[using].cursor() as cursor:
+            if replace_counts or not applied.exists():
+                cursor.execute(
+                    f"""
+                    UPDATE {table} v SET count = {new_count}
+                    FROM {staging_table} u
+                    WHERE v.text = u.ngram
+                    """
+                )
+                updated = cursor.rowcount
+            cursor.execute(
+                f"DELETE FROM {staging_table} u USING {table} v WHERE v.text = u.ngram"
+            )
+        NgramCountUpdate.objects.using(using).get_or_create(
+            digest=digest, defaults={"source": str(path)}
+        )
+    return updated
+
+
+def iter_new_ngrams(
+    batch_size: int, using: str = "default"
+) -> Iterator[list[tuple[str, int]]]:
+    """
+    The n-grams left in staging, paged by ngram.
+    """
+    last: Optional[str] = None
+    while True:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT ngram, count FROM {staging_table}
+                WHERE %s::text IS NULL OR ngram > %s
+                ORDER BY ngram LIMIT %s
+                """,
+                [last, last, batch_size],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        yield rows
+
+
+class Command(BaseCommand):
+    help = "Update n-gram counts from a parquet file, embedding only n-grams not stored yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input",
+            type=str,
+            nargs="?",
+            default=str(Path("data", "ngram", "joined_ngram.parquet")),
+            help="Parquet file with ngram and count columns",
+        )
+        parser.add_argument(
+            "--replace_counts",
+            action="store_true",
+            help="The file has full totals, rather than counts to add to the stored ones",
+        )
+        parser.add_argument(
+            "--batch_size", type=int, default=256, help="N-grams embedded at a time"
+        )
+        parser.add_argument(
+            "--rebuild_fraction",
+            type=float,
+            default=0.2,
+            help="Rebuild the index concurrently if more than this fraction of rows changed",
+        )
+        parser.add_argument(
+            "--maintenance_work_mem",
+            type=str,
+            default=None,
+            help="Session maintenance_work_mem for index builds, e.g. 8GB",
+        )
+        parser.add_argument(
+            "--parallel_workers",
+            type=int,
+            default=None,
+            help="Session max_parallel_maintenance_workers for index builds",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default="default",
+            help="Database alias holding the n-grams",
+        )
+
+    def handle(
+        self,
+        *,
+        input: str,
+        replace_counts: bool,
+        batch_size: int,
+        rebuild_fraction: float,
+        maintenance_work_mem: Optional[str],
+        parallel_workers: Optional[int],
+        database: str,
+        **kwargs,
+    ):
+        path = Path(input)
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+
+        # the index is kept up to date as rows go in, and only rebuilt
+        # (concurrently) if the update turns out to be large
+        maintainer = IndexMaintainer(
+            index_spec,
+            rebuild_fraction=rebuild_fraction,
+            maintenance_work_mem=maintenance_work_mem,
+            parallel_workers=parallel_workers,
+            using=database,
+        )
+        maintainer.begin()
+
+        distinct = load_staging(path, using=database)
+        updated = update_existing(replace_counts, path, using=database)
+        with connections[database].cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {staging_table}")
+            new = cursor.fetchone()[0]
+        if updated is None:
+            print(f"Counts from {path} were already added, only embedding new n-grams")
+            updated = 0
+        print(f"{distinct} n-grams: {updated} counts updated, {new} new to embed")
+
+        inference = get_local_inference()
+        created = 0
+        with tqdm(total=new, desc="Embedding") as progress:
+            for rows in iter_new_ngrams(batch_size, using=database):
+                texts = [ngram for ngram, _ in rows]
+                embeddings = inference.query(texts)
+                NgramVector.objects.using(database).bulk_create(
+                    [
+                        NgramVector(text=ngram, count=count, embedding=embedding)
+                        for (ngram, count), embedding in zip(rows, embeddings)
+                    ]
+                )
+                created += len(rows)
+                progress.update(len(rows))
+
+        with connections[database].cursor() as cursor:
+            cursor.execute(f"DROP TABLE {staging_table}")
+        if created or updated:
+            bump_search_generation(NgramVector)
+        maintainer.finish(rows_changed=created)
+        print(f"Added {created} n-grams")
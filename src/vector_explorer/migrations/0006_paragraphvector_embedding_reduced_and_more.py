@@ -0,0 +1,24 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:02
+
+from django.db import migrations
+import pgvector.django.indexes
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0005_ngramvector_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paragraphvector',
+            name='embedding_reduced',
+            field=pgvector.django.vector.VectorField(dimensions=128, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='paragraphvector',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding_reduced'], m=16, name='reduced_nhsw_index', opclasses=['vector_cosine_ops']),
+        ),
+    ]
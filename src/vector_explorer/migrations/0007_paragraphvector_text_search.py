@@ -0,0 +1,25 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0006_paragraphvector_embedding_reduced_and_more'),
+    ]
+
+    operations = [
+        # Django 4.2 has no GeneratedField, so the column is managed here
+        # and only referenced from raw SQL in DistanceQuerySet.hybrid_search
+        migrations.RunSQL(
+            sql=[
+                "ALTER TABLE vector_explorer_paragraphvector ADD COLUMN text_search tsvector GENERATED ALWAYS AS (to_tsvector('english', text)) STORED;",
+                "CREATE INDEX paragraph_text_search_index ON vector_explorer_paragraphvector USING gin (text_search);",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS paragraph_text_search_index;",
+                "ALTER TABLE vector_explorer_paragraphvector DROP COLUMN IF EXISTS text_search;",
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0007_paragraphvector_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchGeneration',
+            fields=[
+                ('label', models.CharField(primary_key=True, serialize=False)),
+                ('generation', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
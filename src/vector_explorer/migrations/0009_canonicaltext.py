@@ -0,0 +1,33 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import pgvector.django.indexes
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0008_searchgeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=32, unique=True)),
+                ('text', models.TextField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+            ],
+            options={
+                'indexes': [pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='canonical_nhsw_index', opclasses=['vector_cosine_ops'])],
+            },
+        ),
+        migrations.AddField(
+            model_name='paragraphvector',
+            name='canonical',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='vector_explorer.canonicaltext'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:22
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0009_canonicaltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NgramNeighbours',
+            fields=[
+                ('neighbour_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                ('distances', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbours', serialize=False, to='vector_explorer.ngramvector')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ParagraphNeighbours',
+            fields=[
+                ('neighbour_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                ('distances', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbours', serialize=False, to='vector_explorer.paragraphvector')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
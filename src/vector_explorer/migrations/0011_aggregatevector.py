@@ -0,0 +1,49 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:32
+
+from django.db import migrations, models
+import pgvector.django.indexes
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0010_neighbours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregateVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('speech', 'Speech'), ('section', 'Section')])),
+                ('key', models.CharField()),
+                ('source_file', models.CharField()),
+                ('transcript_type', models.CharField()),
+                ('chamber_type', models.CharField()),
+                ('paragraph_count', models.IntegerField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='paragraphvector',
+            name='section_id',
+            field=models.CharField(blank=True, default=''),
+        ),
+        migrations.AddIndex(
+            model_name='paragraphvector',
+            index=models.Index(fields=['section_id'], name='paragraph_section_index'),
+        ),
+        migrations.AddIndex(
+            model_name='aggregatevector',
+            index=pgvector.django.indexes.HnswIndex(condition=models.Q(('level', 'speech')), ef_construction=64, fields=['embedding'], m=16, name='speech_nhsw_index', opclasses=['vector_cosine_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='aggregatevector',
+            index=pgvector.django.indexes.HnswIndex(condition=models.Q(('level', 'section')), ef_construction=64, fields=['embedding'], m=16, name='section_nhsw_index', opclasses=['vector_cosine_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='aggregatevector',
+            index=models.Index(fields=['source_file'], name='aggregate_source_index'),
+        ),
+    ]
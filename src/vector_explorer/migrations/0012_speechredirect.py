@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-19 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0011_aggregatevector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeechRedirect',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_gid', models.CharField(unique=True)),
+                ('new_gid', models.CharField()),
+                ('match_type', models.CharField()),
+                ('source_file', models.CharField()),
+            ],
+        ),
+    ]
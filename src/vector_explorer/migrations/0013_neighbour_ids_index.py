@@ -0,0 +1,22 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0012_speechredirect'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ngramneighbours',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['neighbour_ids'], name='ngramneighbours_ids_index'),
+        ),
+        migrations.AddIndex(
+            model_name='paragraphneighbours',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['neighbour_ids'], name='paragraphneighbours_ids_index'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0013_neighbour_ids_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NgramCountUpdate',
+            fields=[
+                ('digest', models.CharField(primary_key=True, serialize=False)),
+                ('source', models.CharField()),
+                ('applied', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import pgvector.django.vector
+
+# paragraphs not linked yet get a canonical text made from their own embedding,
+# checking the foreign key now so the table can be altered in this transaction
+LINK_SQL = """
+    SET CONSTRAINTS ALL IMMEDIATE;
+
+    INSERT INTO vector_explorer_canonicaltext (text_hash, text, embedding)
+    SELECT DISTINCT ON (md5(text)) md5(text), text, embedding
+    FROM vector_explorer_paragraphvector
+    WHERE canonical_id IS NULL
+    ORDER BY md5(text), id
+    ON CONFLICT (text_hash) DO NOTHING;
+
+    UPDATE vector_explorer_paragraphvector paragraph
+    SET canonical_id = canonical.id
+    FROM vector_explorer_canonicaltext canonical
+    WHERE paragraph.canonical_id IS NULL
+    AND canonical.text_hash = md5(paragraph.text);
+"""
+
+# copy the embeddings back when migrating backwards
+UNLINK_SQL = """
+    UPDATE vector_explorer_paragraphvector paragraph
+    SET embedding = canonical.embedding
+    FROM vector_explorer_canonicaltext canonical
+    WHERE paragraph.canonical_id = canonical.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vector_explorer', '0014_ngramcountupdate'),
+    ]
+
+    operations = [
+        migrations.RunSQL(LINK_SQL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='paragraphvector',
+            name='canonical',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='occurrences', to='vector_explorer.canonicaltext'),
+        ),
+        migrations.RemoveIndex(
+            model_name='paragraphvector',
+            name='nhsw_index',
+        ),
+        migrations.AlterField(
+            model_name='paragraphvector',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(dimensions=384, null=True),
+        ),
+        migrations.RunSQL(migrations.RunSQL.noop, UNLINK_SQL),
+        migrations.RemoveField(
+            model_name='paragraphvector',
+            name='embedding',
+        ),
+    ]
@@ -1,26 +1,212 @@
 from __future__ import annotations
 
-from functools import lru_cache
-from typing import Annotated, Callable, TypeVar, Union
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    Optional,
+    TypeVar,
+    Union,
+)
 
-from django.db import models
-from django.db.models import F
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connections, models, transaction
+from django.db.models import Case, F, FloatField, Func, Q, Value, When
+from django.db.models.functions import Cast
 
 import numpy as np
-import pandas as pd
 from numpy.typing import NDArray
-from pgvector.django import CosineDistance, HnswIndex, VectorField
+from pgvector.django import (
+    BitField,
+    CosineDistance,
+    HalfVector,
+    HalfVectorField,
+    HammingDistance,
+    HnswIndex,
+    SparseVectorField,
+    VectorField,
+)
 
-from .tools.inference import Inference
+from .tools.aggregates import SECTION, SPEECH, aggregate_embeddings
+from .tools.cache import LRUCache
+from .tools.inference import get_local_inference, query_cache
 from .tools.model_helpers import field
+from .tools.projection import get_projection
+from .tools.sharding import file_day, shard_aliases, shard_for, shard_for_instance
+
+if TYPE_CHECKING:
+    # pandas and pyarrow are slow to import, so are only loaded
+    # when a dataframe is first built
+    import pandas as pd
+    import pyarrow as pa
 
 FloatArray384 = Annotated[NDArray[np.float64], 384]
 
+# HNSW build parameters for the vector indexes,
+# see the hnsw_sweep command for their effect on recall and latency
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+
+# dimensions of the PCA reduced embedding used for coarse candidate search
+REDUCED_DIMENSIONS = 128
+
 M = TypeVar("M", bound=models.Model, covariant=True)
 
-@lru_cache
-def get_local_inference() -> Inference:
-    return Inference(model_id="BAAI/bge-small-en-v1.5", local=True)
+VECTOR_FIELDS = (VectorField, HalfVectorField, BitField, SparseVectorField)
+
+SearchTerm = Union[str, FloatArray384, list[float]]
+Quantization = Literal["halfvec", "binary"]
+
+
+def query_embedding(search_term: SearchTerm) -> FloatArray384:
+    """
+    Embed a search term, or pass through an already embedded query.
+    """
+    if isinstance(search_term, str):
+        return get_local_inference().query_cached([search_term])[0]
+    return np.asarray(search_term, dtype=np.float32)
+
+
+# dataframes of recent searches, keyed by the search and the generation
+# of the table when it was run
+result_cache: LRUCache[tuple, pd.DataFrame] = LRUCache(maxsize=128)
+
+# larger results are not kept in the result cache
+RESULT_CACHE_MAX_ROWS = 100000
+
+# neighbours stored per row by build_neighbours, and returned by similar_to
+NEIGHBOURS_K = 10
+
+# DistanceQuerySet methods search_shards can run on each shard
+SHARD_SEARCH_METHODS = (
+    "search_distance",
+    "search_quantized",
+    "search_reduced",
+    "search_sections",
+    "hybrid_search",
+)
+
+
+def search_generation(model: type[models.Model]) -> int:
+    generation = (
+        SearchGeneration.objects.filter(label=model._meta.label)
+        .values_list("generation", flat=True)
+        .first()
+    )
+    return generation or 0
+
+
+def bump_search_generation(model: type[models.Model]):
+    """
+    Mark that rows have been added or removed, so cached results
+    for this model are no longer used.
+    """
+    updated = SearchGeneration.objects.filter(label=model._meta.label).update(
+        generation=F("generation") + 1
+    )
+    if not updated:
+        SearchGeneration.objects.get_or_create(
+            label=model._meta.label, defaults={"generation": 1}
+        )
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    return {"query_embeddings": query_cache.stats(), "results": result_cache.stats()}
+
+
+def bulk_create_sharded(model: type[M], records: list[M], **kwargs) -> dict[str, int]:
+    """
+    bulk_create each record on the shard its router would pick.
+    Returns the number of records created per alias.
+    """
+    by_alias: dict[str, list[M]] = {}
+    for record in records:
+        by_alias.setdefault(shard_for_instance(record), []).append(record)
+    for alias, shard_records in by_alias.items():
+        model.objects.using(alias).bulk_create(shard_records, **kwargs)  # type: ignore
+    return {alias: len(shard_records) for alias, shard_records in by_alias.items()}
+
+
+def vector_literal(values) -> str:
+    """
+    Text form of a vector for use as a raw SQL parameter, e.g. '[0.1,0.2]'
+    """
+    return "[" + ",".join(str(float(x)) for x in values) + "]"
+
+
+def embedding_model(model: type[models.Model]) -> type[models.Model]:
+    """
+    The model whose table stores model's full embedding - the model
+    itself, or CanonicalText for paragraphs (see embedding_field).
+    """
+    name = getattr(model, "embedding_field", "embedding")
+    if "__" in name:
+        return model._meta.get_field(name.split("__")[0]).related_model  # type: ignore
+    return model
+
+
+def embedding_join(model: type[models.Model]) -> tuple[str, str]:
+    """
+    FROM clause and embedding column for raw SQL over model's table,
+    joining the table that stores the embedding if it's elsewhere.
+    """
+    table = model._meta.db_table
+    name = getattr(model, "embedding_field", "embedding")
+    if "__" not in name:
+        return table, f"{table}.embedding"
+    relation = model._meta.get_field(name.split("__")[0])
+    stored = relation.related_model._meta.db_table  # type: ignore
+    return (
+        f"{table} JOIN {stored} ON {stored}.id = {table}.{relation.column}",  # type: ignore
+        f"{stored}.embedding",
+    )
+
+
+def set_hnsw_ef_search(ef_search: int, using: str = "default"):
+    """
+    Set the size of the HNSW candidate list for this session.
+    Needs to be at least as big as the number of rows wanted from the index.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('hnsw.ef_search', %s, false)", [str(ef_search)]
+        )
+
+
+class BinaryQuantize(Func):
+    function = "binary_quantize"
+    output_field = BitField()
+
+
+def quantized_distance(
+    quantization: Quantization,
+    embedding: FloatArray384,
+    dimensions: int,
+    field_name: str = "embedding",
+) -> Func:
+    """
+    Distance expression that matches the compact expression indexes
+    created by the `quantized_indexes` command.
+    """
+    if quantization == "halfvec":
+        return CosineDistance(
+            Cast(field_name, HalfVectorField(dimensions=dimensions)),
+            HalfVector(embedding),
+        )
+    elif quantization == "binary":
+        bits = "".join("1" if x > 0 else "0" for x in embedding)
+        return HammingDistance(
+            Cast(BinaryQuantize(field_name), BitField(length=dimensions)), bits
+        )
+    raise ValueError(f"Unknown quantization {quantization}")
+
 
 class DistanceQuerySet(models.QuerySet):
     """
@@ -30,64 +216,822 @@ class DistanceQuerySet(models.QuerySet):
     def pipe(self, item: Callable):
         return item(self)
 
-    def search_distance(self, search_term: str, threshold: float = 0.4):
-        infer = get_local_inference()
-        embedding = infer.query([search_term])[0]
+    @property
+    def embedding_field(self) -> str:
+        """
+        Lookup of the full embedding, e.g. canonical__embedding for
+        paragraphs, which share one stored embedding per distinct text.
+        """
+        return getattr(self.model, "embedding_field", "embedding")
+
+    def search_distance(
+        self,
+        search_term: SearchTerm,
+        threshold: float = 0.4,
+        k: Optional[int] = None,
+    ):
+        embedding = query_embedding(search_term)
 
-        return (
-            self.alias(distance=CosineDistance("embedding", embedding))
+        qs = (
+            self.alias(distance=CosineDistance(self.embedding_field, embedding))
             .filter(distance__lte=threshold)
             .annotate(distance=F("distance"))
             .order_by("distance")
         )
+        if k is not None:
+            qs = qs[:k]
+        return qs
+
+    def iter_search(
+        self,
+        search_term: SearchTerm,
+        *args: str,
+        threshold: float = 0.4,
+        page_size: int = 1000,
+    ) -> Iterator[list[dict]]:
+        """
+        Yield pages of up to page_size rows (as dicts, without vectors)
+        for every row within threshold of the search term, nearest first.
 
-    def df(self, *args: Union[str, tuple[str, str]], **kwargs) -> pd.DataFrame:
+        An HNSW scan stops after hnsw.ef_search rows (at most 1000), so a
+        sweep of everything within a threshold can't be answered from the
+        index. Distances are compared exactly instead, in one query whose
+        rows are streamed from a server side cursor, so memory stays bounded.
+        Args limit the columns returned (distance and id are always included).
+        """
+        embedding = query_embedding(search_term)
+        # adding zero keeps the planner off the HNSW index, as in rerank
+        qs = (
+            self.alias(
+                distance=CosineDistance(self.embedding_field, embedding) + Value(0.0)
+            )
+            .filter(distance__lte=threshold)
+            .annotate(distance=F("distance"))
+            .order_by("distance", "id")
+        )
+        columns = list(args) if args else qs.default_columns()
+        columns += [x for x in ["id", "distance"] if x not in columns]
+
+        page: list[dict] = []
+        for row in qs.values(*columns).iterator(chunk_size=page_size):
+            page.append(row)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def search_df(
+        self,
+        search_term: SearchTerm,
+        *args: Union[str, tuple[str, str]],
+        threshold: float = 0.4,
+        k: Optional[int] = None,
+        use_cache: bool = True,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        search_distance(...).df(...), reusing the result of an identical
+        search (same term, threshold, k, filters and columns) if nothing has
+        been ingested since. Results over RESULT_CACHE_MAX_ROWS aren't kept.
+        """
+        if not use_cache:
+            return self.search_distance(search_term, threshold, k).df(*args, **kwargs)
+
+        key = (
+            self.db,
+            self.model._meta.label,
+            str(self.query),
+            # arrays aren't hashable, so key pre-embedded terms by their bytes
+            search_term
+            if isinstance(search_term, str)
+            else query_embedding(search_term).tobytes(),
+            threshold,
+            k,
+            args,
+            tuple(sorted((name, str(value)) for name, value in kwargs.items())),
+            search_generation(self.model),
+        )
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached.copy()
+        df = self.search_distance(search_term, threshold, k).df(*args, **kwargs)
+        if len(df) <= RESULT_CACHE_MAX_ROWS:
+            result_cache.put(key, df.copy())
+        return df
+
+    def search_quantized(
+        self,
+        search_term: SearchTerm,
+        k: int = 10,
+        quantization: Quantization = "halfvec",
+        overfetch: int = 4,
+        threshold: Optional[float] = None,
+    ):
+        """
+        Fetch k * overfetch candidates from a compact halfvec or binary index,
+        and re-rank them by exact cosine distance on the full embedding.
+        hnsw.ef_search needs to be at least k * overfetch (see set_hnsw_ef_search).
+        """
+        embedding = query_embedding(search_term)
+        dimensions = (
+            embedding_model(self.model)._meta.get_field("embedding").dimensions  # type: ignore
+        )
+        candidates = self.order_by(
+            quantized_distance(
+                quantization, embedding, dimensions, self.embedding_field
+            )
+        ).values("id")[: k * overfetch]
+        return self.rerank(candidates, embedding, k=k, threshold=threshold)
+
+    def search_reduced(
+        self,
+        search_term: SearchTerm,
+        k: int = 10,
+        overfetch: int = 10,
+        threshold: Optional[float] = None,
+    ):
+        """
+        Two stage search - fetch k * overfetch candidates from the
+        low dimensional `embedding_reduced` index, and re-rank them by
+        exact cosine distance on the full embedding.
+        Needs the projection fitted with `reduce_embeddings fit`.
+        """
+        projection = get_projection(REDUCED_DIMENSIONS)
+        if projection is None:
+            raise ValueError(
+                f"No projection for {REDUCED_DIMENSIONS} dimensions, run `reduce_embeddings fit` first"
+            )
+        embedding = query_embedding(search_term)
+        reduced = projection.transform(embedding)[0]
+        candidates = self.order_by(CosineDistance("embedding_reduced", reduced)).values(
+            "id"
+        )[: k * overfetch]
+        return self.rerank(candidates, embedding, k=k, threshold=threshold)
+
+    def rerank(
+        self,
+        candidates: models.QuerySet,
+        embedding: FloatArray384,
+        k: int,
+        threshold: Optional[float] = None,
+    ):
+        """
+        Order a subquery of candidate ids by exact distance to the embedding.
+        """
+        # adding zero stops the planner answering the re-rank from the HNSW index
+        # on embedding, which would only return candidates it happens to find
+        qs = self.filter(id__in=candidates).alias(
+            distance=CosineDistance(self.embedding_field, embedding) + Value(0.0)
+        )
+        if threshold is not None:
+            qs = qs.filter(distance__lte=threshold)
+        return qs.annotate(distance=F("distance")).order_by("distance")[:k]
+
+    def search_sections(
+        self,
+        search_term: SearchTerm,
+        sections: int = 20,
+        threshold: float = 0.4,
+        k: Optional[int] = None,
+    ):
+        """
+        Two stage search - find the sections (debates under one heading)
+        whose aggregate vector is nearest the search term, then search
+        the paragraphs within those sections only.
+        Needs section ids and aggregates, see the build_aggregates command.
+        """
+        embedding = query_embedding(search_term)
+        section_ids = (
+            AggregateVector.objects.using(self.db)
+            .filter(level=SECTION)
+            .order_by(CosineDistance("embedding", embedding))
+            .values("key")[:sections]
+        )
+        # adding zero keeps the planner on the section filter rather
+        # than walking the whole paragraph HNSW index
+        return (
+            self.filter(section_id__in=section_ids)
+            .alias(
+                distance=CosineDistance(self.embedding_field, embedding) + Value(0.0)
+            )
+            .filter(distance__lte=threshold)
+            .annotate(distance=F("distance"))
+            .order_by("distance")[:k]
+        )
+
+    def hybrid_search(
+        self,
+        search_term: str,
+        k: int = 10,
+        candidates: int = 100,
+        rrf_k: int = 60,
+        phrase: bool = False,
+    ):
+        """
+        Combine full text and vector search with reciprocal rank fusion.
+        The top `candidates` from each are ranked in the database, and
+        each row scores 1 / (rrf_k + rank) from each list it appears in.
+        Set phrase to only match the words of the search term in order,
+        otherwise websearch syntax is used (e.g. quotes for a phrase).
+        hnsw.ef_search needs to be at least candidates (see set_hnsw_ef_search).
+        """
+        text_search_column = getattr(self.model, "text_search_column", None)
+        if text_search_column is None:
+            raise ValueError(f"{self.model.__name__} has no full text search column")
+
+        embedding = query_embedding(search_term)
+        table = self.model._meta.db_table
+        nearest_from, embedding_column = embedding_join(self.model)
+        tsquery_function = "phraseto_tsquery" if phrase else "websearch_to_tsquery"
+
+        # keep any filters already applied to the queryset
+        restrict = ""
+        restrict_params: list = []
+        if self.query.where:
+            restrict_sql, restrict_params = self.values("id").query.sql_with_params()
+            restrict = f"AND {table}.id IN ({restrict_sql})"
+            restrict_params = list(restrict_params)
+
+        vector = vector_literal(embedding)
+        sql = f"""
+            WITH full_text AS (
+                SELECT {table}.id, row_number() OVER (ORDER BY ts_rank_cd({text_search_column}, query) DESC) AS rank
+                FROM {table}, {tsquery_function}('english', %s) query
+                WHERE {text_search_column} @@ query {restrict}
+                ORDER BY ts_rank_cd({text_search_column}, query) DESC
+                LIMIT %s
+            ),
+            nearest AS (
+                SELECT id, row_number() OVER (ORDER BY distance) AS rank
+                FROM (
+                    SELECT {table}.id, {embedding_column} <=> %s::vector AS distance
+                    FROM {nearest_from}
+                    WHERE true {restrict}
+                    ORDER BY {embedding_column} <=> %s::vector
+                    LIMIT %s
+                ) by_distance
+            )
+            SELECT
+                coalesce(full_text.id, nearest.id),
+                coalesce(1.0 / (%s + full_text.rank), 0) + coalesce(1.0 / (%s + nearest.rank), 0) AS score
+            FROM full_text FULL OUTER JOIN nearest ON full_text.id = nearest.id
+            ORDER BY score DESC
+            LIMIT %s
+        """
+        params = [
+            search_term,
+            *restrict_params,
+            candidates,
+            vector,
+            *restrict_params,
+            vector,
+            candidates,
+            rrf_k,
+            rrf_k,
+            k,
+        ]
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            scores = dict(cursor.fetchall())
+
+        return (
+            self.model.objects.using(self.db)
+            .filter(id__in=list(scores))
+            .annotate(
+                rrf_score=Case(
+                    *[
+                        When(id=pk, then=Value(float(score)))
+                        for pk, score in scores.items()
+                    ],
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                ),
+                distance=CosineDistance(self.embedding_field, embedding),
+            )
+            .order_by("-rrf_score")
+        )
+
+    def search_shards(
+        self,
+        search_term: SearchTerm,
+        *args: Union[str, tuple[str, str]],
+        threshold: float = 0.4,
+        k: Optional[int] = 10,
+        aliases: Optional[list[str]] = None,
+        method: str = "search_distance",
+        options: Optional[dict[str, Any]] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Run a search method on every shard in parallel (see tools.sharding),
+        merging the results into one dataframe of the k best overall,
+        with a `shard` column. Other arguments are as for df.
+
+        method is one of SHARD_SEARCH_METHODS, and options are passed on to
+        it (e.g. {"quantization": "binary"} for search_quantized).
+        hybrid_search needs the search term as text, has no threshold, and is
+        merged by rrf_score - as ranks are per shard, this is approximate.
+        """
+        import pandas as pd
+
+        if method not in SHARD_SEARCH_METHODS:
+            raise ValueError(
+                f"Unknown method {method}, expected one of {SHARD_SEARCH_METHODS}"
+            )
+        options = dict(options or {})
+        aliases = aliases or shard_aliases()
+
+        if method == "hybrid_search":
+            if not isinstance(search_term, str):
+                raise ValueError("hybrid_search needs the search term as text")
+            term: SearchTerm = search_term
+            options["k"] = k if k is not None else 10
+            order_by, ascending = "rrf_score", False
+        else:
+            term = query_embedding(search_term)
+            if k is None and method in ("search_quantized", "search_reduced"):
+                raise ValueError(f"{method} needs k")
+            options.update(k=k, threshold=threshold)
+            order_by, ascending = "distance", True
+        if args:
+            args = tuple(dict.fromkeys((*args, order_by, "distance")))
+
+        def search(alias: str) -> pd.DataFrame:
+            try:
+                qs = getattr(self.using(alias), method)(term, **options)
+                return qs.df(*args, **kwargs).assign(shard=alias)
+            finally:
+                # each worker thread opens its own connection
+                connections[alias].close()
+
+        with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+            frames = list(pool.map(search, aliases))
+        # empty shards would otherwise change the dtypes of the merged frame
+        frames = [frame for frame in frames if len(frame)] or frames[:1]
+        df = pd.concat(frames, ignore_index=True).sort_values(
+            order_by, ascending=ascending, kind="stable"
+        )
+        if k is not None:
+            df = df.head(k)
+        return df.reset_index(drop=True)
+
+    def similar_to(self, pk: int, k: int = NEIGHBOURS_K):
+        """
+        The k rows nearest to the row with this id, from the precomputed
+        neighbour lists (see the build_neighbours command), nearest first.
+        Rows without a list yet fall back to a live index search.
+        Ids in a list whose rows have since been removed are left out.
+        """
+        neighbour_model = self.model._meta.get_field("neighbours").related_model
+        neighbours = (
+            neighbour_model.objects.using(self.db)
+            .filter(pk=pk)
+            .values_list("neighbour_ids", "distances")
+            .first()
+        )
+        if neighbours is None:
+            embedding = (
+                self.model.objects.using(self.db)
+                .values_list(self.embedding_field, flat=True)
+                .get(pk=pk)
+            )
+            return self.exclude(pk=pk).search_distance(embedding, threshold=2.0, k=k)
+
+        distances = dict(zip(*neighbours))
+        return (
+            self.filter(id__in=list(distances))
+            .annotate(
+                distance=Case(
+                    *[
+                        When(id=neighbour_id, then=Value(float(distance)))
+                        for neighbour_id, distance in distances.items()
+                    ],
+                    output_field=FloatField(),
+                )
+            )
+            .order_by("distance", "id")[:k]
+        )
+
+    def default_columns(self, include_vectors: bool = False) -> list[str]:
+        """
+        The columns .values() would return with no arguments,
+        without the vector fields unless include_vectors is set.
+        """
+        columns = [
+            f.attname
+            for f in self.model._meta.concrete_fields
+            if include_vectors or not isinstance(f, VECTOR_FIELDS)
+        ]
+        return columns + list(self.query.annotation_select)
+
+    def iter_rows(
+        self,
+        *args: Union[str, tuple[str, str]],
+        include_vectors: bool = False,
+        chunk_size: int = 10000,
+        **kwargs,
+    ) -> Iterator[tuple[list[str], list[tuple]]]:
+        """
+        Stream (column names, rows) in chunks from a server side cursor.
+        Arguments are as for df.
+        """
+        rename_map = {x[0]: x[1] for x in args if isinstance(x, tuple)}
+        items = [x[0] if isinstance(x, tuple) else x for x in args]
+        qs = self.annotate(**kwargs) if kwargs else self
+        if not items and not kwargs:
+            items = qs.default_columns(include_vectors)
+        items += list(kwargs)
+        columns = [rename_map.get(x, x) for x in items]
+
+        chunk: list[tuple] = []
+        yielded = False
+        for row in qs.values_list(*items).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield columns, chunk
+                yielded = True
+                chunk = []
+        if chunk or not yielded:
+            # always yield at least once so empty results still have columns
+            yield columns, chunk
+
+    def iter_df(
+        self,
+        *args: Union[str, tuple[str, str]],
+        include_vectors: bool = False,
+        chunk_size: int = 10000,
+        **kwargs,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yield dataframes of at most chunk_size rows, so memory stays bounded
+        for very large result sets.
+        """
+        import pandas as pd
+
+        for columns, rows in self.iter_rows(
+            *args, include_vectors=include_vectors, chunk_size=chunk_size, **kwargs
+        ):
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    def arrow(
+        self,
+        *args: Union[str, tuple[str, str]],
+        include_vectors: bool = False,
+        chunk_size: int = 10000,
+        **kwargs,
+    ) -> pa.Table:
+        """
+        Build an arrow table directly from the cursor chunks.
+        Arguments are as for df.
+        """
+        import pyarrow as pa
+
+        batches = []
+        columns: list[str] = []
+        for columns, rows in self.iter_rows(
+            *args, include_vectors=include_vectors, chunk_size=chunk_size, **kwargs
+        ):
+            if rows:
+                arrays = [pa.array(list(values)) for values in zip(*rows)]
+                batches.append(pa.RecordBatch.from_arrays(arrays, names=columns))
+        if not batches:
+            return pa.table({column: [] for column in columns})
+        return pa.Table.from_batches(batches)
+
+    def df(
+        self,
+        *args: Union[str, tuple[str, str]],
+        include_vectors: bool = False,
+        chunk_size: int = 10000,
+        arrow: bool = False,
+        **kwargs,
+    ) -> pd.DataFrame:
         """
         Args will be passed to queryset.values.
         A tuple can be passed to rename a field in the dataframe.
         e.g. ("field_in_other_model__name", "model_name")
         will return a model name
+
+        With no args, all fields apart from the vector fields are returned
+        (set include_vectors to get these as well).
+        Rows are fetched in chunks with a server side cursor.
+        If arrow is set, the frame is converted from an arrow table rather
+        than built up from python rows.
         """
-        rename_map = {x[0]: x[1] for x in args if isinstance(x, tuple)}
-        items = [x[0] if isinstance(x, tuple) else x for x in args]
+        if arrow:
+            return self.arrow(
+                *args, include_vectors=include_vectors, chunk_size=chunk_size, **kwargs
+            ).to_pandas()
+        frames = list(
+            self.iter_df(
+                *args, include_vectors=include_vectors, chunk_size=chunk_size, **kwargs
+            )
+        )
+        if len(frames) == 1:
+            return frames[0]
+
+        import pandas as pd
+
+        return pd.concat(frames, ignore_index=True)
+
+
+def text_hash(text: str) -> str:
+    """
+    md5 hex digest of a text, matching postgres' md5(text).
+    """
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+class CanonicalTextQuerySet(DistanceQuerySet):
+    def occurrences(self) -> DistanceQuerySet[ParagraphVector]:
+        """
+        Expand canonical texts (e.g. the result of search_distance) into
+        the paragraphs they occur in, keeping the distance to the search.
+        """
+        if "distance" not in self.query.annotations:
+            return ParagraphVector.objects.using(self.db).filter(
+                canonical__in=self.values("pk")
+            )
+        distances = dict(self.values_list("pk", "distance"))
         return (
-            self.values(*items, **kwargs).pipe(pd.DataFrame).rename(columns=rename_map)  # type: ignore
+            ParagraphVector.objects.using(self.db)
+            .filter(canonical_id__in=list(distances))
+            .annotate(
+                distance=Case(
+                    *[
+                        When(canonical_id=pk, then=Value(float(distance)))
+                        for pk, distance in distances.items()
+                    ],
+                    output_field=FloatField(),
+                )
+            )
+            .order_by("distance", "id")
         )
 
 
+class CanonicalText(models.Model):
+    """
+    Each distinct paragraph text once, with its embedding.
+    Procedural text repeats many thousands of times, so storing the
+    embedding and HNSW index here rather than per paragraph makes both
+    much smaller. ParagraphVector rows are occurrences that refer to one
+    of these, and paragraph searches join through to it.
+    """
+
+    text_hash = models.CharField(max_length=32, unique=True)
+    text = models.TextField()
+    embedding: FloatArray384 = field(VectorField, dimensions=384)
+    objects: CanonicalTextQuerySet[CanonicalText] = CanonicalTextQuerySet.as_manager()  # type: ignore
+
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="canonical_nhsw_index",
+                fields=["embedding"],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
+
+    @classmethod
+    def ids_for(
+        cls, texts: list[str], embeddings: list, using: str = "default"
+    ) -> list[int]:
+        """
+        ids of the canonical rows for texts, creating any that are new.
+        using should be the shard the paragraphs are stored on.
+        """
+        hashes = [text_hash(text) for text in texts]
+        new = {}
+        for digest, text, embedding in zip(hashes, texts, embeddings):
+            new.setdefault(
+                digest, cls(text_hash=digest, text=text, embedding=embedding)
+            )
+        cls.objects.using(using).bulk_create(
+            list(new.values()), ignore_conflicts=True, batch_size=1000
+        )
+        ids = dict(
+            cls.objects.using(using)
+            .filter(text_hash__in=list(new))
+            .values_list("text_hash", "id")
+        )
+        return [ids[digest] for digest in hashes]
+
+    @classmethod
+    def prune(cls, ids: Optional[list[int]] = None, using: str = "default") -> int:
+        """
+        Delete canonical texts no paragraph refers to any more, only
+        checking ids if given. Returns the number deleted.
+        """
+        table = cls._meta.db_table
+        paragraph_table = ParagraphVector._meta.db_table
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE FROM {table} canonical
+                WHERE (%s::bigint[] IS NULL OR canonical.id = ANY(%s::bigint[]))
+                AND NOT EXISTS (
+                    SELECT 1 FROM {paragraph_table} paragraph
+                    WHERE paragraph.canonical_id = canonical.id
+                )
+                """,
+                [ids, ids],
+            )
+            return cursor.rowcount
+
+
 class ParagraphVector(models.Model):
     source_file = models.CharField()
     speech_id = models.CharField()
     text = models.TextField()
     transcript_type = models.CharField()
     chamber_type = models.CharField()
-    embedding: FloatArray384 = field(VectorField, dimensions=384)
+    # id of the heading this paragraph falls under, see tools.aggregates
+    section_id = models.CharField(default="", blank=True)
+    embedding_reduced: FloatArray384 = field(
+        VectorField, dimensions=REDUCED_DIMENSIONS, null=True
+    )
+    # the text and its embedding, stored once however often it occurs
+    canonical = models.ForeignKey(
+        CanonicalText,
+        on_delete=models.PROTECT,
+        related_name="occurrences",
+    )
     objects: DistanceQuerySet[ParagraphVector] = DistanceQuerySet.as_manager()  # type: ignore
 
+    # searches join through to the embedding, see DistanceQuerySet.embedding_field
+    embedding_field = "canonical__embedding"
+
+    # generated tsvector column added in migration 0007, used by hybrid_search
+    text_search_column = "text_search"
+
+    # rows are split across databases by VectorShardRouter
+    sharded = True
+
     class Meta:
         indexes = [
             HnswIndex(
-                name="nhsw_index",
-                fields=["embedding"],
-                m=16,
-                ef_construction=64,
+                name="reduced_nhsw_index",
+                fields=["embedding_reduced"],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
                 opclasses=["vector_cosine_ops"],
             ),
+            models.Index(name="paragraph_section_index", fields=["section_id"]),
         ]
 
+    @classmethod
+    def carry_over_versions(
+        cls,
+        source_file: str,
+        df: pd.DataFrame,
+        redirects: list[tuple[str, str, str]],
+        using: str,
+    ) -> set[tuple[str, str]]:
+        """
+        When a new version of a day's transcript is loaded (e.g. ...10b.xml
+        over ...10a.xml), renumbered ids in the earlier version's rows are
+        updated from the gid redirects, and rows whose id and text are
+        unchanged move to the new file rather than being deleted and
+        inserted again. Anything else from the earlier version is removed.
+        Returns the (speech_id, text) pairs kept.
+        """
+        day = file_day(source_file)
+
+        def earlier_versions(model: type[models.Model]) -> list[str]:
+            return [
+                x
+                for x in model.objects.using(using)
+                .filter(source_file__startswith=day)
+                .values_list("source_file", flat=True)
+                .distinct()
+                if x < source_file and file_day(x) == day
+            ]
+
+        # aggregates are written as soon as a file is ingested, so they can
+        # exist for an earlier version whose paragraphs haven't been
+        AggregateVector.objects.using(using).filter(
+            source_file__in=earlier_versions(AggregateVector)
+        ).delete()
+        earlier = earlier_versions(cls)
+        if not earlier:
+            return set()
+
+        table = cls._meta.db_table
+        old_gids = [old for old, _, _ in redirects]
+        new_gids = [new for _, new, _ in redirects]
+        with connections[using].cursor() as cursor:
+            if redirects:
+                # speech ids keep their '#pid' suffix
+                cursor.execute(
+                    f"""
+                    UPDATE {table} p
+                    SET speech_id = r.new_gid || substr(p.speech_id, length(r.old_gid) + 1)
+                    FROM unnest(%s::text[], %s::text[]) AS r(old_gid, new_gid)
+                    WHERE p.source_file = ANY(%s)
+                        AND split_part(p.speech_id, '#', 1) = r.old_gid
+                    """,
+                    [old_gids, new_gids, earlier],
+                )
+                cursor.execute(
+                    f"""
+                    UPDATE {table} p SET section_id = r.new_gid
+                    FROM unnest(%s::text[], %s::text[]) AS r(old_gid, new_gid)
+                    WHERE p.source_file = ANY(%s) AND p.section_id = r.old_gid
+                    """,
+                    [old_gids, new_gids, earlier],
+                )
+            cursor.execute(
+                f"""
+                UPDATE {table} p SET source_file = %s, section_id = n.section_id
+                FROM unnest(%s::text[], %s::text[], %s::text[])
+                    AS n(speech_id, text, section_id)
+                WHERE p.source_file = ANY(%s)
+                    AND p.speech_id = n.speech_id AND p.text = n.text
+                RETURNING p.speech_id, p.text
+                """,
+                [
+                    source_file,
+                    df["id"].tolist(),
+                    df["text"].tolist(),
+                    df["section_id"].fillna("").tolist()
+                    if "section_id" in df.columns
+                    else [""] * len(df),
+                    earlier,
+                ],
+            )
+            kept = set(cursor.fetchall())
+            cursor.execute(
+                f"SELECT id FROM {table} WHERE source_file = ANY(%s)", [earlier]
+            )
+            removed = [x[0] for x in cursor.fetchall()]
+            ParagraphNeighbours.invalidate(removed, using=using)
+            cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s)", [removed])
+        return kept
+
     @classmethod
     def ingest_df(
-        cls, *, source_file: str, df: pd.DataFrame, verbose: bool = True, defer=False
+        cls,
+        *,
+        source_file: str,
+        df: pd.DataFrame,
+        verbose: bool = True,
+        defer=False,
+        redirects: Optional[list[tuple[str, str, str]]] = None,
     ):
-        # delete existing records for this source file
-
+        """
+        Load one file's paragraphs (id, text, embedding, ...) onto its shard,
+        replacing any earlier load of the file. redirects are the file's
+        (oldgid, newgid, matchtype) gid redirects, see carry_over_versions.
+        With defer the new rows and aggregates aren't written, and the
+        PendingLoad is returned to pass to write_loads in a batch.
+        """
         if verbose:
             print(f"Loading {len(df)} records for {source_file}")
 
-        cls.objects.filter(source_file=source_file).delete()
+        # all paragraphs from one file share a chamber and date, so a shard
+        alias = (
+            shard_for(df["chamber_type"].iloc[0], source_file) if len(df) else "default"
+        )
+        # canonical texts of this day's rows, which may be left unused
+        # once this file replaces them, see write_loads
+        replaced_canonical_ids = list(
+            cls.objects.using(alias)
+            .filter(source_file__startswith=file_day(source_file))
+            .values_list("canonical_id", flat=True)
+            .distinct()
+        )
+        # delete existing records for this source file
+        existing = cls.objects.using(alias).filter(source_file=source_file)
+        ParagraphNeighbours.invalidate(
+            list(existing.values_list("id", flat=True)), using=alias
+        )
+        existing.delete()
+        if redirects:
+            SpeechRedirect.record(redirects, source_file)
+        kept = cls.carry_over_versions(source_file, df, redirects or [], using=alias)
+        if verbose and kept:
+            print(f"Kept {len(kept)} unchanged paragraphs from earlier versions")
         to_create: list[cls] = []
 
-        for _, row in df.iterrows():
+        # keep the coarse index up to date if a projection has been fitted
+        projection = get_projection(REDUCED_DIMENSIONS)
+        reduced = (
+            projection.transform(np.stack(df["embedding"].tolist()))
+            if projection is not None and len(df)
+            else [None] * len(df)
+        )
+
+        # link each paragraph to the single stored copy of its text
+        canonical_ids = CanonicalText.ids_for(
+            df["text"].tolist(), df["embedding"].tolist(), using=alias
+        )
+
+        for (_, row), embedding_reduced, canonical_id in zip(
+            df.iterrows(), reduced, canonical_ids
+        ):
             to_create.append(
                 cls(
                     source_file=source_file,
@@ -95,13 +1039,146 @@ class ParagraphVector(models.Model):
                     text=row["text"],
                     transcript_type=row["transcript_type"],
                     chamber_type=row["chamber_type"],
-                    embedding=row["embedding"],
+                    section_id=row.get("section_id") or "",
+                    embedding_reduced=embedding_reduced,
+                    canonical_id=canonical_id,
                 )
             )
+        load = PendingLoad(
+            source_file=source_file,
+            alias=alias,
+            records=[x for x in to_create if (x.speech_id, x.text) not in kept],
+            paragraphs=to_create,
+            embeddings=df["embedding"].tolist(),
+            replaced_canonical_ids=replaced_canonical_ids,
+        )
         if defer:
-            return to_create
+            return load
         else:
-            cls.objects.bulk_create(to_create)
+            write_loads([load])
+
+
+class PendingLoad(NamedTuple):
+    """
+    One file from ParagraphVector.ingest_df: the records still to insert,
+    all its paragraphs (including those kept from an earlier version) and
+    their embeddings to aggregate once they are in, and the canonical
+    texts of the rows it replaced, to prune if nothing else uses them.
+    """
+
+    source_file: str
+    alias: str
+    records: list[ParagraphVector]
+    paragraphs: list[ParagraphVector]
+    embeddings: list[FloatArray384]
+    replaced_canonical_ids: list[int]
+
+
+def write_loads(loads: list[PendingLoad]) -> dict[str, int]:
+    """
+    Insert the paragraphs of each load, then its aggregates, and prune
+    the canonical texts it left unused, in one transaction per shard, so
+    searches never see aggregates without their paragraphs. Pruning waits
+    until now as the new rows may reuse a replaced text.
+    Returns the number of paragraphs created per alias.
+    """
+    by_alias: dict[str, list[PendingLoad]] = {}
+    for load in loads:
+        by_alias.setdefault(load.alias, []).append(load)
+    created = {}
+    for alias, shard_loads in by_alias.items():
+        with transaction.atomic(using=alias):
+            records = [x for load in shard_loads for x in load.records]
+            ParagraphVector.objects.using(alias).bulk_create(records)
+            for load in shard_loads:
+                AggregateVector.replace_for_source(
+                    load.source_file, load.paragraphs, load.embeddings, using=alias
+                )
+            CanonicalText.prune(
+                [x for load in shard_loads for x in load.replaced_canonical_ids],
+                using=alias,
+            )
+        created[alias] = len(records)
+    if by_alias:
+        bump_search_generation(ParagraphVector)
+        bump_search_generation(CanonicalText)
+    return created
+
+
+class AggregateVector(models.Model):
+    """
+    Normalized mean of the paragraph embeddings of one speech or one
+    section, for finding whole speeches or debates before paragraphs.
+    """
+
+    level = models.CharField(choices=[(SPEECH, "Speech"), (SECTION, "Section")])
+    key = models.CharField()
+    source_file = models.CharField()
+    transcript_type = models.CharField()
+    chamber_type = models.CharField()
+    paragraph_count = models.IntegerField()
+    embedding: FloatArray384 = field(VectorField, dimensions=384)
+    objects: DistanceQuerySet[AggregateVector] = DistanceQuerySet.as_manager()  # type: ignore
+
+    # stored on the same shard as their paragraphs
+    sharded = True
+
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="speech_nhsw_index",
+                fields=["embedding"],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                opclasses=["vector_cosine_ops"],
+                condition=Q(level=SPEECH),
+            ),
+            HnswIndex(
+                name="section_nhsw_index",
+                fields=["embedding"],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                opclasses=["vector_cosine_ops"],
+                condition=Q(level=SECTION),
+            ),
+            models.Index(name="aggregate_source_index", fields=["source_file"]),
+        ]
+
+    @classmethod
+    def replace_for_source(
+        cls,
+        source_file: str,
+        paragraphs: list[ParagraphVector],
+        embeddings: list[FloatArray384],
+        using: str,
+    ) -> int:
+        """
+        Recompute the aggregates of one source file from its paragraphs
+        and their embeddings.
+        """
+        cls.objects.using(using).filter(source_file=source_file).delete()
+        if not paragraphs:
+            return 0
+        first = paragraphs[0]
+        aggregates = [
+            cls(
+                level=aggregate.level,
+                key=aggregate.key,
+                source_file=source_file,
+                transcript_type=first.transcript_type,
+                chamber_type=first.chamber_type,
+                paragraph_count=aggregate.paragraph_count,
+                embedding=aggregate.embedding,
+            )
+            for aggregate in aggregate_embeddings(
+                [x.speech_id for x in paragraphs],
+                [x.section_id for x in paragraphs],
+                embeddings,
+            )
+        ]
+        cls.objects.using(using).bulk_create(aggregates)
+        bump_search_generation(cls)
+        return len(aggregates)
 
 
 class NgramVector(models.Model):
@@ -115,8 +1192,125 @@ class NgramVector(models.Model):
             HnswIndex(
                 name="ngram_nhsw_index",
                 fields=["embedding"],
-                m=16,
-                ef_construction=64,
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
                 opclasses=["vector_cosine_ops"],
             ),
         ]
+
+
+class NgramCountUpdate(models.Model):
+    """
+    A count file already added to the n-gram counts by update_ngrams,
+    recorded in the same transaction as the counts, so an interrupted
+    update can be re-run without adding the counts twice.
+    """
+
+    digest = models.CharField(primary_key=True)
+    source = models.CharField()
+    applied = models.DateTimeField(auto_now_add=True)
+
+
+class NeighbourList(models.Model):
+    """
+    The k nearest rows to one row, nearest first, with their distances.
+    Filled by the build_neighbours command.
+    """
+
+    neighbour_ids = ArrayField(models.BigIntegerField())
+    distances = ArrayField(models.FloatField())
+
+    class Meta:
+        abstract = True
+        indexes = [GinIndex(name="%(class)s_ids_index", fields=["neighbour_ids"])]
+
+    @classmethod
+    def invalidate(cls, ids: list[int], using: str = "default") -> int:
+        """
+        Delete the lists of these rows and every list they appear in, before
+        the rows are removed, so build_neighbours fills them in again.
+        """
+        if not ids:
+            return 0
+        deleted, _ = (
+            cls.objects.using(using)
+            .filter(Q(source_id__in=ids) | Q(neighbour_ids__overlap=ids))
+            .delete()
+        )
+        return deleted
+
+
+class ParagraphNeighbours(NeighbourList):
+    source = models.OneToOneField(
+        ParagraphVector,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="neighbours",
+    )
+
+
+class NgramNeighbours(NeighbourList):
+    source = models.OneToOneField(
+        NgramVector,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="neighbours",
+    )
+
+
+class SpeechRedirect(models.Model):
+    """
+    TheyWorkForYou gid redirects (old speech or heading id -> new id)
+    recorded when files are loaded, so ids in saved results still resolve
+    after speeches are renumbered. Kept on the default database.
+    """
+
+    old_gid = models.CharField(unique=True)
+    new_gid = models.CharField()
+    match_type = models.CharField()
+    source_file = models.CharField()
+
+    @classmethod
+    def record(cls, redirects: list[tuple[str, str, str]], source_file: str):
+        cls.objects.bulk_create(
+            [
+                cls(
+                    old_gid=old,
+                    new_gid=new,
+                    match_type=match_type,
+                    source_file=source_file,
+                )
+                for old, new, match_type in redirects
+            ],
+            update_conflicts=True,
+            unique_fields=["old_gid"],
+            update_fields=["new_gid", "match_type", "source_file"],
+        )
+
+    @classmethod
+    def resolve(cls, gid: str, max_hops: int = 10) -> str:
+        """
+        Current id for a speech or paragraph id (keeping any '#pid'),
+        following chains of redirects.
+        """
+        key, _, pid = gid.partition("#")
+        for _ in range(max_hops):
+            new_gid = (
+                cls.objects.filter(old_gid=key)
+                .values_list("new_gid", flat=True)
+                .first()
+            )
+            if new_gid is None or new_gid == key:
+                break
+            key = new_gid
+        return f"{key}#{pid}" if pid else key
+
+
+class SearchGeneration(models.Model):
+    """
+    Counter per vector model, bumped whenever rows are ingested.
+    Cached search results from an older generation are not used.
+    """
+
+    label = models.CharField(primary_key=True)
+    generation = models.BigIntegerField(default=0)
@@ -0,0 +1,63 @@
+"""
+Speech and section level vectors built from paragraph embeddings.
+
+A paragraph's speech_id is the speech id with '#<pid>' appended, and its
+section_id is the id of the heading (major or minor) it falls under.
+Aggregates are the normalized mean of their paragraphs' embeddings,
+so no further model calls are needed.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+SPEECH = "speech"
+SECTION = "section"
+
+LEVELS = [SPEECH, SECTION]
+
+
+def speech_key(paragraph_id: str) -> str:
+    """
+    e.g. uk.org.publicwhip/debate/2023-01-10a.100.1#g100.2 -> ...2023-01-10a.100.1
+    """
+    return paragraph_id.split("#", 1)[0]
+
+
+def normalized_mean(embeddings: np.ndarray) -> np.ndarray:
+    mean = embeddings.mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm else mean
+
+
+class Aggregate(NamedTuple):
+    level: str
+    key: str
+    paragraph_count: int
+    embedding: np.ndarray
+
+
+def aggregate_embeddings(
+    paragraph_ids: Sequence[str],
+    section_ids: Sequence[str],
+    embeddings: Sequence[np.ndarray],
+) -> list[Aggregate]:
+    """
+    One aggregate per speech and one per section. Headings are only part
+    of their section, and paragraphs without a section only of their speech.
+    """
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i, (paragraph_id, section_id) in enumerate(zip(paragraph_ids, section_ids)):
+        key = speech_key(paragraph_id)
+        if key != section_id:
+            groups.setdefault((SPEECH, key), []).append(i)
+        if section_id:
+            groups.setdefault((SECTION, section_id), []).append(i)
+
+    stacked = np.asarray(embeddings, dtype=np.float32)
+    return [
+        Aggregate(level, key, len(rows), normalized_mean(stacked[rows]))
+        for (level, key), rows in groups.items()
+    ]
@@ -0,0 +1,95 @@
+"""
+Small pool of async psycopg connections for the search API.
+
+Django's async ORM runs queries one at a time on a single thread,
+so concurrent vector searches use their own connections instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import psycopg
+from psycopg.pq import TransactionStatus
+
+
+def conninfo_from_settings(database: dict[str, Any]) -> dict[str, Any]:
+    """
+    psycopg connection arguments from a Django DATABASES entry.
+    """
+    options = {
+        "dbname": database.get("NAME"),
+        "user": database.get("USER"),
+        "password": database.get("PASSWORD"),
+        "host": database.get("HOST"),
+        "port": database.get("PORT"),
+    }
+    return {key: value for key, value in options.items() if value}
+
+
+class AsyncConnectionPool:
+    """
+    Hands out up to max_size connections, reusing idle ones.
+    Connections that error, or whose task is cancelled mid query,
+    are closed rather than returned.
+    """
+
+    def __init__(self, conninfo: dict[str, Any], max_size: int = 10):
+        self.conninfo = conninfo
+        self.max_size = max_size
+        self._idle: list[psycopg.AsyncConnection] = []
+        self._slots = asyncio.Semaphore(max_size)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[psycopg.AsyncConnection]:
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            if conn is None or conn.closed:
+                conn = await psycopg.AsyncConnection.connect(
+                    autocommit=True, **self.conninfo
+                )
+            reusable = False
+            try:
+                yield conn
+                reusable = (
+                    not conn.closed
+                    and conn.info.transaction_status == TransactionStatus.IDLE
+                )
+            finally:
+                # CancelledError isn't an Exception, so this runs on
+                # cancellation too and the connection is never leaked
+                if reusable:
+                    self._idle.append(conn)
+                else:
+                    await conn.close()
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+_pools: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, AsyncConnectionPool]
+] = weakref.WeakKeyDictionary()
+
+
+def get_pool(
+    database: dict[str, Any],
+    max_size: int = 10,
+    ef_search: int = 40,
+    alias: str = "default",
+) -> AsyncConnectionPool:
+    """
+    Shared pool for the database alias on the running event loop.
+    ef_search is set on each connection, and should be at least the
+    largest number of rows wanted from the HNSW index.
+    """
+    pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    if alias not in pools:
+        conninfo = conninfo_from_settings(database)
+        conninfo["options"] = f"-c hnsw.ef_search={ef_search}"
+        pools[alias] = AsyncConnectionPool(conninfo, max_size=max_size)
+    return pools[alias]
@@ -0,0 +1,95 @@
+"""
+Collect concurrent embedding requests into micro-batches, so a web
+worker embeds many queries in one model call rather than one at a time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import weakref
+from typing import Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .inference import Inference, get_local_inference
+
+
+class EmbeddingBatcher:
+    """
+    Queue texts and embed them together once max_batch_size texts are waiting
+    or max_wait seconds have passed since the first one arrived.
+    Model calls run in a thread so the event loop keeps accepting requests.
+    """
+
+    def __init__(
+        self,
+        inference: Inference,
+        max_batch_size: int = 32,
+        max_wait: float = 0.01,
+    ):
+        self.inference = inference
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.texts = 0
+        self._queue: asyncio.Queue[tuple[str, asyncio.Future]] = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> NDArray[np.float64]:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await loop.run_in_executor(
+                    None, self.inference.query_cached, texts
+                )
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+
+# asyncio queues belong to one event loop, so keep a batcher per loop
+_batchers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, EmbeddingBatcher] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_batcher(max_batch_size: int = 32, max_wait: float = 0.01) -> EmbeddingBatcher:
+    """
+    Shared batcher for the running event loop, using the local model.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _batchers:
+        _batchers[loop] = EmbeddingBatcher(
+            get_local_inference(), max_batch_size=max_batch_size, max_wait=max_wait
+        )
+    return _batchers[loop]
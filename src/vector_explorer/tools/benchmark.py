@@ -0,0 +1,197 @@
+"""
+Small helpers for recall and latency benchmarks of the vector indexes.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Sequence, TypeVar
+
+from django.db import connections, models, transaction
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+def recall_at_k(
+    truth: Sequence[Sequence[int]], found: Sequence[Sequence[int]]
+) -> float:
+    """
+    Mean fraction of the true top-k ids that were found, per query.
+    """
+    if not truth:
+        return 0.0
+    scores = []
+    for true_ids, found_ids in zip(truth, found):
+        if not true_ids:
+            continue
+        scores.append(len(set(true_ids) & set(found_ids)) / len(true_ids))
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def exact_top_k(
+    ids: Sequence[int], embeddings: np.ndarray, queries: np.ndarray, k: int
+) -> list[list[int]]:
+    """
+    Ground truth ids of the k nearest embeddings by cosine similarity,
+    by brute force, for each query.
+    """
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    query_normed = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    similarity = query_normed @ normed.T
+    return [[ids[i] for i in row] for row in np.argsort(-similarity, axis=1)[:, :k]]
+
+
+def timed(func: Callable[[], T]) -> tuple[T, float]:
+    """
+    Run func and return the result and the seconds taken.
+    """
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def latency_summary(seconds: Sequence[float]) -> dict[str, float]:
+    """
+    Percentile summary of a list of latencies, in milliseconds.
+    """
+    if not seconds:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def sample_embeddings(
+    model: type[models.Model], n: int, using: str = "default"
+) -> tuple[list[int], np.ndarray]:
+    """
+    Ids and embeddings of n random rows of model on one database.
+    """
+    from vector_explorer.models import embedding_model
+
+    rows_query = model.objects.using(using)  # type: ignore
+    ids = list(rows_query.order_by("?").values_list("id", flat=True)[:n])
+    rows = list(
+        rows_query.filter(id__in=ids).values_list("id", rows_query.embedding_field)
+    )
+    if not rows:
+        stored = embedding_model(model)
+        dimensions = stored._meta.get_field("embedding").dimensions  # type: ignore
+        return [], np.empty((0, dimensions), dtype=np.float32)
+    return [x[0] for x in rows], np.stack([x[1] for x in rows])
+
+
+def create_sample_table(
+    name: str,
+    ids: list[int],
+    columns: dict[str, np.ndarray],
+    using: str = "default",
+):
+    """
+    (Re)create a temporary table of ids and one vector column per entry
+    in columns, so indexes can be built and dropped without touching the
+    real tables.
+    """
+    from vector_explorer.models import vector_literal
+
+    definitions = ", ".join(
+        f"{column} vector({values.shape[1]})" for column, values in columns.items()
+    )
+    names = ", ".join(columns)
+    casts = ", ".join(f"{column}::vector" for column in columns)
+    arrays = ", ".join("%s::text[]" for _ in columns)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+        cursor.execute(f"CREATE TEMP TABLE {name} (id bigint, {definitions})")
+        cursor.execute(
+            f"""
+            INSERT INTO {name} (id, {names})
+            SELECT id, {casts} FROM unnest(%s::bigint[], {arrays}) AS v(id, {names})
+            """,
+            [
+                ids,
+                *[[vector_literal(x) for x in values] for values in columns.values()],
+            ],
+        )
+
+
+def build_sample_index(
+    name: str,
+    column: str,
+    using: str = "default",
+    m: int | None = None,
+    ef_construction: int | None = None,
+) -> tuple[float, float]:
+    """
+    (Re)build the HNSW index {name}_index on one column of a sample table.
+    Returns the seconds taken and the index size in MB.
+    """
+    options = {"m": m, "ef_construction": ef_construction}
+    storage = ", ".join(f"{k} = {v}" for k, v in options.items() if v is not None)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}_index")
+        _, seconds = timed(
+            lambda: cursor.execute(
+                f"CREATE INDEX {name}_index ON {name} "
+                f"USING hnsw ({column} vector_cosine_ops)"
+                + (f" WITH ({storage})" if storage else "")
+            )
+        )
+    return seconds, index_megabytes(f"{name}_index", using)
+
+
+def index_megabytes(name: str, using: str = "default") -> float:
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT pg_relation_size(%s::regclass)", [name])
+        return cursor.fetchone()[0] / 1024 / 1024
+
+
+def drop_sample_table(name: str, using: str = "default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+@contextmanager
+def index_scan(using: str = "default") -> Iterator:
+    """
+    A transaction where the planner avoids sequential scans. Benchmark
+    tables are often small enough that a scan and sort looks cheaper,
+    which would measure exact search rather than the index.
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        yield cursor
+
+
+def index_scan_ids(sql: str, params: list, using: str = "default") -> list[int]:
+    """
+    The first column of each row of sql, run inside index_scan.
+    """
+    with index_scan(using) as cursor:
+        cursor.execute(sql, params)
+        return [x[0] for x in cursor.fetchall()]
+
+
+def check_index_used(plan: str, index_name: str):
+    """
+    Raise if the query plan doesn't use index_name, as the timings would
+    then be for a different search than the one being benchmarked.
+    """
+    if index_name not in plan:
+        raise ValueError(f"Benchmark queries are not using {index_name}:\n{plan}")
+
+
+def query_plan(sql: str, params: list, using: str = "default") -> str:
+    """
+    The plan for sql as run by index_scan_ids.
+    """
+    with index_scan(using) as cursor:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return "\n".join(x[0] for x in cursor.fetchall())
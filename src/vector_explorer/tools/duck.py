@@ -0,0 +1,186 @@
+"""
+DuckDB layer over the per-day embedding parquet files.
+
+The parquet files written by `XMLManager.infer_missing` (only the latest
+version of each day) are registered as a single `paragraphs` view,
+so analytical sweeps across years can run as one vectorised query
+without loading the vectors into postgres or pandas.
+Divisions and votes from the extract_votes command are added as
+`divisions` and `votes` views.
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Union
+
+import duckdb
+import pandas as pd
+from vector_explorer.data_manager import TranscriptXMl, data_dir
+from vector_explorer.tools.inference import get_local_inference
+from vector_explorer.tools.sharding import latest_versions
+from vector_explorer.tools.votes import votes_dir
+
+EMBEDDING_DIMENSIONS = 384
+
+# Expressions that can be used to group hits in `DuckSearch.hits_per`
+GROUPINGS = {
+    "year": "year(date)",
+    "month": "date_trunc('month', date)",
+    "date": "date",
+    "chamber_type": "chamber_type",
+    "transcript_type": "transcript_type",
+    "source_file": "source_file",
+}
+
+
+class DuckSearch:
+    """
+    Search and aggregate over the embedding parquet files with duckdb.
+
+    e.g.
+    duck = DuckSearch(chamber="uk_commons")
+    duck.hits_per("mental health", threshold=0.3, by="year")
+    """
+
+    def __init__(
+        self,
+        chamber: Optional[str] = None,
+        transcript: Optional[str] = None,
+        pattern: str = "",
+        database: str = ":memory:",
+    ):
+        self.chamber = chamber
+        self.transcript = transcript
+        self.pattern = pattern
+        self.con = duckdb.connect(database)
+        self.register_view()
+        self.register_vote_views()
+
+    def parquet_sources(self) -> list[tuple[list[str], str, str]]:
+        """
+        Return (files, chamber_type, transcript_type) for every transcript
+        format that has at least one embedding file. Only the latest version
+        of each day is included (e.g. ...10b.parquet, not ...10a.parquet),
+        as each version holds the whole day.
+        """
+        sources = []
+        for manager in TranscriptXMl.get_transcript_manager(
+            chamber=self.chamber, transcript=self.transcript
+        ):
+            dest_dir = data_dir / manager.relative_path
+            file_glob = f"{manager.file_structure_pre_date}{self.pattern}*.parquet"
+            files = latest_versions(dest_dir.glob(file_glob))
+            if not files:
+                continue
+            sources.append(
+                (
+                    [str(x) for x in files],
+                    str(manager.chamber_type),
+                    str(manager.transcript_type),
+                )
+            )
+        return sources
+
+    def register_view(self):
+        """
+        Create the `paragraphs` view as a union of the embedding files.
+        """
+        sources = self.parquet_sources()
+        if not sources:
+            raise ValueError(f"No embedding parquet files found in {data_dir}")
+
+        selects = []
+        for files, chamber_type, transcript_type in sources:
+            selects.append(
+                f"""
+                SELECT
+                    regexp_extract(filename, '[^/]+$') AS source_file,
+                    id AS speech_id,
+                    text,
+                    '{chamber_type}' AS chamber_type,
+                    '{transcript_type}' AS transcript_type,
+                    TRY_CAST(regexp_extract(filename, '(\\d{{4}}-\\d{{2}}-\\d{{2}})', 1) AS DATE) AS date,
+                    embedding::FLOAT[{EMBEDDING_DIMENSIONS}] AS embedding
+                FROM read_parquet({files!r}, filename = true)
+                """
+            )
+        self.con.execute(
+            "CREATE OR REPLACE VIEW paragraphs AS " + " UNION ALL ".join(selects)
+        )
+
+    def register_vote_views(self):
+        """
+        `divisions` and `votes` views over the datasets written by
+        the extract_votes command, if it has been run.
+        """
+        for name in ["divisions", "votes"]:
+            dataset = votes_dir / name
+            if next(dataset.glob("**/*.parquet"), None) is None:
+                continue
+            self.con.execute(
+                f"""
+                CREATE OR REPLACE VIEW {name} AS
+                SELECT * FROM read_parquet('{dataset}/**/*.parquet', hive_partitioning = true)
+                """
+            )
+
+    def sql(self, query: str, params: Optional[list] = None) -> pd.DataFrame:
+        return self.con.execute(query, params or []).df()
+
+    def embed(self, search_term: str) -> list[float]:
+        embedding = get_local_inference().query([search_term])[0]
+        return [float(x) for x in embedding]
+
+    def distance_relation(self, threshold: float) -> str:
+        """
+        SQL for all paragraphs within threshold of the search term.
+        Expects the embedding to be passed as the first parameter.
+        """
+        return f"""
+            SELECT * EXCLUDE (embedding)
+            FROM (
+                SELECT
+                    *,
+                    1 - array_cosine_similarity(
+                        embedding, ?::FLOAT[{EMBEDDING_DIMENSIONS}]
+                    ) AS distance
+                FROM paragraphs
+            )
+            WHERE distance <= {float(threshold)}
+        """
+
+    def search(
+        self, search_term: str, threshold: float = 0.4, limit: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Cosine distance search over every paragraph, closest first.
+        """
+        query = self.distance_relation(threshold) + " ORDER BY distance"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self.sql(query, [self.embed(search_term)])
+
+    def hits_per(
+        self,
+        search_term: str,
+        threshold: float = 0.4,
+        by: Union[str, list[str]] = "year",
+    ) -> pd.DataFrame:
+        """
+        Count the paragraphs within threshold of the search term,
+        grouped by one or more of the keys in GROUPINGS.
+        """
+        if isinstance(by, str):
+            by = [by]
+        for key in by:
+            if key not in GROUPINGS:
+                raise ValueError(f"Can't group by {key}, options are {list(GROUPINGS)}")
+        group_exprs = ", ".join(f"{GROUPINGS[key]} AS {key}" for key in by)
+        group_keys = ", ".join(by)
+        query = f"""
+            SELECT {group_exprs}, count(*) AS hits, min(distance) AS min_distance
+            FROM ({self.distance_relation(threshold)})
+            GROUP BY ALL
+            ORDER BY {group_keys}
+        """
+        return self.sql(query, [self.embed(search_term)])
@@ -0,0 +1,174 @@
+"""
+Keep HNSW indexes in place while loading new rows.
+
+pgvector updates an HNSW index as rows are inserted, so small daily
+deltas don't need a rebuild. After large changes the index is rebuilt
+with CREATE INDEX CONCURRENTLY under a temporary name and swapped in,
+so search keeps working throughout.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+from django.db import connections, models, transaction
+
+from pgvector.django import HnswIndex
+
+
+class IndexSpec(NamedTuple):
+    name: str
+    table: str
+    column: str
+    opclass: str
+    m: int
+    ef_construction: int
+
+    @classmethod
+    def from_model(cls, model: type[models.Model], name: Optional[str] = None):
+        """
+        Spec for an HnswIndex declared in the model's Meta.indexes
+        (the first one if name isn't given).
+        """
+        for index in model._meta.indexes:
+            if isinstance(index, HnswIndex) and (name is None or index.name == name):
+                return cls(
+                    name=index.name,
+                    table=model._meta.db_table,
+                    column=index.fields[0],
+                    opclass=index.opclasses[0],
+                    m=index.m or 16,
+                    ef_construction=index.ef_construction or 64,
+                )
+        raise ValueError(f"No HNSW index {name or ''} on {model.__name__}")
+
+    def create_sql(self, name: Optional[str] = None, concurrently: bool = False):
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}"
+            f"IF NOT EXISTS {name or self.name} ON {self.table} "
+            f"USING hnsw ({self.column} {self.opclass}) "
+            f"WITH (m = {self.m}, ef_construction = {self.ef_construction});"
+        )
+
+
+def set_maintenance_options(
+    maintenance_work_mem: Optional[str] = None,
+    parallel_workers: Optional[int] = None,
+    using: str = "default",
+):
+    """
+    Session settings for index builds, e.g. maintenance_work_mem="8GB".
+    HNSW builds are much faster when the graph fits in maintenance_work_mem.
+    """
+    with connections[using].cursor() as cursor:
+        if maintenance_work_mem:
+            cursor.execute(
+                "SELECT set_config('maintenance_work_mem', %s, false)",
+                [maintenance_work_mem],
+            )
+        if parallel_workers is not None:
+            cursor.execute(
+                "SELECT set_config('max_parallel_maintenance_workers', %s, false)",
+                [str(parallel_workers)],
+            )
+
+
+class IndexMaintainer:
+    """
+    Wrap a load of new rows:
+
+        maintainer = IndexMaintainer(IndexSpec.from_model(CanonicalText))
+        maintainer.begin()
+        ... insert rows ...
+        maintainer.finish(rows_changed)
+
+    An empty table has its index dropped for the load and built after.
+    Otherwise the index stays in place, and is rebuilt concurrently only
+    if more than rebuild_fraction of the table changed.
+    """
+
+    def __init__(
+        self,
+        spec: IndexSpec,
+        rebuild_fraction: float = 0.2,
+        maintenance_work_mem: Optional[str] = None,
+        parallel_workers: Optional[int] = None,
+        using: str = "default",
+    ):
+        self.spec = spec
+        self.rebuild_fraction = rebuild_fraction
+        self.maintenance_work_mem = maintenance_work_mem
+        self.parallel_workers = parallel_workers
+        self.using = using
+        self.rows_before = 0
+
+    def execute(self, sql: str, params: Optional[list] = None):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if cursor.description else None
+
+    def row_count(self) -> int:
+        return self.execute(f"SELECT count(*) FROM {self.spec.table}")[0]
+
+    def index_exists(self, name: Optional[str] = None) -> bool:
+        return (
+            self.execute(
+                "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                [name or self.spec.name],
+            )
+            is not None
+        )
+
+    def begin(self):
+        self.rows_before = self.row_count()
+        if self.rows_before == 0 and self.index_exists():
+            print(f"{self.spec.table} is empty, dropping {self.spec.name} for the load")
+            self.execute(f"DROP INDEX IF EXISTS {self.spec.name};")
+
+    def should_rebuild(self, rows_changed: int) -> bool:
+        if self.rows_before == 0:
+            return False
+        return rows_changed / self.rows_before > self.rebuild_fraction
+
+    def build(self):
+        set_maintenance_options(
+            self.maintenance_work_mem, self.parallel_workers, self.using
+        )
+        self.execute(self.spec.create_sql())
+
+    def rebuild_concurrently(self):
+        """
+        Build a replacement index alongside the current one, then swap
+        them over in a single transaction.
+        """
+        set_maintenance_options(
+            self.maintenance_work_mem, self.parallel_workers, self.using
+        )
+        new_name = f"{self.spec.name}_new"
+        # an interrupted concurrent build leaves an invalid index behind
+        self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name};")
+        self.execute(self.spec.create_sql(new_name, concurrently=True))
+        with transaction.atomic(using=self.using):
+            self.execute(f"DROP INDEX IF EXISTS {self.spec.name};")
+            self.execute(f"ALTER INDEX {new_name} RENAME TO {self.spec.name};")
+
+    def finish(self, rows_changed: Optional[int] = None) -> str:
+        """
+        Bring the index up to date after the load, returning what was done.
+        rows_changed defaults to the change in the row count.
+        """
+        if rows_changed is None:
+            rows_changed = abs(self.row_count() - self.rows_before)
+        if not self.index_exists():
+            action = "built"
+            self.build()
+        elif self.should_rebuild(rows_changed):
+            action = "rebuilt concurrently"
+            self.rebuild_concurrently()
+        else:
+            action = "kept"
+        print(
+            f"{self.spec.name} {action} "
+            f"({rows_changed} rows changed, {self.rows_before} before)"
+        )
+        return action
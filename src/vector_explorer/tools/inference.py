@@ -1,12 +1,23 @@
+from __future__ import annotations
+
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 
 import numpy as np
-import pandas as pd
-import requests
-from fastembed import TextEmbedding
 from numpy.typing import NDArray
 
+from .cache import LRUCache
+
+if TYPE_CHECKING:
+    # fastembed (via onnxruntime), pandas and requests are imported
+    # on first use, to keep them out of Django startup
+    import pandas as pd
+    from fastembed import TextEmbedding
+
+# embeddings of search queries, keyed by (model_id, text)
+query_cache: LRUCache[tuple[str, str], NDArray[np.float64]] = LRUCache(maxsize=4096)
+
 
 class Inference:
     """
@@ -16,21 +27,45 @@ class Inference:
     """
 
     def __init__(
-        self, model_id: str, hf_token: Optional[str] = None, local: bool = False
+        self,
+        model_id: str,
+        hf_token: Optional[str] = None,
+        local: bool = False,
+        threads: Optional[int] = None,
     ):
         self.model_id: str = model_id
         self.hf_token = hf_token if hf_token else os.environ.get("HF_TOKEN", None)
         self.local = local
+        self.threads = threads
         self._model = None
         if self.hf_token is None and self.local is False:
             raise ValueError("Need to set hf_token for remote embedding generation.")
 
-    def query_local(self, texts: list[str]) -> list[NDArray[np.float64]]:
+    def load(self) -> TextEmbedding:
+        """
+        Create the local model session if it does not exist yet.
+        threads sets both the intra-op and inter-op ONNX thread counts.
+        """
         if self._model is None:
-            self._model = TextEmbedding(model_name=self.model_id)
-        return list(self._model.embed(texts))
+            from fastembed import TextEmbedding
+
+            self._model = TextEmbedding(model_name=self.model_id, threads=self.threads)
+        return self._model
+
+    def warm_up(self):
+        """
+        Load the local model and run one embedding, so the first
+        real query does not pay for session setup.
+        """
+        self.load()
+        self.query_local(["warm up"])
+
+    def query_local(self, texts: list[str]) -> list[NDArray[np.float64]]:
+        return list(self.load().embed(texts))
 
     def query_remote(self, texts: list[str]) -> list[NDArray[np.float64]]:
+        import requests
+
         api_url = f"https://api-inference.huggingface.co/pipeline/feature-extraction/{self.model_id}"
         headers = {"Authorization": f"Bearer {self.hf_token}"}
         response = requests.post(
@@ -41,6 +76,8 @@ class Inference:
         return response.json()
 
     def query_id_and_text(self, id_and_text: dict[str, str]) -> pd.DataFrame:
+        import pandas as pd
+
         id_values = list(id_and_text.keys())
         text_values = list(id_and_text.values())
         embeddings = self.query(text_values)
@@ -55,6 +92,23 @@ class Inference:
             }
         )
 
+    def query_cached(self, texts: list[str]) -> list[NDArray[np.float64]]:
+        """
+        As query, but reusing embeddings of texts seen before.
+        Meant for search terms rather than bulk embedding.
+        """
+        results = [query_cache.get((self.model_id, text)) for text in texts]
+        missing = [text for text, result in zip(texts, results) if result is None]
+        if missing:
+            embedded = dict(zip(missing, self.query(missing)))
+            for text, embedding in embedded.items():
+                query_cache.put((self.model_id, text), embedding)
+            results = [
+                embedded[text] if result is None else result
+                for text, result in zip(texts, results)
+            ]
+        return results  # type: ignore
+
     def query(self, texts: list[str]):
         if len(texts) == 0:
             return []
@@ -62,3 +116,14 @@ class Inference:
             return self.query_local(texts)
         else:
             return self.query_remote(texts)
+
+
+@lru_cache
+def get_local_inference() -> Inference:
+    from django.conf import settings
+
+    return Inference(
+        model_id="BAAI/bge-small-en-v1.5",
+        local=True,
+        threads=getattr(settings, "EMBEDDING_THREADS", None),
+    )
@@ -0,0 +1,330 @@
+"""
+Count word n-grams across a large number of texts with bounded memory.
+
+Worker processes tokenize chunks of text and count n-grams by a 64 bit
+hash of the n-gram rather than by tuples of tokens. When a worker's
+counts reach its entry budget they are written to disk as a run sorted
+by hash, and the runs are summed into one parquet file at the end.
+
+merge_ngram_counts does the same summing for existing ngram, count
+shards, by duckdb or by a k-way merge of sorted runs.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import queue
+import resource
+import sys
+from pathlib import Path
+from typing import Iterable, Iterator, Literal, Optional
+
+# rough bytes per counted n-gram in a worker: dict slots, the int hash
+# and count, and the n-gram text
+BYTES_PER_ENTRY = 200
+
+# chunks of texts waiting for the workers, so the reader can't run ahead
+QUEUE_CHUNKS = 8
+
+
+def ensure_tokenizer():
+    """
+    Download the nltk sentence tokenizer data if it isn't installed,
+    before any workers start.
+    """
+    import nltk
+
+    try:
+        nltk.data.find("tokenizers/punkt_tab")
+    except LookupError:
+        if not nltk.download("punkt_tab", quiet=True):
+            raise RuntimeError("Could not download the nltk punkt_tab tokenizer")
+
+
+def tokenize(text: str) -> list[str]:
+    import nltk
+
+    return [token.lower() for token in nltk.word_tokenize(text)]
+
+
+def ngram_hash(ngram: str) -> int:
+    """
+    Stable signed 64 bit id for an n-gram (fits a parquet int64).
+    """
+    digest = hashlib.blake2b(ngram.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def iter_ngrams(tokens: list[str], min_n: int = 2, max_n: int = 5) -> Iterable[str]:
+    for n in range(min_n, max_n + 1):
+        for start in range(len(tokens) - n + 1):
+            yield " ".join(tokens[start : start + n])
+
+
+class NgramCounter:
+    """
+    Counts for one worker, spilled to spill_dir as sorted parquet runs
+    whenever more than max_entries distinct n-grams are held.
+    """
+
+    def __init__(self, spill_dir: Path, name: str, max_entries: int):
+        self.spill_dir = spill_dir
+        self.name = name
+        self.max_entries = max_entries
+        self.counts: dict[int, int] = {}
+        self.texts: dict[int, str] = {}
+        self.runs: list[Path] = []
+
+    def add_text(self, text: str, min_n: int = 2, max_n: int = 5):
+        for ngram in iter_ngrams(tokenize(text), min_n, max_n):
+            key = ngram_hash(ngram)
+            if key in self.counts:
+                self.counts[key] += 1
+            else:
+                self.counts[key] = 1
+                self.texts[key] = ngram
+        if len(self.counts) >= self.max_entries:
+            self.spill()
+
+    def spill(self):
+        if not self.counts:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        keys = sorted(self.counts)
+        table = pa.table(
+            {
+                "hash": pa.array(keys, pa.int64()),
+                "ngram": [self.texts[key] for key in keys],
+                "count": pa.array([self.counts[key] for key in keys], pa.int64()),
+            }
+        )
+        path = self.spill_dir / f"{self.name}_{len(self.runs):05d}.parquet"
+        pq.write_table(table, path)
+        self.runs.append(path)
+        self.counts = {}
+        self.texts = {}
+
+
+def count_worker(
+    name: str,
+    tasks: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    spill_dir: Path,
+    max_entries: int,
+    min_n: int,
+    max_n: int,
+):
+    """
+    Count n-grams in chunks of texts from tasks until a None arrives,
+    then put the list of spilled run paths on results.
+    """
+    counter = NgramCounter(spill_dir, name, max_entries)
+    while (chunk := tasks.get()) is not None:
+        for text in chunk:
+            counter.add_text(text, min_n, max_n)
+    counter.spill()
+    results.put(counter.runs)
+
+
+def check_workers(processes: list[multiprocessing.Process]):
+    if any(process.exitcode not in (None, 0) for process in processes):
+        raise RuntimeError("An n-gram worker process failed")
+
+
+def count_ngrams_parallel(
+    chunks: Iterable[list[str]],
+    spill_dir: Path,
+    workers: int = 4,
+    memory_mb: int = 1024,
+    min_n: int = 2,
+    max_n: int = 5,
+) -> list[Path]:
+    """
+    Count n-grams of the texts in chunks across worker processes,
+    each keeping to memory_mb. Returns the sorted runs written.
+    """
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    max_entries = max(1000, memory_mb * 1024 * 1024 // BYTES_PER_ENTRY)
+    tasks: multiprocessing.Queue = multiprocessing.Queue(maxsize=QUEUE_CHUNKS)
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=count_worker,
+            args=(
+                f"worker{i}",
+                tasks,
+                results,
+                spill_dir,
+                max_entries,
+                min_n,
+                max_n,
+            ),
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        # poll so a failed worker raises rather than blocking forever
+        for item in itertools.chain(chunks, [None] * len(processes)):
+            while True:
+                try:
+                    tasks.put(item, timeout=5)
+                    break
+                except queue.Full:
+                    check_workers(processes)
+        runs: list[Path] = []
+        finished = 0
+        while finished < len(processes):
+            try:
+                runs.extend(results.get(timeout=5))
+                finished += 1
+            except queue.Empty:
+                check_workers(processes)
+    finally:
+        for process in processes:
+            process.join(timeout=60)
+            if process.is_alive():
+                process.terminate()
+    return sorted(runs)
+
+
+def merge_runs(
+    runs: list[Path],
+    output: Path,
+    min_count: int = 1,
+    memory_limit: Optional[str] = None,
+    temp_directory: Optional[Path] = None,
+    key: Literal["hash", "ngram"] = "hash",
+) -> int:
+    """
+    Sum the counts of each n-gram across runs with duckdb, which spills
+    to temp_directory rather than going over memory_limit.
+    Runs without a hash column (older shards) are grouped by ngram.
+    Writes ngram, count sorted by count to output, returning the rows written.
+    """
+    import duckdb
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    if memory_limit:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    if temp_directory:
+        con.execute(f"SET temp_directory = '{temp_directory}'")
+    files = ", ".join(f"'{path}'" for path in runs)
+    con.execute(
+        f"""
+        COPY (
+            SELECT any_value(ngram) AS ngram, sum(count)::BIGINT AS count
+            FROM read_parquet([{files}])
+            GROUP BY {key}
+            HAVING sum(count) >= {int(min_count)}
+            ORDER BY count DESC
+        ) TO '{output}' (FORMAT PARQUET)
+        """
+    )
+    return con.execute(f"SELECT count(*) FROM read_parquet('{output}')").fetchone()[0]
+
+
+def peak_memory_mb() -> float:
+    """
+    Peak resident memory of this process so far, duckdb included.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def iter_counts(path: Path, batch_size: int) -> Iterator[tuple[str, int]]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size, columns=["ngram", "count"]
+    ):
+        columns = batch.to_pydict()
+        yield from zip(columns["ngram"], columns["count"])
+
+
+def kway_merge(
+    paths: list[Path],
+    output: Path,
+    temp_directory: Path,
+    min_count: int = 1,
+    batch_size: int = 100000,
+) -> int:
+    """
+    Sort each shard by ngram into a run, then heap merge the runs,
+    summing the counts of equal n-grams as they go past. Only a batch
+    per run is held at once. Writes ngram, count sorted by ngram.
+    """
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    temp_directory.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET temp_directory = '{temp_directory}'")
+    runs = []
+    for i, path in enumerate(paths):
+        run = temp_directory / f"sorted_{i:05d}.parquet"
+        con.execute(
+            f"COPY (SELECT ngram, count::BIGINT AS count FROM read_parquet('{path}') "
+            f"ORDER BY ngram) TO '{run}' (FORMAT PARQUET)"
+        )
+        runs.append(run)
+
+    schema = pa.schema([("ngram", pa.string()), ("count", pa.int64())])
+    rows = 0
+    ngrams: list[str] = []
+    counts: list[int] = []
+    with pq.ParquetWriter(output, schema) as writer:
+        merged = heapq.merge(*[iter_counts(run, batch_size) for run in runs])
+        for ngram, group in itertools.groupby(merged, key=lambda x: x[0]):
+            total = sum(count for _, count in group)
+            if total < min_count:
+                continue
+            ngrams.append(ngram)
+            counts.append(total)
+            if len(ngrams) >= batch_size:
+                writer.write_table(pa.table([ngrams, counts], schema=schema))
+                rows += len(ngrams)
+                ngrams, counts = [], []
+        writer.write_table(pa.table([ngrams, counts], schema=schema))
+        rows += len(ngrams)
+    for run in runs:
+        run.unlink()
+    return rows
+
+
+def merge_ngram_counts(
+    paths: list[Path],
+    output: Path,
+    min_count: int = 1,
+    method: Literal["duckdb", "kway"] = "duckdb",
+    memory_limit: Optional[str] = None,
+    temp_directory: Optional[Path] = None,
+) -> int:
+    """
+    Sum any number of ngram, count parquet shards into output in one pass.
+    min_count applies to the totals, not to each shard.
+    "duckdb" groups by ngram (spilling past memory_limit) and sorts by count,
+    "kway" merges sorted runs and sorts by ngram.
+    Returns the rows written.
+    """
+    temp_directory = temp_directory or output.parent / f"{output.stem}_tmp"
+    if method == "kway":
+        return kway_merge(paths, output, temp_directory, min_count=min_count)
+    return merge_runs(
+        paths,
+        output,
+        min_count=min_count,
+        memory_limit=memory_limit,
+        temp_directory=temp_directory,
+        key="ngram",
+    )
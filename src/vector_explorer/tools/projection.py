@@ -0,0 +1,98 @@
+"""
+Linear projections of the 384-d embeddings down to a small number of
+dimensions, for a coarse candidate index.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Literal, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+projection_dir = Path("data", "projection")
+
+ProjectionMethod = Literal["pca", "random"]
+
+
+class Projection:
+    """
+    Centre and project embeddings, then re-normalise so cosine distance
+    still makes sense in the reduced space.
+    """
+
+    def __init__(self, mean: NDArray[np.float32], components: NDArray[np.float32]):
+        self.mean = mean.astype(np.float32)
+        # shape (source_dimensions, dimensions)
+        self.components = components.astype(np.float32)
+
+    @property
+    def dimensions(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(
+        cls,
+        sample: NDArray[np.float32],
+        dimensions: int,
+        method: ProjectionMethod = "pca",
+        seed: int = 42,
+    ) -> Projection:
+        sample = np.asarray(sample, dtype=np.float32)
+        if method == "pca":
+            mean = sample.mean(axis=0)
+            # rows of vt are the principal axes, largest variance first
+            _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+            components = vt[:dimensions].T
+        elif method == "random":
+            mean = np.zeros(sample.shape[1], dtype=np.float32)
+            rng = np.random.default_rng(seed)
+            components = rng.normal(size=(sample.shape[1], dimensions)) / np.sqrt(
+                dimensions
+            )
+        else:
+            raise ValueError(f"Unknown projection method {method}")
+        return cls(mean=mean, components=components)
+
+    def transform(self, embeddings: NDArray[np.float32]) -> NDArray[np.float32]:
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        reduced = (embeddings - self.mean) @ self.components
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return reduced / norms
+
+    @staticmethod
+    def path_for(dimensions: int) -> Path:
+        return projection_dir / f"paragraph_{dimensions}.npz"
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        path = path or self.path_for(self.dimensions)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, mean=self.mean, components=self.components)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> Projection:
+        data = np.load(path)
+        return cls(mean=data["mean"], components=data["components"])
+
+
+@lru_cache(maxsize=8)
+def load_projection(path: Path, version: tuple[int, int]) -> Projection:
+    return Projection.load(path)
+
+
+def get_projection(dimensions: int) -> Optional[Projection]:
+    """
+    The saved projection for this number of dimensions, if it has been fitted.
+    Cached by the file's modification time and size, so a refit (e.g. by
+    `reduce_embeddings fit` in another process) is picked up on the next call.
+    """
+    path = Projection.path_for(dimensions)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return load_projection(path, (stat.st_mtime_ns, stat.st_size))
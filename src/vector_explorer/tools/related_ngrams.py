@@ -0,0 +1,286 @@
+"""
+Tidy the nearest n-grams to a search term into a short list of related terms.
+
+Nearest n-grams come back as many variations on the same phrase,
+e.g. 'mental ill health', 'of mental ill health', 'with mental ill health'.
+Stray punctuation and joining words at either end are stripped, and any
+n-gram containing a better ranked (earlier) one is dropped.
+
+The containment check is a plain substring test, as in the original
+notebook version, but done with one Aho-Corasick automaton over all the
+candidates rather than comparing every pair.
+
+expand_queries does the same for many queries at once: one embedding
+call per batch, one LATERAL nearest-neighbour query per batch over a
+single connection, and the filtering on the combined results.
+"""
+
+from __future__ import annotations
+
+import string
+from collections import deque
+from typing import TYPE_CHECKING, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# a word is dropped if it is found in this string, so it catches
+# single punctuation marks (and empty words from double spaces)
+PUNCTUATION = string.punctuation + "”“’‘"
+
+# joining words stripped from the start and end of an n-gram
+EDGE_WORDS = frozenset(
+    [
+        "and",
+        "or",
+        "of",
+        "the",
+        "in",
+        "to",
+        "a",
+        "on",
+        "for",
+        "with",
+        "by",
+        "from",
+        "as",
+        "at",
+        "an",
+        "is",
+        "are",
+        "were",
+    ]
+)
+
+
+def normalize_ngram(text: str) -> str:
+    """
+    Remove punctuation words, and joining words from either end.
+    """
+    words = [w for w in text.split(" ") if w not in PUNCTUATION]
+    start, end = 0, len(words)
+    while start < end and words[start] in EDGE_WORDS:
+        start += 1
+    while end > start and words[end - 1] in EDGE_WORDS:
+        end -= 1
+    return " ".join(words[start:end])
+
+
+class ContainmentAutomaton:
+    """
+    Aho-Corasick automaton over a ranked list of strings.
+    best[state] is the lowest rank of any of the strings that end
+    at that state, including through its suffix links.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.best: list[int] = [len(patterns)]
+        for rank, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.best.append(len(patterns))
+                state = next_state
+            self.best[state] = min(self.best[state], rank)
+        self.fail = [0] * len(self.goto)
+        self.build_links()
+
+    def build_links(self):
+        # breadth first, so a state's suffix link is finished before it
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self.goto[state].items():
+                link = self.fail[state]
+                while link and char not in self.goto[link]:
+                    link = self.fail[link]
+                self.fail[child] = self.goto[link].get(char, 0)
+                self.best[child] = min(self.best[child], self.best[self.fail[child]])
+                pending.append(child)
+
+    def best_contained(self, text: str) -> int:
+        """
+        Lowest rank of any pattern that is a substring of text.
+        """
+        state = 0
+        best = self.best[0]
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            best = min(best, self.best[state])
+        return best
+
+
+def subsumed_mask(texts: Sequence[str]) -> list[bool]:
+    """
+    True for each text that contains an earlier text in the list
+    (whether or not that earlier text was itself subsumed).
+    Texts are expected to be distinct.
+    """
+    automaton = ContainmentAutomaton(texts)
+    return [automaton.best_contained(text) < rank for rank, text in enumerate(texts)]
+
+
+def filter_related(
+    df: pd.DataFrame, search_query: str, limit: int = 10
+) -> pd.DataFrame:
+    """
+    From search_distance results (text, count, distance) to the
+    nearest distinct related n-grams that aren't the query itself.
+    """
+    df = (
+        df.assign(text=lambda df: df["text"].str.strip())
+        .drop_duplicates(subset="text", keep="first")
+        .drop(columns=["id"], errors="ignore")
+        .sort_values("distance", ascending=True)
+        .reset_index(drop=True)
+    )
+    df["text"] = df["text"].map(normalize_ngram)
+    df = df.drop_duplicates(subset="text", keep="first")
+    df = df[[not x for x in subsumed_mask(df["text"].tolist())]]
+    df = df[df["text"] != search_query]
+    return df.head(limit)
+
+
+def find_related_ngrams(
+    search_query: str, threshold: float = 0.15, limit: int = 10
+) -> pd.DataFrame:
+    from vector_explorer.models import NgramVector
+
+    df = (
+        NgramVector.objects.all()
+        .search_distance(search_query, threshold=threshold)
+        .df()
+    )
+    if df.empty:
+        return df
+    return filter_related(df, search_query, limit=limit)
+
+
+# the nearest candidates for each query, found through the HNSW index
+# and then cut to the distance threshold
+BATCH_NEAREST_SQL = """
+    SELECT q.n, nearest.text, nearest.count, nearest.distance
+    FROM unnest(%s::int[], %s::text[]) AS q(n, embedding)
+    CROSS JOIN LATERAL (
+        SELECT v.text, v.count, v.embedding <=> q.embedding::vector AS distance
+        FROM {table} v
+        ORDER BY v.embedding <=> q.embedding::vector
+        LIMIT %s
+    ) nearest
+    WHERE nearest.distance <= %s
+    ORDER BY q.n, nearest.distance
+"""
+
+
+def embed_queries(queries: list[str], batch_size: int = 256) -> np.ndarray:
+    from .inference import get_local_inference
+
+    inference = get_local_inference()
+    embeddings = []
+    for start in range(0, len(queries), batch_size):
+        embeddings.extend(inference.query(queries[start : start + batch_size]))
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def nearest_ngrams(
+    queries: list[str],
+    embeddings: np.ndarray,
+    threshold: float = 0.15,
+    candidates: int = 100,
+    batch_size: int = 256,
+) -> pd.DataFrame:
+    """
+    Up to candidates nearest n-grams within threshold of each query,
+    as query, text, count, distance rows, nearest first per query.
+    """
+    from django.db import connection
+
+    import pandas as pd
+    from vector_explorer.models import NgramVector, set_hnsw_ef_search, vector_literal
+
+    # pgvector's upper limit for ef_search is 1000
+    set_hnsw_ef_search(min(1000, max(40, candidates)))
+    sql = BATCH_NEAREST_SQL.format(table=NgramVector._meta.db_table)
+    rows = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(queries), batch_size):
+            batch = embeddings[start : start + batch_size]
+            cursor.execute(
+                sql,
+                [
+                    list(range(start, start + len(batch))),
+                    [vector_literal(x) for x in batch],
+                    candidates,
+                    threshold,
+                ],
+            )
+            rows.extend(cursor.fetchall())
+    df = pd.DataFrame(rows, columns=["n", "text", "count", "distance"])
+    df.insert(0, "query", [queries[n] for n in df["n"]])
+    return df.drop(columns=["n"])
+
+
+def filter_related_batch(df: pd.DataFrame, limit: int = 10) -> pd.DataFrame:
+    """
+    filter_related applied to each query's rows of a nearest_ngrams frame.
+    Each distinct text is only normalized once.
+    """
+    df = df.assign(text=df["text"].str.strip()).drop_duplicates(
+        subset=["query", "text"], keep="first"
+    )
+    normalized = {text: normalize_ngram(text) for text in df["text"].unique()}
+    df = df.assign(text=df["text"].map(normalized)).drop_duplicates(
+        subset=["query", "text"], keep="first"
+    )
+    subsumed = np.zeros(len(df), dtype=bool)
+    for positions in df.groupby("query", sort=False).indices.values():
+        texts = df["text"].iloc[positions].tolist()
+        subsumed[positions] = subsumed_mask(texts)
+    df = df[~subsumed & (df["text"] != df["query"])]
+    return df.groupby("query", sort=False).head(limit).reset_index(drop=True)
+
+
+def expand_queries(
+    queries: list[str],
+    threshold: float = 0.15,
+    limit: int = 10,
+    candidates: int = 100,
+    batch_size: int = 256,
+) -> pd.DataFrame:
+    """
+    Related n-grams for many queries at once, as query, text, count,
+    distance rows. Unlike find_related_ngrams only the nearest
+    candidates to each query are considered before filtering.
+    """
+    embeddings = embed_queries(queries, batch_size=batch_size)
+    df = nearest_ngrams(
+        queries,
+        embeddings,
+        threshold=threshold,
+        candidates=candidates,
+        batch_size=batch_size,
+    )
+    return filter_related_batch(df, limit=limit)
+
+
+def search_matches(df: pd.DataFrame) -> list[dict]:
+    """
+    Rows grouped by query, in the search_matches.json layout
+    [{"query": ..., "nearest": [{"text", "count", "distance"}, ...]}].
+    """
+    return [
+        {
+            "query": query,
+            "nearest": group[["text", "count", "distance"]].to_dict(orient="records"),
+        }
+        for query, group in df.groupby("query", sort=False)
+    ]
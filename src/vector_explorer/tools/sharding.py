@@ -0,0 +1,152 @@
+"""
+Split ParagraphVector rows across several database aliases.
+
+Shards are configured in settings.VECTOR_SHARDS, e.g.
+
+    VECTOR_SHARDS = [
+        {"alias": "lords", "chamber_types": ["uk_lords"]},
+        {"alias": "recent", "start": "2020-01-01"},
+    ]
+
+A row goes to the first shard whose chamber types and date range match
+(the date comes from the source file name), or to "default".
+Every alias needs the vector_explorer tables, so run
+`migrate --database <alias>` for each one.
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import models
+
+DEFAULT_ALIAS = "default"
+
+date_pattern = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+
+def date_from_source_file(source_file: str) -> Optional[datetime.date]:
+    """
+    e.g. debates2023-01-10a.xml -> 2023-01-10
+    """
+    match = date_pattern.search(source_file)
+    return datetime.date.fromisoformat(match.group(1)) if match else None
+
+
+def file_day(source_file: str) -> str:
+    """
+    The part of a file name shared by every version of a day's transcript,
+    e.g. debates2023-01-10b.xml -> debates2023-01-10
+    """
+    return source_file.rsplit(".", 1)[0].rstrip("abcdefghijklmnopqrstuvwxyz")
+
+
+def latest_versions(paths: Iterable[Path]) -> list[Path]:
+    """
+    Only the last version of each day's file (e.g. debates2023-01-10b.xml
+    over debates2023-01-10a.xml), in name order.
+    """
+    by_day: dict[str, Path] = {}
+    for path in sorted(paths):
+        by_day[file_day(path.name)] = path
+    return list(by_day.values())
+
+
+class Shard(NamedTuple):
+    alias: str
+    chamber_types: Optional[tuple[str, ...]] = None
+    start: Optional[datetime.date] = None
+    end: Optional[datetime.date] = None
+
+    @classmethod
+    def from_setting(cls, item: dict[str, Any]):
+        return cls(
+            alias=item["alias"],
+            chamber_types=tuple(item["chamber_types"])
+            if item.get("chamber_types")
+            else None,
+            start=datetime.date.fromisoformat(item["start"])
+            if item.get("start")
+            else None,
+            end=datetime.date.fromisoformat(item["end"]) if item.get("end") else None,
+        )
+
+    def matches(self, chamber_type: str, date: Optional[datetime.date]) -> bool:
+        """
+        start is inclusive and end exclusive.
+        Files without a date only match shards with no date range.
+        """
+        if self.chamber_types is not None and chamber_type not in self.chamber_types:
+            return False
+        if self.start is None and self.end is None:
+            return True
+        if date is None:
+            return False
+        if self.start is not None and date < self.start:
+            return False
+        if self.end is not None and date >= self.end:
+            return False
+        return True
+
+
+def get_shards() -> list[Shard]:
+    return [Shard.from_setting(x) for x in getattr(settings, "VECTOR_SHARDS", [])]
+
+
+def shard_aliases() -> list[str]:
+    """
+    Every alias that can hold paragraphs, default included.
+    """
+    aliases = [DEFAULT_ALIAS]
+    for shard in get_shards():
+        if shard.alias not in aliases:
+            aliases.append(shard.alias)
+    return aliases
+
+
+def shard_for(chamber_type: str, source_file: str) -> str:
+    date = date_from_source_file(source_file)
+    for shard in get_shards():
+        if shard.matches(chamber_type, date):
+            return shard.alias
+    return DEFAULT_ALIAS
+
+
+def shard_for_instance(instance: models.Model) -> str:
+    return shard_for(instance.chamber_type, instance.source_file)  # type: ignore
+
+
+class VectorShardRouter:
+    """
+    Route reads and writes of a single sharded row (models with
+    `sharded = True`) to its shard. Querysets without an instance use
+    default unless .using() is given, see DistanceQuerySet.search_shards.
+    """
+
+    def _route(self, model: type[models.Model], **hints) -> Optional[str]:
+        instance = hints.get("instance")
+        if getattr(model, "sharded", False) and instance is not None:
+            return shard_for_instance(instance)
+        return None
+
+    def db_for_read(self, model: type[models.Model], **hints) -> Optional[str]:
+        return self._route(model, **hints)
+
+    def db_for_write(self, model: type[models.Model], **hints) -> Optional[str]:
+        return self._route(model, **hints)
+
+    def allow_migrate(self, db: str, app_label: str, **hints) -> Optional[bool]:
+        # shards only hold vector_explorer tables, default holds everything
+        if db != DEFAULT_ALIAS and db in shard_aliases():
+            return app_label == "vector_explorer"
+        return None
+
+    def allow_relation(self, obj1: models.Model, obj2: models.Model, **hints):
+        # canonical texts are stored alongside their paragraphs on each shard
+        if obj1._meta.app_label == obj2._meta.app_label == "vector_explorer":
+            return True
+        return None
@@ -0,0 +1,425 @@
+"""
+Export the vector tables to files and load them back, so a new machine
+doesn't need to re-run infer and rebuild the indexes row by row.
+
+A snapshot directory holds one folder per table and database alias,
+each with files covering id ranges of the table:
+
+    snapshot/manifest.json
+    snapshot/vector_explorer_paragraphvector/default/part-00000.parquet
+    ...
+
+Files are either zstd parquet (embeddings as fixed size float32 lists,
+readable by duckdb/pandas) or postgres binary COPY files, which are
+larger but load without any conversion in python.
+Ranges are read and written by several threads, each with its own connection.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal, NamedTuple, Optional
+
+from django.db import connections, models
+
+from pgvector.django import VectorField
+from tqdm import tqdm
+
+from .index_maintenance import set_maintenance_options
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+SnapshotFormat = Literal["parquet", "copy"]
+SUFFIXES = {"parquet": ".parquet", "copy": ".copy"}
+
+ARROW_TYPES = {
+    "AutoField": "int32",
+    "BigAutoField": "int64",
+    "BigIntegerField": "int64",
+    "IntegerField": "int32",
+    "FloatField": "float64",
+    "BooleanField": "bool_",
+    "CharField": "string",
+    "TextField": "string",
+}
+
+
+class TransferStats(NamedTuple):
+    rows: int
+    bytes: int
+    seconds: float
+
+    @classmethod
+    def combine(cls, results: list[TransferStats], seconds: float):
+        """
+        Totals of parallel transfers that took seconds overall.
+        """
+        return cls(sum(x.rows for x in results), sum(x.bytes for x in results), seconds)
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"{self.rows} rows, {self.bytes / 1e6:.1f} MB in {self.seconds:.1f}s "
+            f"({self.rows / seconds:.0f} rows/s, {self.bytes / 1e6 / seconds:.1f} MB/s)"
+        )
+
+
+def snapshot_columns(model: type[models.Model]) -> list[models.Field]:
+    """
+    Stored columns of the model (generated columns such as
+    text_search aren't model fields, so are left for postgres to fill).
+    """
+    return list(model._meta.concrete_fields)
+
+
+def arrow_type(field: models.Field) -> pa.DataType:
+    import pyarrow as pa
+
+    if isinstance(field, VectorField):
+        return pa.list_(pa.float32(), field.dimensions)
+    if isinstance(field, models.ForeignKey):
+        return arrow_type(field.target_field)
+    return getattr(pa, ARROW_TYPES[field.get_internal_type()])()
+
+
+def raw_cursor(using: str):
+    """
+    A plain psycopg cursor on the thread's connection, which can fetch
+    binary results (django's client side binding cursors can't), with the
+    pgvector types registered so vectors come back as numpy arrays.
+    """
+    import psycopg
+    from pgvector.psycopg import register_vector
+
+    connection = connections[using]
+    connection.ensure_connection()
+    register_vector(connection.connection)
+    return psycopg.Cursor(connection.connection)
+
+
+def id_ranges(table: str, chunk_rows: int, using: str) -> list[tuple[int, int]]:
+    """
+    [start, end) id ranges of chunk_rows ids covering the table.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT min(id), max(id) FROM {table}")
+        low, high = cursor.fetchone()
+    if low is None:
+        return []
+    return [(start, start + chunk_rows) for start in range(low, high + 1, chunk_rows)]
+
+
+def rows_to_arrow(rows: list[tuple], fields: list[models.Field]) -> pa.Table:
+    import numpy as np
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(fields, zip(*rows)):
+        if isinstance(field, VectorField):
+            mask = np.array([x is None for x in values])
+            flat = np.zeros((len(values), field.dimensions), dtype=np.float32)
+            for i, value in enumerate(values):
+                if value is not None:
+                    flat[i] = value
+            arrays.append(
+                pa.FixedSizeListArray.from_arrays(
+                    pa.array(flat.ravel()),
+                    field.dimensions,
+                    mask=pa.array(mask) if mask.any() else None,
+                )
+            )
+        else:
+            arrays.append(pa.array(values, type=arrow_type(field)))
+    return pa.Table.from_arrays(arrays, names=[field.column for field in fields])
+
+
+def export_range(
+    model: type[models.Model],
+    id_range: tuple[int, int],
+    path: Path,
+    format: SnapshotFormat,
+    using: str,
+    compression: str = "zstd",
+) -> TransferStats:
+    """
+    Write the rows with ids in [start, end) to path.
+    """
+    import pyarrow.parquet as pq
+
+    start_time = time.perf_counter()
+    fields = snapshot_columns(model)
+    select = (
+        f"SELECT {', '.join(field.column for field in fields)} "
+        f"FROM {model._meta.db_table} "
+        f"WHERE id >= {id_range[0]:d} AND id < {id_range[1]:d} ORDER BY id"
+    )
+    rows = 0
+    try:
+        with raw_cursor(using) as cursor:
+            if format == "copy":
+                with path.open("wb") as f, cursor.copy(
+                    f"COPY ({select}) TO STDOUT (FORMAT binary)"
+                ) as copy:
+                    for data in copy:
+                        f.write(data)
+                rows = cursor.rowcount
+            else:
+                cursor.execute(select, binary=True)
+                records = cursor.fetchall()
+                rows = len(records)
+                if records:
+                    pq.write_table(
+                        rows_to_arrow(records, fields), path, compression=compression
+                    )
+    finally:
+        connections[using].close()
+    if rows == 0:
+        path.unlink(missing_ok=True)
+        return TransferStats(0, 0, time.perf_counter() - start_time)
+    return TransferStats(rows, path.stat().st_size, time.perf_counter() - start_time)
+
+
+def export_table(
+    model: type[models.Model],
+    output_dir: Path,
+    format: SnapshotFormat = "parquet",
+    using: str = "default",
+    chunk_rows: int = 50000,
+    workers: int = 4,
+    compression: str = "zstd",
+) -> tuple[dict, TransferStats]:
+    """
+    Export one table from one database, returning its manifest entry
+    and the combined stats of the parallel range exports.
+    """
+    table = model._meta.db_table
+    table_dir = output_dir / table / using
+    table_dir.mkdir(parents=True, exist_ok=True)
+    for old in table_dir.glob("part-*"):
+        old.unlink()
+
+    ranges = id_ranges(table, chunk_rows, using)
+    paths = [table_dir / f"part-{n:05d}{SUFFIXES[format]}" for n in range(len(ranges))]
+    start_time = time.perf_counter()
+    results: list[TransferStats] = []
+
+    def run(item: tuple[tuple[int, int], Path]) -> TransferStats:
+        return export_range(model, item[0], item[1], format, using, compression)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(
+        total=len(ranges), desc=f"{table} ({using})"
+    ) as progress:
+        for result in pool.map(run, zip(ranges, paths)):
+            results.append(result)
+            progress.update()
+    stats = TransferStats.combine(results, time.perf_counter() - start_time)
+    entry = {
+        "table": table,
+        "alias": using,
+        "columns": [field.column for field in snapshot_columns(model)],
+        "rows": stats.rows,
+        "files": [str(path.relative_to(output_dir)) for path in paths if path.exists()],
+    }
+    return entry, stats
+
+
+def write_manifest(output_dir: Path, format: SnapshotFormat, entries: list[dict]):
+    (output_dir / "manifest.json").write_text(
+        json.dumps({"format": format, "tables": entries}, indent=2)
+    )
+
+
+def read_manifest(snapshot_dir: Path) -> dict:
+    return json.loads((snapshot_dir / "manifest.json").read_text())
+
+
+def secondary_indexes(table: str, using: str) -> list[tuple[str, str]]:
+    """
+    (name, definition) of the indexes on the table that don't back a
+    constraint, i.e. those that can be dropped for a load and rebuilt after.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT i.indexname, i.indexdef FROM pg_indexes i
+            WHERE i.tablename = %s AND i.schemaname = current_schema()
+            AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint c
+                WHERE c.conindid = (quote_ident(i.schemaname) || '.' ||
+                    quote_ident(i.indexname))::regclass
+            )
+            ORDER BY i.indexname
+            """,
+            [table],
+        )
+        return cursor.fetchall()
+
+
+def pending_indexes_path(snapshot_dir: Path, table: str, using: str) -> Path:
+    return snapshot_dir / "pending_indexes" / f"{table}.{using}.json"
+
+
+def restore_indexes(table: str, using: str, path: Path):
+    """
+    Build any of the indexes saved to path before a load dropped them
+    that don't exist yet, then remove the file.
+    """
+    if not path.exists():
+        return
+    existing = {name for name, _ in secondary_indexes(table, using)}
+    with connections[using].cursor() as cursor:
+        for name, definition in json.loads(path.read_text()):
+            if name in existing:
+                continue
+            index_start = time.perf_counter()
+            cursor.execute(definition)
+            print(f"Built {name} in {time.perf_counter() - index_start:.1f}s")
+    path.unlink()
+    if not any(path.parent.iterdir()):
+        path.parent.rmdir()
+
+
+def vector_rows(array: pa.FixedSizeListArray, dimensions: int) -> list:
+    """
+    A numpy array per row of a parquet vector column (None for nulls).
+    """
+    values = array.values.slice(array.offset * dimensions, len(array) * dimensions)
+    vectors = list(values.to_numpy().reshape(-1, dimensions))
+    if array.null_count:
+        valid = array.is_valid().to_pylist()
+        return [vector if ok else None for vector, ok in zip(vectors, valid)]
+    return vectors
+
+
+def import_file(
+    model: type[models.Model],
+    path: Path,
+    columns: list[str],
+    using: str,
+) -> TransferStats:
+    """
+    COPY one snapshot file into the table. Copy files are streamed
+    straight through, parquet rows are sent with binary COPY.
+    """
+    import pyarrow.parquet as pq
+
+    start_time = time.perf_counter()
+    fields = {field.column: field for field in snapshot_columns(model)}
+    copy_sql = (
+        f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN (FORMAT binary)"
+    )
+    rows = 0
+    try:
+        with raw_cursor(using) as cursor:
+            cursor.execute("SET synchronous_commit = off")
+            with cursor.copy(copy_sql) as copy:
+                if path.suffix == SUFFIXES["copy"]:
+                    with path.open("rb") as f:
+                        while data := f.read(1 << 20):
+                            copy.write(data)
+                else:
+                    copy.set_types(
+                        [
+                            fields[column].db_type(connections[using]).split("(")[0]
+                            for column in columns
+                        ]
+                    )
+                    for batch in pq.ParquetFile(path).iter_batches(batch_size=10000):
+                        values = [
+                            vector_rows(batch.column(column), fields[column].dimensions)
+                            if isinstance(fields[column], VectorField)
+                            else batch.column(column).to_pylist()
+                            for column in columns
+                        ]
+                        for row in zip(*values):
+                            copy.write_row(row)
+            rows = cursor.rowcount
+    finally:
+        connections[using].close()
+    return TransferStats(rows, path.stat().st_size, time.perf_counter() - start_time)
+
+
+def import_table(
+    model: type[models.Model],
+    snapshot_dir: Path,
+    entry: dict,
+    workers: int = 4,
+    maintenance_work_mem: Optional[str] = None,
+    parallel_workers: Optional[int] = None,
+) -> TransferStats:
+    """
+    Load one manifest entry into an empty table. Secondary indexes
+    (including the HNSW ones) are dropped for the load and rebuilt after
+    from their definitions, then the id sequence is moved past the
+    loaded ids. The definitions are written to pending_indexes/ in the
+    snapshot first and the indexes are rebuilt even if the load fails,
+    and a load that was killed has them rebuilt on the next run.
+    """
+    table, using = entry["table"], entry["alias"]
+    saved = pending_indexes_path(snapshot_dir, table, using)
+    restore_indexes(table, using, saved)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if cursor.fetchone()[0]:
+            raise ValueError(f"{table} on {using} is not empty")
+
+    indexes = secondary_indexes(table, using)
+    saved.parent.mkdir(parents=True, exist_ok=True)
+    saved.write_text(json.dumps(indexes, indent=2))
+    with connections[using].cursor() as cursor:
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+    try:
+        start_time = time.perf_counter()
+        results: list[TransferStats] = []
+
+        def run(path: str) -> TransferStats:
+            return import_file(model, snapshot_dir / path, entry["columns"], using)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(
+            total=len(entry["files"]), desc=f"{table} ({using})"
+        ) as progress:
+            for result in pool.map(run, entry["files"]):
+                results.append(result)
+                progress.update()
+        stats = TransferStats.combine(results, time.perf_counter() - start_time)
+        print(f"Loaded {table} ({using}): {stats}")
+
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"coalesce(max(id), 0) + 1, false) FROM {table}"
+            )
+            cursor.execute(f"ANALYZE {table}")
+    finally:
+        set_maintenance_options(maintenance_work_mem, parallel_workers, using)
+        restore_indexes(table, using, saved)
+    return stats
+
+
+def snapshot_models() -> dict[str, tuple[type[models.Model], list[str]]]:
+    """
+    Tables in a snapshot and the aliases they're exported from, in load
+    order (canonical texts before the paragraphs that refer to them).
+    """
+    from ..models import (
+        AggregateVector,
+        CanonicalText,
+        NgramVector,
+        ParagraphVector,
+        SpeechRedirect,
+    )
+    from .sharding import DEFAULT_ALIAS, shard_aliases
+
+    return {
+        "canonical": (CanonicalText, shard_aliases()),
+        "paragraph": (ParagraphVector, shard_aliases()),
+        "aggregate": (AggregateVector, shard_aliases()),
+        "ngram": (NgramVector, [DEFAULT_ALIAS]),
+        "redirect": (SpeechRedirect, [DEFAULT_ALIAS]),
+    }
@@ -0,0 +1,142 @@
+"""
+Download transcript xml with rsync, running a transfer per chamber at
+the same time, and report which files actually changed.
+
+rsync is run with --itemize-changes rather than --progress, so each
+transferred file appears on one line, e.g.
+
+    >f+++++++++ debates2023-01-10a.xml    (new)
+    >f.st...... debates2023-01-09a.xml    (updated)
+
+and only those files need validating and embedding.
+The source can be the theyworkforyou rsync daemon, a local daemon
+(rsync://localhost/parldata) or a plain directory with the same layout.
+"""
+
+from __future__ import annotations
+
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, NamedTuple
+
+if TYPE_CHECKING:
+    from vector_explorer.data_manager import XMLManager
+
+RSYNC_SOURCE = "data.theyworkforyou.com::parldata"
+
+# 24 is "some source files vanished", which happens while the scrapers run
+RSYNC_OK_CODES = (0, 24)
+
+# the shell's code for a command that couldn't be run
+RSYNC_NOT_RUN = 127
+
+
+class FileChange(NamedTuple):
+    name: str
+    new: bool
+
+
+class SyncResult(NamedTuple):
+    manager: XMLManager
+    changes: list[FileChange]
+    returncode: int
+    stderr: str
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode in RSYNC_OK_CODES
+
+    def changed_paths(self, destination: Path, suffix: str = ".xml") -> list[Path]:
+        return sorted(
+            destination / self.manager.relative_path / change.name
+            for change in self.changes
+            if change.name.endswith(suffix)
+        )
+
+
+def parse_itemized(lines: Iterable[str]) -> list[FileChange]:
+    """
+    Files created or updated in an --itemize-changes listing.
+    Directories, deletions and attribute-only changes are skipped.
+    """
+    changes = []
+    for line in lines:
+        code, _, name = line.rstrip("\n").partition(" ")
+        if len(code) < 3 or not name:
+            continue
+        # update type (> received, c created locally) then file type
+        if code[0] in "<>c" and code[1] == "f":
+            changes.append(FileChange(name=name, new=set(code[2:]) == {"+"}))
+    return changes
+
+
+def rsync_command(
+    manager: XMLManager,
+    pattern: str,
+    source: str = RSYNC_SOURCE,
+    destination: Path = Path("data", "pwdata"),
+) -> list[str]:
+    """
+    Sync the manager's files starting with pattern into the matching
+    directory under destination. Files are selected with filter rules
+    rather than a shell glob, so local directory sources work too.
+    """
+    return [
+        "rsync",
+        "-az",
+        "--itemize-changes",
+        "--out-format=%i %n",
+        f"--include={manager.file_structure_pre_date}{pattern}*",
+        "--exclude=*",
+        f"{source.rstrip('/')}/{manager.relative_path}",
+        f"{destination / manager.relative_path}/",
+    ]
+
+
+def sync_manager(
+    manager: XMLManager,
+    pattern: str,
+    source: str = RSYNC_SOURCE,
+    destination: Path = Path("data", "pwdata"),
+) -> SyncResult:
+    """
+    Run one rsync. A missing rsync binary is reported as a failed
+    result, like any other rsync error, rather than raised.
+    """
+    (destination / manager.relative_path).mkdir(parents=True, exist_ok=True)
+    command = rsync_command(manager, pattern, source, destination)
+    try:
+        process = subprocess.run(command, capture_output=True, text=True)
+    except OSError as e:
+        return SyncResult(
+            manager=manager,
+            changes=[],
+            returncode=RSYNC_NOT_RUN,
+            stderr=f"Could not run {command[0]}: {e}",
+        )
+    return SyncResult(
+        manager=manager,
+        changes=parse_itemized(process.stdout.splitlines()),
+        returncode=process.returncode,
+        stderr=process.stderr,
+    )
+
+
+def sync_managers(
+    managers: Iterable[XMLManager],
+    pattern: str,
+    source: str = RSYNC_SOURCE,
+    destination: Path = Path("data", "pwdata"),
+    workers: int = 3,
+) -> list[SyncResult]:
+    """
+    Run an rsync per manager, at most workers at a time.
+    Results are in the order of managers, failed transfers included.
+    """
+
+    def run(manager: XMLManager) -> SyncResult:
+        return sync_manager(manager, pattern, source, destination)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, managers))
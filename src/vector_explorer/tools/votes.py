@@ -0,0 +1,163 @@
+"""
+Flatten the divisions in transcript xml into arrow tables.
+
+Divisions and votes are read straight from the xml with lxml rather
+than through the DailyRecord models, and written as two parquet
+datasets partitioned by chamber and year:
+
+    data/votes/divisions/chamber=uk_commons/year=2023/...
+    data/votes/votes/chamber=uk_commons/year=2023/...
+
+e.g. in duckdb
+    SELECT vote, count(*) FROM read_parquet('data/votes/votes/**/*.parquet',
+        hive_partitioning = true) WHERE person_id = '...' GROUP BY vote
+"""
+
+from __future__ import annotations
+
+import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, NamedTuple, Optional
+
+from lxml import etree
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+votes_dir = Path("data", "votes")
+
+REP_LIST_TAGS = ["mplist", "msplist", "mslist", "mlalist", "lordlist"]
+REP_NAME_TAGS = ["mpname", "mspname", "msname", "mlaname", "lord"]
+COUNT_ATTRIBUTES = ["ayes", "noes", "content", "not-content", "neutral", "absent"]
+
+# every member vote in a division, whichever legislature's tags are used
+VOTE_XPATH = etree.XPath(
+    "./*[{lists}]/*[{names}]".format(
+        lists=" or ".join(f"self::{tag}" for tag in REP_LIST_TAGS),
+        names=" or ".join(f"self::{tag}" for tag in REP_NAME_TAGS),
+    )
+)
+
+
+def optional_int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+class VoteTables(NamedTuple):
+    divisions: pa.Table
+    votes: pa.Table
+
+
+def division_tables(
+    xml_paths: Iterable[Path], chamber_type: str
+) -> Optional[VoteTables]:
+    """
+    One row per division and one per member vote for all the files,
+    or None if there are no divisions.
+    """
+    import pyarrow as pa
+
+    divisions: dict[str, list] = {
+        "division_id": [],
+        "date": [],
+        "divnumber": [],
+        "time": [],
+        "source_file": [],
+        "motion": [],
+        **{name.replace("-", "_"): [] for name in COUNT_ATTRIBUTES},
+    }
+    votes: dict[str, list] = {
+        "division_id": [],
+        "date": [],
+        "person_id": [],
+        "vote": [],
+        "proxy": [],
+    }
+
+    for path in xml_paths:
+        root = etree.parse(str(path)).getroot()
+        for division in root.iterchildren("division"):
+            division_id = (
+                division.get("id") or f"{path.stem}.{division.get('divnumber')}"
+            )
+            date = datetime.date.fromisoformat(division.get("divdate"))
+            count = division.find("divisioncount")
+            motion = division.find("motion")
+            divisions["division_id"].append(division_id)
+            divisions["date"].append(date)
+            divisions["divnumber"].append(optional_int(division.get("divnumber")))
+            divisions["time"].append(division.get("time"))
+            divisions["source_file"].append(path.name)
+            divisions["motion"].append(
+                "".join(motion.itertext()).strip() if motion is not None else None
+            )
+            for name in COUNT_ATTRIBUTES:
+                divisions[name.replace("-", "_")].append(
+                    optional_int(count.get(name)) if count is not None else None
+                )
+
+            members = VOTE_XPATH(division)
+            votes["division_id"].extend([division_id] * len(members))
+            votes["date"].extend([date] * len(members))
+            # scotland uses id rather than person_id
+            votes["person_id"].extend(
+                [x.get("person_id") or x.get("id") for x in members]
+            )
+            votes["vote"].extend([x.get("vote") for x in members])
+            votes["proxy"].extend([x.get("proxy") for x in members])
+
+    if not divisions["division_id"]:
+        return None
+
+    division_schema = pa.schema(
+        [
+            ("division_id", pa.string()),
+            ("date", pa.date32()),
+            ("divnumber", pa.int32()),
+            ("time", pa.string()),
+            ("source_file", pa.string()),
+            ("motion", pa.string()),
+            *[(name.replace("-", "_"), pa.int32()) for name in COUNT_ATTRIBUTES],
+        ]
+    )
+    vote_schema = pa.schema(
+        [
+            ("division_id", pa.string()),
+            ("date", pa.date32()),
+            ("person_id", pa.string()),
+            ("vote", pa.string()),
+            ("proxy", pa.string()),
+        ]
+    )
+    return VoteTables(
+        with_partitions(pa.table(divisions, schema=division_schema), chamber_type),
+        with_partitions(pa.table(votes, schema=vote_schema), chamber_type),
+    )
+
+
+def with_partitions(table: pa.Table, chamber_type: str) -> pa.Table:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    return table.append_column(
+        "chamber", pa.array([chamber_type] * len(table), pa.string())
+    ).append_column("year", pc.year(table["date"]).cast(pa.int16()))
+
+
+def write_vote_tables(tables: VoteTables, label: str, output_dir: Path = votes_dir):
+    """
+    Write into the partitioned datasets, replacing the chamber/year
+    partitions being written so a year can be re-extracted.
+    """
+    import pyarrow.dataset as ds
+
+    for name, table in tables._asdict().items():
+        ds.write_dataset(
+            table,
+            output_dir / name,
+            format="parquet",
+            partitioning=["chamber", "year"],
+            partitioning_flavor="hive",
+            basename_template=f"{label}-{{i}}.parquet",
+            existing_data_behavior="delete_matching",
+        )
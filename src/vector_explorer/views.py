@@ -1 +1,91 @@
-# Create your views here.
+import asyncio
+
+from django.conf import settings
+from django.http import HttpRequest, JsonResponse
+
+from .models import ParagraphVector, embedding_join, vector_literal
+from .tools.async_db import get_pool
+from .tools.batcher import get_batcher
+from .tools.sharding import shard_aliases
+
+COLUMNS = [
+    "id",
+    "source_file",
+    "speech_id",
+    "text",
+    "transcript_type",
+    "chamber_type",
+    "distance",
+]
+
+# paragraph embeddings are stored on their canonical text
+_table = ParagraphVector._meta.db_table
+_from, _embedding = embedding_join(ParagraphVector)
+
+SEARCH_SQL = f"""
+    SELECT {", ".join(COLUMNS)}
+    FROM (
+        SELECT {", ".join(f"{_table}.{x}" for x in COLUMNS[:-1])},
+            {_embedding} <=> %(embedding)s::vector AS distance
+        FROM {_from}
+        WHERE (%(chamber_type)s::text IS NULL OR chamber_type = %(chamber_type)s)
+        AND (%(transcript_type)s::text IS NULL OR transcript_type = %(transcript_type)s)
+        ORDER BY {_embedding} <=> %(embedding)s::vector
+        LIMIT %(k)s
+    ) nearest
+    WHERE distance <= %(threshold)s
+"""
+
+
+async def search_alias(alias: str, params: dict) -> list[dict]:
+    pool = get_pool(
+        settings.DATABASES[alias],
+        max_size=settings.SEARCH_POOL_SIZE,
+        ef_search=max(40, settings.SEARCH_MAX_K),
+        alias=alias,
+    )
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(SEARCH_SQL, params)
+            rows = await cursor.fetchall()
+    return [{**dict(zip(COLUMNS, row)), "shard": alias} for row in rows]
+
+
+async def search(request: HttpRequest) -> JsonResponse:
+    """
+    JSON paragraph search across every shard, merged by distance.
+    e.g. /api/search/?q=mental+health&k=20&threshold=0.4&chamber_type=uk_commons
+    """
+    search_term = request.GET.get("q", "").strip()
+    if not search_term:
+        return JsonResponse({"error": "q is required"}, status=400)
+    try:
+        k = min(int(request.GET.get("k", 20)), settings.SEARCH_MAX_K)
+        threshold = float(request.GET.get("threshold", 0.4))
+    except ValueError:
+        return JsonResponse({"error": "k and threshold must be numbers"}, status=400)
+    if k < 1:
+        return JsonResponse({"error": "k must be at least 1"}, status=400)
+
+    batcher = get_batcher(
+        max_batch_size=settings.SEARCH_BATCH_SIZE,
+        max_wait=settings.SEARCH_BATCH_WAIT_MS / 1000,
+    )
+    embedding = await batcher.embed(search_term)
+
+    params = {
+        "embedding": vector_literal(embedding),
+        "chamber_type": request.GET.get("chamber_type"),
+        "transcript_type": request.GET.get("transcript_type"),
+        "k": k,
+        "threshold": threshold,
+    }
+    # the k nearest on each shard, so the k nearest overall are among them
+    shard_rows = await asyncio.gather(
+        *[search_alias(alias, params) for alias in shard_aliases()]
+    )
+    rows = sorted(
+        (row for rows in shard_rows for row in rows), key=lambda x: x["distance"]
+    )[:k]
+
+    return JsonResponse({"query": search_term, "results": rows})